@@ -1 +1,4 @@
+__version__ = '0.1'
+
 from .translator import Translator
+from .batch import translate_many, translate_many_async
@@ -0,0 +1,92 @@
+import asyncio
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from .project import TranslationResult, error_message, _make_out_dir
+from .translator import Translator
+
+
+def translate_source(translator, name, source):
+    """
+    Translates source in this process or in a worker, failures are
+    returned as results like by project.translate_file
+    """
+    try:
+        return TranslationResult(name, None, code=translator.translate(source))
+    except Exception as e:
+        return TranslationResult(name, None, error_message(e))
+
+
+def _batch_translator(translator):
+    translator = translator or Translator()
+    if translator._out:
+        raise ValueError("translator of a batch must not have out_file")
+    return translator
+
+
+def _results(sources, translator, executor):
+    if executor is None:
+        for name, source in sources:
+            yield translate_source(translator, name, source)
+        return
+    futures = [executor.submit(translate_source, translator, name, source) for name, source in sources]
+    for future in as_completed(futures):
+        yield future.result()
+
+
+def translate_many(sources, translator=None, executor=None):
+    """
+    Translates (name, source) pairs with one translator, Translator() by
+    default, returns an iterator of TranslationResult holding the code.
+
+    Without executor sources are translated one by one in this thread.
+    Otherwise they are submitted to the concurrent.futures executor at
+    once and results come in the order translations finish. A thread pool
+    shares the translator, a process pool gets copies of it
+    """
+    return _results(sources, _batch_translator(translator), executor)
+
+
+def _read_file(path):
+    with open(path) as f:
+        return f.read()
+
+
+def _write_file(path, code):
+    _make_out_dir(path)
+    with open(path, 'w') as f:
+        f.write(code)
+
+
+async def translate_many_async(files, translator=None, executor=None):
+    """
+    Async variant of translate_many for (src_file, out_file) pairs, yields
+    TranslationResult of every file once it is written.
+
+    Files are read and written in the default executor of the running
+    loop, so reading of some files overlaps translation of others. Code
+    is translated in executor, a ProcessPoolExecutor made for the batch
+    by default
+    """
+    translator = _batch_translator(translator)
+    loop = asyncio.get_running_loop()
+    pool = executor or ProcessPoolExecutor()
+
+    async def translate(src_file, out_file):
+        try:
+            source = await loop.run_in_executor(None, _read_file, src_file)
+        except OSError as e:
+            return TranslationResult(src_file, out_file, error_message(e))
+        result = await loop.run_in_executor(pool, translate_source, translator, src_file, source)
+        if result.ok:
+            try:
+                await loop.run_in_executor(None, _write_file, out_file, result.code)
+            except OSError as e:
+                return TranslationResult(src_file, out_file, error_message(e))
+        return TranslationResult(src_file, out_file, result.error)
+
+    try:
+        for task in asyncio.as_completed([translate(src_file, out_file) for src_file, out_file in files]):
+            yield await task
+    finally:
+        if executor is None:
+            pool.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,106 @@
+import io
+import os
+import ast
+
+from .minifier import MINIFY_MODES, minify
+from .project import SOURCE_EXT
+from .runtime import RUNTIME_MODULE, runtime_module
+from .translator import Translator
+
+
+def module_file(name, root):
+    """
+    Returns path of the python file of module `name` under root or None,
+    packages are found by their __init__ module
+    """
+    base = os.path.join(root, *name.split('.'))
+    for path in (base + SOURCE_EXT, os.path.join(base, '__init__' + SOURCE_EXT)):
+        if os.path.isfile(path):
+            return path
+    return None
+
+
+def required_modules(tree, root=None):
+    """
+    Returns names of modules which translation of the tree requires,
+    relative imports are not followed. Names imported from a package
+    are its submodules when root has their files, like python finds them
+    """
+    names = []
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            names.extend(alias.name for alias in node.names)
+        elif isinstance(node, ast.ImportFrom) and node.module and not node.level:
+            names.append(node.module)
+            if root is not None:
+                for alias in node.names:
+                    name = node.module + '.' + alias.name
+                    if module_file(name, root) is not None:
+                        names.append(name)
+    return names
+
+
+def _preload(name, code):
+    return 'package.preload["{}"] = function(...)\n{}end\n\n'.format(name, code)
+
+
+def bundle(entry, stream, root=None, options=None):
+    """
+    Translates the entry file and modules reachable from it by imports
+    into a single lua chunk written to an open text stream. Modules are
+    found under root (the directory of the entry by default) and are
+    registered in package.preload, imports of other modules are left to
+    require. The chunk runs the entry module and returns its table.
+
+    Modules share one copy of the runtime. With the minify option the
+    whole chunk is minified at once. Returns names of bundled modules, the
+    entry first
+    """
+    if root is None:
+        root = os.path.dirname(os.path.abspath(entry))
+    options = dict(options or {}, runtime='shared')
+    mode = options.pop('minify', None)
+    if mode is not None:
+        if mode not in MINIFY_MODES:
+            raise ValueError("minify must be one of: {}".format(', '.join(MINIFY_MODES)))
+        out = io.StringIO()
+        names = bundle(entry, out, root, options)
+        stream.write(minify(out.getvalue(), names=mode == 'names'))
+        return names
+    translator = Translator(**options)
+    entry_name = os.path.splitext(os.path.basename(entry))[0]
+    queue = [(entry_name, entry)]
+    seen = {entry_name}
+    codes = []
+    for name, path in queue:
+        with open(path) as f:
+            tree = translator._parse(f.read())
+        deps = required_modules(tree, root)
+        for dep in deps:
+            if dep not in seen:
+                seen.add(dep)
+                dep_path = module_file(dep, root)
+                if dep_path is not None:
+                    queue.append((dep, dep_path))
+        code = io.StringIO()
+        # from-imports of submodules require them by their full names
+        translator._write_tree(tree, code, frozenset(dep for dep in deps if '.' in dep))
+        codes.append((name, code.getvalue()))
+    stream.write('-- {} bundled by py3lua\n'.format(entry_name))
+    if any('require("{}")'.format(RUNTIME_MODULE) in code for _, code in codes):
+        stream.write(_preload(RUNTIME_MODULE, runtime_module()))
+    for name, code in codes:
+        stream.write(_preload(name, code))
+    stream.write('return require("{}")\n'.format(entry_name))
+    return [name for name, _ in codes]
+
+
+def bundle_file(entry, out_file, root=None, options=None):
+    """
+    Bundles the entry file into out_file, returns names of bundled modules
+    """
+    out_dir = os.path.dirname(out_file)
+    if out_dir:
+        os.makedirs(out_dir, exist_ok=True)
+    with open(out_file, 'w') as out:
+        return bundle(entry, out, root, options)
@@ -0,0 +1,171 @@
+import os
+import shutil
+import hashlib
+import tempfile
+
+from . import __version__
+
+
+DEFAULT_MAX_SIZE = 64 * 1024 * 1024
+ENTRY_EXT = '.lua'
+# entries written by other processes are noticed by scanning the cache
+# directory after this many stores
+EVICT_INTERVAL = 64
+
+_fingerprint = None
+
+
+def default_cache_dir():
+    base = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(base, 'py3lua')
+
+
+def code_fingerprint():
+    """
+    Returns hash of the package sources, so entries made by changed
+    translator or runtime code are not used. It's computed once per process
+    """
+    global _fingerprint
+    if _fingerprint is None:
+        package_dir = os.path.dirname(os.path.abspath(__file__))
+        paths = []
+        for root, dirs, files in os.walk(package_dir):
+            dirs[:] = [d for d in dirs if d != '__pycache__']
+            paths.extend(os.path.join(root, name) for name in files if name.endswith('.py'))
+        h = hashlib.sha256()
+        for path in sorted(paths):
+            h.update(os.path.relpath(path, package_dir).encode())
+            h.update(b'\0')
+            with open(path, 'rb') as f:
+                h.update(f.read())
+            h.update(b'\0')
+        _fingerprint = h.hexdigest()
+    return _fingerprint
+
+
+class TranslationCache:
+    """
+    On-disk cache of translated code.
+
+    Entries are keyed by hash of the source, translator version and code
+    and translation options. Least recently used entries are evicted when
+    total size of the cache exceeds max_size bytes
+    """
+    def __init__(self, cache_dir=None, max_size=DEFAULT_MAX_SIZE):
+        self.cache_dir = cache_dir or default_cache_dir()
+        self.max_size = max_size
+        # size of entries as of the last scan plus stored since then
+        self._size = None
+        self._stores = 0
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    def key(self, source, options=None):
+        h = hashlib.sha256()
+        h.update(__version__.encode())
+        h.update(b'\0')
+        h.update(code_fingerprint().encode())
+        h.update(b'\0')
+        h.update(repr(sorted((options or {}).items())).encode())
+        h.update(b'\0')
+        h.update(source.encode() if isinstance(source, str) else source)
+        return h.hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key + ENTRY_EXT)
+
+    def lookup(self, key):
+        """
+        Returns path of the cached entry or None, marks entry as recently used
+        """
+        path = self._path(key)
+        try:
+            os.utime(path)
+        except OSError:
+            return None
+        return path
+
+    def get(self, key):
+        path = self.lookup(key)
+        if path is None:
+            return None
+        try:
+            with open(path) as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def copy_to(self, key, out_file):
+        """
+        Copies cached entry to out_file, returns False on cache miss
+        """
+        path = self.lookup(key)
+        if path is None:
+            return False
+        try:
+            shutil.copyfile(path, out_file)
+        except FileNotFoundError:
+            return False
+        return True
+
+    def _store(self, key, write):
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w') as f:
+                write(f)
+            size = os.path.getsize(tmp_path)
+            os.replace(tmp_path, self._path(key))
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+        self._stores += 1
+        if self._size is None or self._stores >= EVICT_INTERVAL:
+            self.evict()
+        else:
+            self._size += size
+            if self._size > self.max_size:
+                self.evict()
+
+    def put(self, key, code):
+        self._store(key, lambda f: f.write(code))
+
+    def put_file(self, key, src_file):
+        def write(f):
+            with open(src_file) as src:
+                shutil.copyfileobj(src, f)
+        self._store(key, write)
+
+    def evict(self):
+        """
+        Removes least recently used entries until the cache fits max_size
+        """
+        entries = []
+        total = 0
+        with os.scandir(self.cache_dir) as it:
+            for entry in it:
+                if not entry.name.endswith(ENTRY_EXT):
+                    continue
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+                total += stat.st_size
+        self._stores = 0
+        if total > self.max_size:
+            entries.sort()
+            for _, size, path in entries:
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                total -= size
+                if total <= self.max_size:
+                    break
+        self._size = total
+
+    def clear(self):
+        with os.scandir(self.cache_dir) as it:
+            for entry in it:
+                if entry.name.endswith(ENTRY_EXT):
+                    os.remove(entry.path)
+        self._size = 0
@@ -0,0 +1,176 @@
+import ast
+
+from .symbols import FUNCTION_NODES
+
+
+# python special methods which are lua metamethods of instances
+METAMETHODS = {
+    '__str__': '__tostring',
+    '__eq__': '__eq',
+    '__lt__': '__lt',
+    '__le__': '__le',
+    '__len__': '__len',
+    '__call__': '__call',
+    '__add__': '__add',
+    '__sub__': '__sub',
+    '__mul__': '__mul',
+    '__truediv__': '__div',
+    '__mod__': '__mod',
+    '__neg__': '__unm',
+}
+
+
+def decorator_names(tree):
+    return {dec.id for dec in tree.decorator_list if isinstance(dec, ast.Name)}
+
+
+def slot_names(tree):
+    """
+    Returns names listed by `__slots__` of a class body or None when the
+    class doesn't declare them as a literal
+    """
+    for stmt in tree.body:
+        if isinstance(stmt, ast.Assign) and any(
+                isinstance(t, ast.Name) and t.id == '__slots__' for t in stmt.targets):
+            value = stmt.value
+            if isinstance(value, ast.Constant) and isinstance(value.value, str):
+                return (value.value,)
+            if not isinstance(value, (ast.Tuple, ast.List)):
+                return None
+            names = []
+            for elt in value.elts:
+                if not isinstance(elt, ast.Constant) or not isinstance(elt.value, str):
+                    return None
+                names.append(elt.value)
+            return tuple(names)
+    return None
+
+
+class ClassLayout:
+    """
+    What translation knows about a class.
+
+    `slots` lists attributes stored in the array part of instances, those
+    of the base class first, `index` maps them to their lua indexes. `open`
+    tells that instances also take other attributes, which is the case for
+    classes not declaring slots, for their subclasses and for subclasses of
+    classes defined elsewhere, whose layout is unknown. `expr` and
+    `base_expr` are lua expressions of the class and its base, they are
+    set when the class definition is translated
+    """
+    __slots__ = ('name', 'base', 'slots', 'index', 'open', 'classmethods', 'staticmethods', 'expr', 'base_expr')
+
+    def __init__(self, tree, base=None, foreign=False):
+        self.name = tree.name
+        self.base = base
+        own = None if foreign else slot_names(tree)
+        inherited = base.slots if base is not None else ()
+        if own is None:
+            self.slots = inherited
+            self.open = True
+        else:
+            self.slots = inherited + tuple(name for name in own if name not in inherited)
+            self.open = base is not None and base.open
+        self.index = {name: i for i, name in enumerate(self.slots, 1)}
+        self.classmethods = set()
+        self.staticmethods = set()
+        for stmt in tree.body:
+            if isinstance(stmt, FUNCTION_NODES):
+                decorators = decorator_names(stmt)
+                if 'classmethod' in decorators:
+                    self.classmethods.add(stmt.name)
+                elif 'staticmethod' in decorators:
+                    self.staticmethods.add(stmt.name)
+        if base is not None:
+            self.classmethods |= base.classmethods - self.staticmethods
+            self.staticmethods |= base.staticmethods - self.classmethods
+        self.expr = tree.name
+        self.base_expr = None
+
+
+def class_layouts(tree):
+    """
+    Maps names of classes defined in the tree to their layouts. Names
+    which are bound more than once, also by other statements, are left out
+    as it isn't known which class they refer to
+    """
+    counts = {}
+    classes = {}
+    for node in ast.walk(tree):
+        if isinstance(node, ast.ClassDef):
+            classes[node.name] = node
+            name = node.name
+        elif isinstance(node, ast.Name) and not isinstance(node.ctx, ast.Load):
+            name = node.id
+        elif isinstance(node, FUNCTION_NODES):
+            name = node.name
+        elif isinstance(node, ast.alias):
+            name = (node.asname or node.name).split('.')[0]
+        elif isinstance(node, ast.arg):
+            name = node.arg
+        else:
+            continue
+        counts[name] = counts.get(name, 0) + 1
+    layouts = {}
+
+    def layout(name):
+        if name not in layouts:
+            node = classes[name]
+            # a cyclic base is found as None and taken for a foreign class
+            layouts[name] = None
+            bases = [b for b in node.bases if not (isinstance(b, ast.Name) and b.id == 'object')]
+            base = None
+            if len(bases) == 1 and isinstance(bases[0], ast.Name) and counts.get(bases[0].id) == 1 and \
+                    bases[0].id in classes:
+                base = layout(bases[0].id)
+            foreign = bool(bases) and base is None
+            layouts[name] = ClassLayout(node, base, foreign)
+        return layouts[name]
+
+    for name in classes:
+        if counts[name] == 1:
+            layout(name)
+    return layouts
+
+
+def instance_names(tree, layouts, self_layout=None):
+    """
+    Maps names of a function or module scope which surely hold instances
+    of classes with slots to their layouts: the first parameter of
+    a method (self_layout is the class of the method) and names bound only
+    once, to a call of the class
+    """
+    assigned = {}
+    constructed = []
+    params = set()
+    if isinstance(tree, FUNCTION_NODES):
+        args = tree.args
+        params = {a.arg for a in args.posonlyargs + args.args + args.kwonlyargs}
+        params.update(a.arg for a in (args.vararg, args.kwarg) if a is not None)
+    stack = list(tree.body)
+    while stack:
+        node = stack.pop()
+        if isinstance(node, (ast.Lambda, ast.ClassDef) + FUNCTION_NODES):
+            if not isinstance(node, ast.Lambda):
+                assigned[node.name] = assigned.get(node.name, 0) + 1
+            continue
+        if isinstance(node, ast.Assign) and len(node.targets) == 1 and isinstance(node.targets[0], ast.Name):
+            value = node.value
+            if isinstance(value, ast.Call) and isinstance(value.func, ast.Name) and value.func.id in layouts:
+                constructed.append((node.targets[0].id, layouts[value.func.id]))
+        if isinstance(node, ast.Name) and not isinstance(node.ctx, ast.Load) or isinstance(node, ast.arg):
+            name = node.id if isinstance(node, ast.Name) else node.arg
+            assigned[name] = assigned.get(name, 0) + 1
+        elif isinstance(node, (ast.Global, ast.Nonlocal)):
+            for name in node.names:
+                assigned[name] = 2
+        stack.extend(ast.iter_child_nodes(node))
+    names = {}
+    if self_layout is not None and self_layout.slots and tree.args.args:
+        first = tree.args.args[0].arg
+        if first not in assigned:
+            names[first] = self_layout
+    for name, layout in constructed:
+        if layout.slots and assigned[name] == 1 and name not in params:
+            names[name] = layout
+    return names
@@ -0,0 +1,39 @@
+CHUNK_SIZE = 64 * 1024
+
+
+class Emitter:
+    """
+    Output buffer for translated code.
+
+    Fragments are collected in a list and joined once, so building the
+    output is linear in its size. When a stream is given, collected
+    fragments are written to it as soon as they exceed ``chunk_size``
+    """
+    __slots__ = ('_stream', '_chunks', '_size', 'chunk_size')
+
+    def __init__(self, stream=None, chunk_size=CHUNK_SIZE):
+        self._stream = stream
+        self._chunks = []
+        self._size = 0
+        self.chunk_size = chunk_size
+
+    def write(self, fragment):
+        self._chunks.append(fragment)
+        self._size += len(fragment)
+        if self._stream is not None and self._size >= self.chunk_size:
+            self.flush()
+
+    def write_line(self, line=''):
+        self.write(line + '\n')
+
+    def flush(self):
+        if self._stream is None or not self._chunks:
+            return
+        self._stream.write(''.join(self._chunks))
+        self._chunks = []
+        self._size = 0
+
+    def getvalue(self):
+        if self._stream is not None:
+            raise ValueError("Emitter writes to a stream, no value to return")
+        return ''.join(self._chunks)
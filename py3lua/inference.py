@@ -0,0 +1,434 @@
+import ast
+
+
+NUMBER = 'number'
+STRING = 'string'
+FUNCTION = 'function'
+UNKNOWN = 'unknown'
+
+ANNOTATION_TYPES = {
+    'int': NUMBER,
+    'float': NUMBER,
+    'str': STRING,
+}
+BUILTIN_RESULTS = {
+    'len': NUMBER,
+    'int': NUMBER,
+    'float': NUMBER,
+    'str': STRING,
+}
+NUMERIC_OPS = (ast.Add, ast.Sub, ast.Mult, ast.Div, ast.FloorDiv, ast.Mod, ast.Pow)
+LEAF_NODES = (ast.expr_context, ast.operator, ast.unaryop, ast.cmpop, ast.boolop, ast.Constant)
+
+
+def join(a, b):
+    """
+    Joins two types, None means no information yet
+    """
+    if a is None:
+        return b
+    if b is None or a == b:
+        return a
+    return UNKNOWN
+
+
+def annotation_type(tree):
+    if isinstance(tree, ast.Name):
+        name = tree.id
+    elif isinstance(tree, ast.Constant) and isinstance(tree.value, str):
+        name = tree.value
+    else:
+        return UNKNOWN
+    return ANNOTATION_TYPES.get(name, UNKNOWN)
+
+
+class Scope:
+    __slots__ = (
+        'parent', 'is_class', 'is_comprehension', 'sources', 'types', 'returns', 'globals', 'star_import'
+    )
+
+    def __init__(self, parent=None, is_class=False, is_comprehension=False):
+        self.parent = parent
+        self.is_class = is_class
+        self.is_comprehension = is_comprehension
+        self.sources = {}
+        self.types = {}
+        self.returns = {}
+        self.globals = set()
+        self.star_import = False
+
+
+class _ForTarget:
+    __slots__ = ('iter',)
+
+    def __init__(self, iter_):
+        self.iter = iter_
+
+
+class TypeInference(ast.NodeVisitor):
+    """
+    Flow-insensitive type inference.
+
+    Every variable gets the join of types of all values assigned to it in
+    its scope, types come from literals, arithmetic, annotations of
+    function arguments and returns and a few builtins. Only numbers and
+    strings are tracked, this is enough to translate `+` to native lua
+    operators
+    """
+    def __init__(self, tree):
+        self.module = None
+        self.scope = None
+        self._scopes = []
+        self._dispatch = {}
+        self.nonlocals = set()
+        self.sites = []
+        self.types = {}
+        self.visit(tree)
+        self._solve()
+        types = self.types
+        # inner additions come after outer ones, so they are typed first
+        # and reused when typing the outer ones
+        for tree, scope in reversed(self.sites):
+            left = types.get(tree.left) or self._expr_type(tree.left, scope) or UNKNOWN
+            right = types.get(tree.right) or self._expr_type(tree.right, scope) or UNKNOWN
+            types[tree.left] = left
+            types[tree.right] = right
+            types[tree] = self._binop_type(tree.op, left, right)
+        self.sites = [tree for tree, _ in self.sites]
+
+    def visit(self, tree):
+        node_class = tree.__class__
+        try:
+            visitor = self._dispatch[node_class]
+        except KeyError:
+            if issubclass(node_class, LEAF_NODES):
+                visitor = None
+            else:
+                visitor = getattr(self.__class__, 'visit_' + node_class.__name__, self.__class__.generic_visit)
+            self._dispatch[node_class] = visitor
+        if visitor is not None:
+            visitor(self, tree)
+
+    def generic_visit(self, tree):
+        for field in tree._fields:
+            value = getattr(tree, field, None)
+            if isinstance(value, list):
+                for item in value:
+                    if isinstance(item, ast.AST):
+                        self.visit(item)
+            elif isinstance(value, ast.AST):
+                self.visit(value)
+
+    def _bind(self, name, source):
+        if isinstance(source, ast.Constant):
+            source = self._expr_type(source, None)
+        scope = self.scope
+        if name in scope.globals:
+            scope = self.module
+        scope.sources.setdefault(name, []).append(source)
+
+    def _bind_target(self, target, source):
+        if isinstance(target, ast.Name):
+            self._bind(target.id, source)
+        elif isinstance(target, (ast.Tuple, ast.List)):
+            for elt in target.elts:
+                self._bind_target(elt, UNKNOWN)
+        elif isinstance(target, ast.Starred):
+            self._bind_target(target.value, UNKNOWN)
+        else:
+            self.visit(target)
+
+    def _push(self, is_class=False, is_comprehension=False):
+        self.scope = Scope(self.scope, is_class, is_comprehension)
+        self._scopes.append(self.scope)
+
+    def _pop(self):
+        self.scope = self.scope.parent
+
+    def visit_Module(self, tree):
+        self._push()
+        self.module = self.scope
+        self.generic_visit(tree)
+
+    def visit_FunctionDef(self, tree):
+        for dec in tree.decorator_list:
+            self.visit(dec)
+        self.visit(tree.args)
+        if tree.returns is not None:
+            self.visit(tree.returns)
+        self._bind(tree.name, FUNCTION)
+        returns = self.scope.returns
+        returns[tree.name] = join(returns.get(tree.name), annotation_type(tree.returns))
+        self._push()
+        args = tree.args
+        for a in getattr(args, 'posonlyargs', []) + args.args + args.kwonlyargs:
+            self._bind(a.arg, annotation_type(a.annotation))
+        for a in (args.vararg, args.kwarg):
+            if a is not None:
+                self._bind(a.arg, UNKNOWN)
+        for stmt in tree.body:
+            self.visit(stmt)
+        self._pop()
+    visit_AsyncFunctionDef = visit_FunctionDef
+
+    def visit_Lambda(self, tree):
+        self.visit(tree.args)
+        self._push()
+        args = tree.args
+        for a in getattr(args, 'posonlyargs', []) + args.args + args.kwonlyargs + [args.vararg, args.kwarg]:
+            if a is not None:
+                self._bind(a.arg, UNKNOWN)
+        self.visit(tree.body)
+        self._pop()
+
+    def visit_arg(self, tree):
+        if tree.annotation is not None:
+            self.visit(tree.annotation)
+
+    def visit_ClassDef(self, tree):
+        for node in tree.decorator_list + tree.bases + tree.keywords:
+            self.visit(node)
+        self._bind(tree.name, UNKNOWN)
+        self._push(is_class=True)
+        for stmt in tree.body:
+            self.visit(stmt)
+        self._pop()
+
+    def _visit_comprehension(self, tree, elts):
+        self.visit(tree.generators[0].iter)
+        self._push(is_comprehension=True)
+        for i, gen in enumerate(tree.generators):
+            if i:
+                self.visit(gen.iter)
+            self._bind_target(gen.target, UNKNOWN)
+            for cond in gen.ifs:
+                self.visit(cond)
+        for elt in elts:
+            self.visit(elt)
+        self._pop()
+
+    def visit_ListComp(self, tree):
+        self._visit_comprehension(tree, [tree.elt])
+    visit_SetComp = visit_GeneratorExp = visit_ListComp
+
+    def visit_DictComp(self, tree):
+        self._visit_comprehension(tree, [tree.key, tree.value])
+
+    def visit_Global(self, tree):
+        self.scope.globals.update(tree.names)
+
+    def visit_Nonlocal(self, tree):
+        self.nonlocals.update(tree.names)
+
+    def visit_Assign(self, tree):
+        self.visit(tree.value)
+        for target in tree.targets:
+            self._bind_target(target, tree.value)
+
+    def visit_AnnAssign(self, tree):
+        if tree.value is not None:
+            self.visit(tree.value)
+        self.visit(tree.annotation)
+        declared = annotation_type(tree.annotation)
+        if declared == UNKNOWN and tree.value is not None:
+            declared = tree.value
+        self._bind_target(tree.target, declared)
+
+    def visit_AugAssign(self, tree):
+        self.visit(tree.value)
+        self._bind_target(tree.target, tree)
+
+    def visit_NamedExpr(self, tree):
+        self.visit(tree.value)
+        scope = self.scope
+        while self.scope.is_comprehension:
+            self.scope = self.scope.parent
+        self._bind_target(tree.target, tree.value)
+        self.scope = scope
+
+    def visit_For(self, tree):
+        self.visit(tree.iter)
+        self._bind_target(tree.target, _ForTarget(tree.iter))
+        for stmt in tree.body + tree.orelse:
+            self.visit(stmt)
+
+    def visit_AsyncFor(self, tree):
+        self.visit(tree.iter)
+        self._bind_target(tree.target, UNKNOWN)
+        for stmt in tree.body + tree.orelse:
+            self.visit(stmt)
+
+    def visit_withitem(self, tree):
+        self.visit(tree.context_expr)
+        if tree.optional_vars is not None:
+            self._bind_target(tree.optional_vars, UNKNOWN)
+
+    def visit_ExceptHandler(self, tree):
+        if tree.type is not None:
+            self.visit(tree.type)
+        if tree.name:
+            self._bind(tree.name, UNKNOWN)
+        for stmt in tree.body:
+            self.visit(stmt)
+
+    def visit_Import(self, tree):
+        for alias in tree.names:
+            if alias.name == '*':
+                self.scope.star_import = True
+            else:
+                self._bind((alias.asname or alias.name).split('.')[0], UNKNOWN)
+    visit_ImportFrom = visit_Import
+
+    def visit_MatchAs(self, tree):
+        if tree.pattern is not None:
+            self.visit(tree.pattern)
+        if tree.name:
+            self._bind(tree.name, UNKNOWN)
+
+    def visit_MatchStar(self, tree):
+        if tree.name:
+            self._bind(tree.name, UNKNOWN)
+
+    def visit_MatchMapping(self, tree):
+        self.generic_visit(tree)
+        if tree.rest:
+            self._bind(tree.rest, UNKNOWN)
+
+    def visit_Name(self, tree):
+        if not isinstance(tree.ctx, ast.Load):
+            self._bind(tree.id, UNKNOWN)
+
+    def visit_BinOp(self, tree):
+        if isinstance(tree.op, ast.Add):
+            self.sites.append((tree, self.scope))
+        self.generic_visit(tree)
+
+    def _resolve(self, name, scope):
+        """
+        Returns scope which binds the name or None for builtins and
+        undefined names
+        """
+        if name in scope.globals:
+            scope = self.module
+        cur = scope
+        while cur is not None:
+            if (cur is scope or not cur.is_class) and name in cur.sources:
+                return cur
+            cur = cur.parent
+        return None
+
+    def _is_builtin(self, name, scope):
+        return self._resolve(name, scope) is None and not self.module.star_import
+
+    def _name_type(self, name, scope):
+        defined = self._resolve(name, scope)
+        if defined is None:
+            return UNKNOWN
+        return defined.types.get(name)
+
+    def _binop_type(self, op, left, right):
+        if left is None or right is None:
+            return None
+        if left == right == NUMBER and isinstance(op, NUMERIC_OPS):
+            return NUMBER
+        if isinstance(op, ast.Add) and left == right == STRING:
+            return STRING
+        if isinstance(op, ast.Mult) and {left, right} == {NUMBER, STRING}:
+            return STRING
+        if isinstance(op, ast.Mod) and left == STRING:
+            return STRING
+        return UNKNOWN
+
+    def _expr_type(self, tree, scope):
+        if isinstance(tree, ast.Constant):
+            if isinstance(tree.value, bool):
+                return UNKNOWN
+            if isinstance(tree.value, (int, float)):
+                return NUMBER
+            if isinstance(tree.value, str):
+                return STRING
+            return UNKNOWN
+        elif isinstance(tree, ast.Name):
+            return self._name_type(tree.id, scope)
+        elif isinstance(tree, ast.BinOp):
+            return self._binop_type(
+                tree.op, self._expr_type(tree.left, scope), self._expr_type(tree.right, scope)
+            )
+        elif isinstance(tree, ast.UnaryOp):
+            if isinstance(tree.op, (ast.USub, ast.UAdd)):
+                operand = self._expr_type(tree.operand, scope)
+                return operand if operand in (None, NUMBER) else UNKNOWN
+            return UNKNOWN
+        elif isinstance(tree, ast.Call) and isinstance(tree.func, ast.Name):
+            name = tree.func.id
+            if self._is_builtin(name, scope):
+                return BUILTIN_RESULTS.get(name, UNKNOWN)
+            defined = self._resolve(name, scope)
+            if defined is not None and defined.types.get(name) == FUNCTION:
+                return defined.returns.get(name, UNKNOWN)
+            return UNKNOWN
+        return UNKNOWN
+
+    def _source_type(self, source, scope):
+        if isinstance(source, str):
+            return source
+        elif isinstance(source, _ForTarget):
+            it = source.iter
+            if isinstance(it, ast.Call) and isinstance(it.func, ast.Name) and it.func.id == 'range':
+                return NUMBER if self._is_builtin('range', scope) else UNKNOWN
+            return UNKNOWN
+        elif isinstance(source, ast.AugAssign):
+            target = source.target
+            if not isinstance(target, ast.Name):
+                return UNKNOWN
+            return self._binop_type(
+                source.op, self._name_type(target.id, scope), self._expr_type(source.value, scope)
+            )
+        return self._expr_type(source, scope)
+
+    def _solve(self):
+        changed = True
+        while changed:
+            changed = False
+            for scope in self._scopes:
+                types = scope.types
+                for name, sources in scope.sources.items():
+                    if types.get(name) == UNKNOWN:
+                        continue
+                    if name in self.nonlocals:
+                        new_type = UNKNOWN
+                    else:
+                        new_type = None
+                        for source in sources:
+                            new_type = join(new_type, self._source_type(source, scope))
+                            if new_type == UNKNOWN:
+                                break
+                    if new_type != types.get(name):
+                        scope.types[name] = new_type
+                        changed = True
+
+    def add_type(self, tree):
+        """
+        Returns NUMBER or STRING when both operands of the addition are
+        known to have this type, None otherwise
+        """
+        left = self.types.get(tree.left)
+        if left in (NUMBER, STRING) and left == self.types.get(tree.right):
+            return left
+        return None
+
+    def report(self):
+        """
+        Returns number of additions specialized by operand types
+        """
+        stats = {'sites': len(self.sites), NUMBER: 0, STRING: 0, 'dynamic': 0}
+        for tree in self.sites:
+            stats[self.add_type(tree) or 'dynamic'] += 1
+        return stats
+
+
+def type_report(source):
+    """
+    Returns specialization report for python source
+    """
+    return TypeInference(ast.parse(source)).report()
@@ -0,0 +1,423 @@
+import re
+import itertools
+
+
+MINIFY_MODES = ('compact', 'names')
+LUA_KEYWORDS = frozenset([
+    'and', 'break', 'do', 'else', 'elseif', 'end', 'false', 'for', 'function', 'goto', 'if', 'in', 'local', 'nil',
+    'not', 'or', 'repeat', 'return', 'then', 'true', 'until', 'while'
+])
+TOKEN = re.compile(r"""
+    (?P<space>\s+)
+  | (?P<comment>--\[(?P<ceq>=*)\[.*?\](?P=ceq)\]|--[^\n]*)
+  | (?P<string>\[(?P<seq>=*)\[.*?\](?P=seq)\]|"(?:\\.|[^"\\\n])*"|'(?:\\.|[^'\\\n])*')
+  | (?P<number>0[xX][0-9a-fA-F.]+(?:[pP][+-]?\d+)?|(?:\d+\.?\d*|\.\d+)(?:[eE][+-]?\d+)?)
+  | (?P<name>[A-Za-z_]\w*)
+  | (?P<op>\.\.\.|\.\.|==|~=|<=|>=|<<|>>|//|::|[-+*/%^\#&~|<>=(){}\[\];:,.])
+""", re.VERBOSE | re.DOTALL)
+BINARY_PRECEDENCE = {
+    'or': 1, 'and': 2,
+    '<': 3, '>': 3, '<=': 3, '>=': 3, '~=': 3, '==': 3,
+    '|': 4, '~': 5, '&': 6, '<<': 7, '>>': 7, '..': 8,
+    '+': 9, '-': 9, '*': 10, '/': 10, '//': 10, '%': 10, '^': 12,
+}
+UNARY_PRECEDENCE = 11
+# precedence of expressions without operators
+ATOM_PRECEDENCE = 13
+RIGHT_ASSOCIATIVE = frozenset(['..', '^'])
+OPENING = {'(': ')', '[': ']', '{': '}'}
+# tokens after which an expression can be continued by a binary operator
+OPERAND_ENDS = frozenset([')', ']', '}', '...', 'nil', 'true', 'false', 'end'])
+# tokens after a parenthesized expression which make it a prefix expression
+PREFIX_FOLLOWERS = frozenset(['(', '{', '[', '.', ':'])
+
+
+class Token:
+    __slots__ = ('kind', 'text')
+
+    def __init__(self, kind, text):
+        self.kind = kind
+        self.text = text
+
+
+def tokenize(code):
+    """
+    Splits lua code into tokens, whitespace and comments are dropped
+    """
+    tokens = []
+    pos = 0
+    while pos < len(code):
+        m = TOKEN.match(code, pos)
+        if m is None:
+            raise ValueError("Unexpected character {!r} at {}".format(code[pos], pos))
+        kind = m.lastgroup
+        if kind in ('ceq', 'seq'):
+            kind = 'comment' if m.group('comment') else 'string'
+        if kind not in ('space', 'comment'):
+            if kind == 'name' and m.group() in LUA_KEYWORDS:
+                kind = 'keyword'
+            tokens.append(Token(kind, m.group()))
+        pos = m.end()
+    return tokens
+
+
+def _is_operand_end(token):
+    return token is not None and (token.kind in ('name', 'number', 'string') or token.text in OPERAND_ENDS)
+
+
+def _is_unary(token, prev):
+    if token.text in ('not', '#'):
+        return True
+    return token.text in ('-', '~') and token.kind == 'op' and not _is_operand_end(prev)
+
+
+def _brackets(tokens):
+    """
+    Maps indexes of opening brackets to indexes of closing ones and
+    `function` keywords to indexes of their `end`
+    """
+    match = {}
+    stack = []
+    blocks = []
+    for i, token in enumerate(tokens):
+        text = token.text
+        if token.kind == 'op':
+            if text in OPENING:
+                stack.append(i)
+            elif text in (')', ']', '}'):
+                match[stack.pop()] = i
+        elif token.kind == 'keyword':
+            if text in ('function', 'if', 'do', 'repeat'):
+                blocks.append(i)
+            elif text in ('end', 'until'):
+                start = blocks.pop()
+                if tokens[start].text == 'function':
+                    match[start] = i
+    return match
+
+
+def _glue(prev, token):
+    """
+    Checks that two tokens need a space between them
+    """
+    a, b = prev.text, token.text
+    if prev.kind in ('name', 'keyword', 'number') and token.kind in ('name', 'keyword', 'number'):
+        return True
+    if prev.kind == 'number' and (b[0] == '.' or b[0].isalnum()):
+        return True
+    return (a[-1] == '-' and b[0] == '-' or a[-1] == '[' and b[0] in '[=' or
+            a[-1] == '.' and (b[0] == '.' or b[0].isdigit()))
+
+
+def join(tokens):
+    parts = []
+    prev = None
+    for token in tokens:
+        if prev is not None and _glue(prev, token):
+            parts.append(' ')
+        parts.append(token.text)
+        prev = token
+    return ''.join(parts)
+
+
+class _Parens:
+    """
+    Removes parentheses which don't change how an expression is parsed
+    """
+    def __init__(self, tokens):
+        self.tokens = tokens
+        self.match = _brackets(tokens)
+        self.removed = set()
+
+    def _prev(self, i):
+        """
+        Returns index of the token before i which is kept or -1
+        """
+        i -= 1
+        while i >= 0 and i in self.removed:
+            i -= 1
+        return i
+
+    def _next(self, i):
+        i += 1
+        while i < len(self.tokens) and i in self.removed:
+            i += 1
+        return self.tokens[i] if i < len(self.tokens) else None
+
+    def _token(self, i):
+        return self.tokens[i] if i >= 0 else None
+
+    def _inner(self, start, end):
+        """
+        Returns (precedence, first token, last token) of the expression
+        between start and end, None when it can't be analysed
+        """
+        precedence = ATOM_PRECEDENCE
+        first = last = None
+        i = start + 1
+        while i < end:
+            if i in self.removed:
+                i += 1
+                continue
+            token = self.tokens[i]
+            if token.kind == 'keyword' and token.text == 'function':
+                return None
+            if first is None:
+                first = token
+            if token.kind in ('op', 'keyword'):
+                if _is_unary(token, last):
+                    precedence = min(precedence, UNARY_PRECEDENCE)
+                elif token.text in BINARY_PRECEDENCE:
+                    precedence = min(precedence, BINARY_PRECEDENCE[token.text])
+                elif token.text in OPENING:
+                    i = self.match[i]
+                    token = self.tokens[i]
+                elif token.text not in ('.', ':', '...', 'nil', 'true', 'false'):
+                    return None
+            last = token
+            i += 1
+        if first is None:
+            return None
+        return precedence, first, last
+
+    def removable(self, start, end):
+        p = self._prev(start)
+        prev = self._token(p)
+        if _is_operand_end(prev):
+            # arguments of a call
+            return False
+        inner = self._inner(start, end)
+        if inner is None:
+            return False
+        precedence, first, last = inner
+        following = self._next(end)
+        if following is not None and (following.text in PREFIX_FOLLOWERS or following.kind == 'string'):
+            # only names and calls can be prefixes of calls and indexing
+            return precedence == ATOM_PRECEDENCE and first.kind == 'name'
+        left = right = 0
+        if prev is not None:
+            if _is_unary(prev, self._token(self._prev(p))):
+                left = UNARY_PRECEDENCE
+            else:
+                left = BINARY_PRECEDENCE.get(prev.text, 0)
+        if following is not None:
+            right = BINARY_PRECEDENCE.get(following.text, 0)
+        if precedence == ATOM_PRECEDENCE:
+            # parentheses truncate results of a call or ... to one value
+            return last.text not in (')', '...') or bool(left or right)
+        if precedence > left and precedence > right:
+            return True
+        if precedence == right and precedence > left:
+            return following.text not in RIGHT_ASSOCIATIVE
+        if precedence == left and precedence > right:
+            return left == UNARY_PRECEDENCE or prev.text in RIGHT_ASSOCIATIVE
+        return False
+
+    def run(self):
+        # inner parentheses first, so that outer ones see what is left
+        pairs = sorted(
+            ((start, end) for start, end in self.match.items() if self.tokens[start].text == '('),
+            key=lambda pair: pair[1] - pair[0]
+        )
+        for start, end in pairs:
+            if self.removable(start, end):
+                self.removed.update((start, end))
+        return [token for i, token in enumerate(self.tokens) if i not in self.removed]
+
+
+def _short_names(reserved):
+    letters = 'abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ'
+    for size in itertools.count(1):
+        for chars in itertools.product(letters, repeat=size):
+            name = ''.join(chars)
+            if name not in reserved:
+                yield name
+
+
+class _Renamer:
+    """
+    Resolves names of lua code to local declarations and gives every
+    declaration a short name. Names which aren't declared as locals are
+    globals and keep their names, so do fields, and so do module exports
+    which are fields of the module table
+    """
+    def __init__(self, tokens):
+        self.tokens = tokens
+        self.match = _brackets(tokens)
+        # lua blocks and brackets which are open at the current token
+        self.nesting = []
+        # each scope maps names to declaration ids
+        self.scopes = [{}]
+        self.declarations = []
+        # declaration ids of tokens
+        self.refs = {}
+        self.globals = set()
+        # locals which are visible after the token at an index
+        self.pending = {}
+        # loop variables by depth of the loop, visible in its body
+        self.loop_vars = {}
+
+    def declare(self, i, fixed=None):
+        decl = len(self.declarations)
+        self.declarations.append(fixed)
+        if i is not None:
+            self.refs[i] = decl
+        return decl
+
+    def activate(self, names):
+        for name, decl in names:
+            self.scopes[-1][name] = decl
+
+    def resolve(self, i):
+        name = self.tokens[i].text
+        for scope in reversed(self.scopes):
+            if name in scope:
+                self.refs[i] = scope[name]
+                return
+        self.globals.add(name)
+
+    def open_block(self, kind):
+        self.nesting.append(kind)
+        self.scopes.append({})
+        names = self.loop_vars.pop(len(self.nesting) - 1, None)
+        if kind == 'do' and names is not None:
+            self.activate(names)
+
+    def close_block(self):
+        self.nesting.pop()
+        self.scopes.pop()
+
+    def names_from(self, i):
+        """
+        Declares names of a list starting at i, returns the index after
+        the list and the declarations
+        """
+        names = []
+        tokens = self.tokens
+        while i < len(tokens) and tokens[i].kind == 'name':
+            names.append((tokens[i].text, self.declare(i)))
+            i += 1
+            if i + 1 >= len(tokens) or tokens[i].text != ',':
+                break
+            i += 1
+        return i, names
+
+    def explist_end(self, i):
+        """
+        Returns index of the token after the expression list starting at i
+        """
+        tokens = self.tokens
+        operand = True
+        while i < len(tokens):
+            token = tokens[i]
+            text = token.text
+            if operand:
+                if _is_unary(token, None):
+                    i += 1
+                    continue
+                if text in ('(', '{', 'function'):
+                    i = self.match[i] + 1
+                elif token.kind in ('name', 'number', 'string') or text in ('nil', 'true', 'false', '...'):
+                    i += 1
+                else:
+                    break
+                operand = False
+            elif text in BINARY_PRECEDENCE or text == ',':
+                operand = True
+                i += 1
+            elif text in ('.', ':'):
+                i += 2
+            elif text in OPENING:
+                i = self.match[i] + 1
+            elif token.kind == 'string':
+                i += 1
+            else:
+                break
+        return i
+
+    def function(self, i, method=False):
+        """
+        Enters the body of a function whose parameter list starts at i,
+        returns index of the token after the parameter list
+        """
+        end = self.match[i]
+        self.open_block('function')
+        names = [('self', self.declare(None, 'self'))] if method else []
+        self.activate(names + self.names_from(i + 1)[1])
+        return end + 1
+
+    def run(self):
+        tokens = self.tokens
+        i = 0
+        while i < len(tokens):
+            for names in self.pending.pop(i, ()):
+                self.activate(names)
+            token = tokens[i]
+            text = token.text
+            if token.kind == 'keyword':
+                if text == 'local':
+                    if tokens[i + 1].text == 'function':
+                        self.activate([(tokens[i + 2].text, self.declare(i + 2))])
+                        i = self.function(i + 3)
+                        continue
+                    i, names = self.names_from(i + 1)
+                    if i < len(tokens) and tokens[i].text == '=':
+                        self.pending.setdefault(self.explist_end(i + 1), []).append(names)
+                        i += 1
+                    else:
+                        self.activate(names)
+                    continue
+                if text == 'function':
+                    i += 1
+                    method = False
+                    if tokens[i].kind == 'name':
+                        self.resolve(i)
+                        i += 1
+                        while tokens[i].text in ('.', ':'):
+                            method = tokens[i].text == ':'
+                            i += 2
+                    i = self.function(i, method)
+                    continue
+                if text == 'for':
+                    i, names = self.names_from(i + 1)
+                    self.loop_vars[len(self.nesting)] = names
+                    continue
+                if text in ('do', 'then', 'repeat'):
+                    self.open_block(text)
+                elif text == 'else':
+                    self.close_block()
+                    self.open_block(text)
+                elif text in ('elseif', 'end', 'until'):
+                    self.close_block()
+            elif token.kind == 'op':
+                if text in OPENING:
+                    self.nesting.append(text)
+                elif text in (')', ']', '}'):
+                    self.nesting.pop()
+            elif token.kind == 'name':
+                prev = tokens[i - 1].text if i else None
+                is_key = (
+                    self.nesting and self.nesting[-1] == '{' and prev in ('{', ',', ';') and
+                    i + 1 < len(tokens) and tokens[i + 1].text == '='
+                )
+                if prev not in ('.', ':') and not is_key:
+                    self.resolve(i)
+            i += 1
+        reserved = LUA_KEYWORDS | self.globals | set(filter(None, self.declarations))
+        short = _short_names(reserved)
+        names = [fixed or next(short) for fixed in self.declarations]
+        for i, decl in self.refs.items():
+            tokens[i] = Token('name', names[decl])
+        return tokens
+
+
+def minify(code, names=False):
+    """
+    Returns lua code without comments and whitespace which isn't needed
+    and without parentheses which don't change precedence. With names
+    locals are renamed to short names
+    """
+    tokens = tokenize(code)
+    if names:
+        tokens = _Renamer(tokens).run()
+    return join(_Parens(tokens).run()) + '\n'
@@ -0,0 +1,535 @@
+import ast
+import copy
+import math
+import operator
+
+
+MAX_INT = 2 ** 53
+MAX_STR = 4096
+MAX_PROPAGATED_STR = 32
+# most expression nodes of an inlined call
+INLINE_BUDGET = 40
+
+BIN_OPS = {
+    ast.Add: operator.add,
+    ast.Sub: operator.sub,
+    ast.Mult: operator.mul,
+    ast.Div: operator.truediv,
+    ast.FloorDiv: operator.floordiv,
+    ast.Mod: operator.mod,
+    ast.Pow: operator.pow,
+}
+UNARY_OPS = {
+    ast.USub: operator.neg,
+    ast.UAdd: operator.pos,
+    ast.Not: operator.not_,
+}
+CMP_OPS = {
+    ast.Eq: operator.eq,
+    ast.NotEq: operator.ne,
+    ast.Lt: operator.lt,
+    ast.LtE: operator.le,
+    ast.Gt: operator.gt,
+    ast.GtE: operator.ge,
+}
+TERMINATORS = (ast.Return, ast.Raise, ast.Break, ast.Continue)
+# nodes of expressions which don't have side effects
+PURE_NODES = (
+    ast.Name, ast.Constant, ast.BinOp, ast.UnaryOp, ast.BoolOp, ast.Compare, ast.IfExp, ast.Attribute,
+    ast.Subscript, ast.Slice, ast.expr_context, ast.operator, ast.unaryop, ast.cmpop, ast.boolop
+)
+PURE_BUILTINS = frozenset(['abs', 'min', 'max', 'len'])
+BODY_FIELDS = ('body', 'orelse', 'finalbody')
+
+
+def is_constant(tree):
+    return isinstance(tree, ast.Constant) and not isinstance(tree.value, bytes)
+
+
+def fits(value):
+    """
+    Checks that a folded value can be represented in lua code exactly
+    """
+    if isinstance(value, bool) or value is None:
+        return True
+    if isinstance(value, int):
+        return -MAX_INT <= value <= MAX_INT
+    if isinstance(value, float):
+        return math.isfinite(value)
+    if isinstance(value, str):
+        return len(value) <= MAX_STR
+    return False
+
+
+def is_pure(tree, pure_calls=frozenset()):
+    """
+    Checks that evaluation of an expression has no side effects, calls
+    are allowed to functions named in pure_calls only
+    """
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Call):
+            if not (isinstance(node.func, ast.Name) and node.func.id in pure_calls) or node.keywords:
+                return False
+        elif not isinstance(node, PURE_NODES):
+            return False
+    return True
+
+
+def expression_size(tree):
+    return sum(1 for node in ast.walk(tree) if isinstance(node, ast.expr))
+
+
+def terminates(stmt):
+    """
+    Checks that statements following stmt in the same block are unreachable
+    """
+    if isinstance(stmt, TERMINATORS):
+        return True
+    if isinstance(stmt, ast.If):
+        return bool(stmt.body and stmt.orelse) and terminates(stmt.body[-1]) and terminates(stmt.orelse[-1])
+    return False
+
+
+class Pass(ast.NodeTransformer):
+    """
+    Base class of optimization passes, counters of what a pass did are
+    kept in stats
+    """
+    name = None
+
+    def __init__(self):
+        self.stats = {}
+
+    def count(self, key, n=1):
+        self.stats[key] = self.stats.get(key, 0) + n
+
+    def run(self, tree):
+        return self.visit(tree)
+
+
+class ConstantFolding(Pass):
+    """
+    Evaluates operations on constants at translation time
+    """
+    name = 'constant-folding'
+
+    def _constant(self, value, tree):
+        if not fits(value):
+            return tree
+        self.count('folded')
+        return ast.copy_location(ast.Constant(value=value), tree)
+
+    def _cheap(self, op, left, right):
+        """
+        Checks that evaluating the operation won't take much time or memory
+        """
+        if isinstance(op, ast.Pow) and isinstance(right, (int, float)):
+            return abs(right) <= 64
+        if isinstance(op, ast.Mult) and (isinstance(left, str) or isinstance(right, str)):
+            count = right if isinstance(left, str) else left
+            return not isinstance(count, int) or count <= MAX_STR
+        return True
+
+    def visit_BinOp(self, tree):
+        self.generic_visit(tree)
+        op = BIN_OPS.get(tree.op.__class__)
+        if op is None or not is_constant(tree.left) or not is_constant(tree.right):
+            return tree
+        if not self._cheap(tree.op, tree.left.value, tree.right.value):
+            return tree
+        try:
+            value = op(tree.left.value, tree.right.value)
+        except Exception:
+            return tree
+        return self._constant(value, tree)
+
+    def visit_UnaryOp(self, tree):
+        self.generic_visit(tree)
+        op = UNARY_OPS.get(tree.op.__class__)
+        if op is None or not is_constant(tree.operand):
+            return tree
+        try:
+            value = op(tree.operand.value)
+        except Exception:
+            return tree
+        return self._constant(value, tree)
+
+    def visit_Compare(self, tree):
+        self.generic_visit(tree)
+        operands = [tree.left] + tree.comparators
+        if not all(is_constant(o) for o in operands):
+            return tree
+        value = True
+        try:
+            for op, left, right in zip(tree.ops, operands, operands[1:]):
+                cmp = CMP_OPS.get(op.__class__)
+                if cmp is None:
+                    return tree
+                value = value and cmp(left.value, right.value)
+        except Exception:
+            return tree
+        return self._constant(bool(value), tree)
+
+    def visit_BoolOp(self, tree):
+        self.generic_visit(tree)
+        is_and = isinstance(tree.op, ast.And)
+        values = []
+        for i, v in enumerate(tree.values):
+            last = i == len(tree.values) - 1
+            if is_constant(v) and not last:
+                if bool(v.value) != is_and:
+                    # short circuit, the rest is never evaluated
+                    values.append(v)
+                    break
+                self.count('folded')
+                continue
+            values.append(v)
+        if len(values) == 1:
+            return values[0]
+        tree.values = values
+        return tree
+
+    def visit_IfExp(self, tree):
+        self.generic_visit(tree)
+        if not is_constant(tree.test):
+            return tree
+        self.count('folded')
+        return tree.body if tree.test.value else tree.orelse
+
+
+class ConstantPropagation(Pass):
+    """
+    Replaces names of module-level constants by their values.
+
+    A name is a constant when it is bound exactly once in the whole module,
+    by a top-level assignment of a number, a short string, a bool or None
+    """
+    name = 'constant-propagation'
+
+    def run(self, tree):
+        if not isinstance(tree, ast.Module):
+            return tree
+        counter = _BindingCounter()
+        counter.visit(tree)
+        if counter.star_import:
+            return tree
+        for i, stmt in enumerate(tree.body):
+            if not (isinstance(stmt, ast.Assign) and len(stmt.targets) == 1 and
+                    isinstance(stmt.targets[0], ast.Name) and is_constant(stmt.value)):
+                continue
+            name = stmt.targets[0].id
+            value = stmt.value.value
+            if counter.bindings.get(name) != 1:
+                continue
+            if isinstance(value, str) and len(value) > MAX_PROPAGATED_STR:
+                continue
+            self.count('constants')
+            replacer = _NameReplacer(name, value, self)
+            for later in tree.body[i + 1:]:
+                replacer.visit(later)
+            for earlier in tree.body[:i]:
+                if isinstance(earlier, (ast.FunctionDef, ast.AsyncFunctionDef)):
+                    replacer.visit(earlier)
+        return tree
+
+
+class _BindingCounter(ast.NodeVisitor):
+    def __init__(self):
+        self.bindings = {}
+        self.star_import = False
+
+    def _bind(self, name):
+        self.bindings[name] = self.bindings.get(name, 0) + 1
+
+    def visit_Name(self, tree):
+        if not isinstance(tree.ctx, ast.Load):
+            self._bind(tree.id)
+
+    def visit_FunctionDef(self, tree):
+        self._bind(tree.name)
+        self.generic_visit(tree)
+    visit_AsyncFunctionDef = visit_ClassDef = visit_FunctionDef
+
+    def visit_arg(self, tree):
+        self._bind(tree.arg)
+        self.generic_visit(tree)
+
+    def visit_alias(self, tree):
+        if tree.name == '*':
+            self.star_import = True
+        else:
+            self._bind((tree.asname or tree.name).split('.')[0])
+
+    def visit_ExceptHandler(self, tree):
+        if tree.name:
+            self._bind(tree.name)
+        self.generic_visit(tree)
+
+    def visit_Global(self, tree):
+        for name in tree.names:
+            self._bind(name)
+    visit_Nonlocal = visit_Global
+
+    def visit_MatchAs(self, tree):
+        if tree.name:
+            self._bind(tree.name)
+        self.generic_visit(tree)
+    visit_MatchStar = visit_MatchAs
+
+    def visit_MatchMapping(self, tree):
+        if tree.rest:
+            self._bind(tree.rest)
+        self.generic_visit(tree)
+
+
+class _NameReplacer(ast.NodeTransformer):
+    def __init__(self, name, value, opt_pass):
+        self.name = name
+        self.value = value
+        self.opt_pass = opt_pass
+
+    def visit_Name(self, tree):
+        if tree.id == self.name and isinstance(tree.ctx, ast.Load):
+            self.opt_pass.count('replaced')
+            return ast.copy_location(ast.Constant(value=self.value), tree)
+        return tree
+
+
+class DeadCodeElimination(Pass):
+    """
+    Removes branches with constant conditions and statements which follow
+    return, raise, break or continue. A function which loses all its yields
+    gets `if False: yield` in front of its body, so it stays a generator
+    """
+    name = 'dead-code-elimination'
+
+    def visit_FunctionDef(self, tree):
+        generator = _yields(tree.body)
+        self.generic_visit(tree)
+        if generator and not _yields(tree.body):
+            self.count('yield-markers')
+            marker = ast.If(test=ast.Constant(value=False), body=[ast.Expr(value=ast.Yield())], orelse=[])
+            tree.body.insert(0, ast.fix_missing_locations(ast.copy_location(marker, tree)))
+        return tree
+    visit_AsyncFunctionDef = visit_FunctionDef
+
+    def generic_visit(self, tree):
+        super().generic_visit(tree)
+        for field in BODY_FIELDS:
+            body = getattr(tree, field, None)
+            if not isinstance(body, list):
+                continue
+            for i, stmt in enumerate(body):
+                if terminates(stmt) and i + 1 < len(body):
+                    self.count('statements', len(body) - i - 1)
+                    del body[i + 1:]
+                    break
+        return tree
+
+    def visit_If(self, tree):
+        self.generic_visit(tree)
+        if not is_constant(tree.test):
+            return tree
+        self.count('branches')
+        return tree.body if tree.test.value else tree.orelse
+
+    def visit_While(self, tree):
+        self.generic_visit(tree)
+        if is_constant(tree.test) and not tree.test.value:
+            self.count('branches')
+            return tree.orelse
+        return tree
+
+
+class Inlining(Pass):
+    """
+    Replaces calls of small module-level functions by their bodies.
+
+    A function is inlined when its body is a single return of an
+    expression without side effects, it has only plain positional
+    parameters and its name is bound once and used only in calls which
+    pass every parameter. Arguments have to be free of side effects too,
+    as they may be evaluated several times or not at all, and an argument
+    other than a name or a constant is only inlined for a parameter used
+    at most once, so it isn't computed again. An inlined call is limited
+    to INLINE_BUDGET expression nodes. Names the body
+    refers to have to mean the same at call sites, so they can only be
+    bound by top-level statements of the module
+    """
+    name = 'inlining'
+
+    def run(self, tree):
+        if not isinstance(tree, ast.Module):
+            return tree
+        counter = _BindingCounter()
+        counter.visit(tree)
+        if counter.star_import:
+            return tree
+        self.pure_calls = frozenset(name for name in PURE_BUILTINS if name not in counter.bindings)
+        top_level = _top_level_names(tree)
+        calls, loads = _call_counts(tree)
+        self.functions = {}
+        for stmt in tree.body:
+            if not isinstance(stmt, ast.FunctionDef) or counter.bindings.get(stmt.name) != 1:
+                continue
+            expr = _returned_expression(stmt)
+            if expr is None or calls.get(stmt.name, 0) != loads.get(stmt.name, 0):
+                continue
+            params = [a.arg for a in stmt.args.args]
+            free = {
+                node.id for node in ast.walk(expr) if isinstance(node, ast.Name) and node.id not in params
+            }
+            if not is_pure(expr, self.pure_calls) or expression_size(expr) > INLINE_BUDGET or any(
+                    counter.bindings.get(name, 0) > 1 or name in counter.bindings and name not in top_level
+                    for name in free):
+                continue
+            self.count('functions')
+            uses = [
+                sum(isinstance(node, ast.Name) and node.id == param for node in ast.walk(expr)) for param in params
+            ]
+            self.functions[stmt.name] = (params, expr, uses)
+        if not self.functions:
+            return tree
+        return ast.fix_missing_locations(self.visit(tree))
+
+    def visit_Call(self, tree):
+        self.generic_visit(tree)
+        func = tree.func
+        if not isinstance(func, ast.Name) or func.id not in self.functions:
+            return tree
+        params, expr, uses = self.functions[func.id]
+        if len(tree.args) != len(params) or not all(is_pure(arg, self.pure_calls) for arg in tree.args):
+            return tree
+        if any(n > 1 and not isinstance(arg, (ast.Name, ast.Constant)) for arg, n in zip(tree.args, uses)):
+            self.count('repeated-arguments')
+            return tree
+        inlined = _ParamReplacer(dict(zip(params, tree.args))).visit(copy.deepcopy(expr))
+        if expression_size(inlined) > INLINE_BUDGET:
+            self.count('over-budget')
+            return tree
+        self.count('inlined')
+        return ast.copy_location(inlined, tree)
+
+
+def _returned_expression(tree):
+    """
+    Returns the expression which is the whole body of a function or None,
+    the function has to take plain positional parameters only
+    """
+    args = tree.args
+    if tree.decorator_list or args.posonlyargs or args.kwonlyargs or args.vararg or args.kwarg or args.defaults:
+        return None
+    body = tree.body
+    if len(body) == 2 and isinstance(body[0], ast.Expr) and isinstance(body[0].value, ast.Constant) and \
+            isinstance(body[0].value.value, str):
+        body = body[1:]
+    if len(body) != 1 or not isinstance(body[0], ast.Return) or body[0].value is None:
+        return None
+    return body[0].value
+
+
+def _top_level_names(tree):
+    """
+    Returns names bound by statements of the module scope, bodies of
+    functions, classes, lambdas and comprehensions are not entered
+    """
+    names = set()
+    stack = list(tree.body)
+    while stack:
+        node = stack.pop()
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+            names.add(node.name)
+            continue
+        if isinstance(node, (ast.Lambda, ast.ListComp, ast.SetComp, ast.DictComp, ast.GeneratorExp)):
+            continue
+        if isinstance(node, ast.Name) and not isinstance(node.ctx, ast.Load):
+            names.add(node.id)
+        elif isinstance(node, ast.alias):
+            names.add((node.asname or node.name).split('.')[0])
+        stack.extend(ast.iter_child_nodes(node))
+    return names
+
+
+def _call_counts(tree):
+    """
+    Returns how many times names are called with positional arguments
+    only and how many times they are loaded at all
+    """
+    calls = {}
+    loads = {}
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Call) and isinstance(node.func, ast.Name) and not node.keywords and \
+                not any(isinstance(arg, ast.Starred) for arg in node.args):
+            calls[node.func.id] = calls.get(node.func.id, 0) + 1
+        elif isinstance(node, ast.Name) and isinstance(node.ctx, ast.Load):
+            loads[node.id] = loads.get(node.id, 0) + 1
+    return calls, loads
+
+
+def _yields(body):
+    """
+    Checks that statements contain yield, bodies of nested functions,
+    classes and lambdas are not entered
+    """
+    stack = list(body)
+    while stack:
+        node = stack.pop()
+        if isinstance(node, (ast.Yield, ast.YieldFrom)):
+            return True
+        if not isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef, ast.Lambda)):
+            stack.extend(ast.iter_child_nodes(node))
+    return False
+
+
+class _ParamReplacer(ast.NodeTransformer):
+    def __init__(self, args):
+        self.args = args
+
+    def visit_Name(self, tree):
+        if tree.id in self.args:
+            return copy.deepcopy(self.args[tree.id])
+        return tree
+
+
+OPT_LEVELS = {
+    0: (),
+    1: (ConstantFolding, DeadCodeElimination),
+    2: (ConstantFolding, ConstantPropagation, ConstantFolding, DeadCodeElimination),
+    3: (ConstantFolding, ConstantPropagation, Inlining, ConstantFolding, DeadCodeElimination),
+}
+
+
+class Optimizer:
+    """
+    Runs a pipeline of optimization passes over a module tree.
+
+    Passes are taken from OPT_LEVELS for the given level unless a custom
+    list of Pass subclasses is given
+    """
+    def __init__(self, level=0, passes=None):
+        if passes is None:
+            passes = OPT_LEVELS[level]
+        self.passes = tuple(passes)
+
+    def run(self, tree, stats=None):
+        """
+        Optimizes tree and returns the result, when stats is a list it gets
+        (pass name, counters) for every pass
+        """
+        for pass_class in self.passes:
+            opt_pass = pass_class()
+            tree = opt_pass.run(tree)
+            if stats is not None:
+                stats.append((opt_pass.name, opt_pass.stats))
+        return tree
+
+
+def format_stats(stats):
+    """
+    Formats per-pass statistics as a table
+    """
+    lines = []
+    for name, counters in stats:
+        details = ', '.join('{}={}'.format(k, v) for k, v in sorted(counters.items()))
+        lines.append('{:<24} {}'.format(name, details or '-'))
+    return '\n'.join(lines)
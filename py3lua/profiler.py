@@ -0,0 +1,105 @@
+import ast
+import json
+import time
+
+
+FUNCTION_NODES = (ast.FunctionDef, ast.AsyncFunctionDef)
+SORT_KEYS = ('tottime', 'cumtime', 'count', 'bytes')
+
+
+class Collector:
+    """
+    Base class of translation hooks.
+
+    enter is called before a node is visited, leave after the node was
+    visited with the code generated for it
+    """
+    def enter(self, node):
+        pass
+
+    def leave(self, node, code):
+        pass
+
+
+class NodeProfile(Collector):
+    """
+    Collects visit counts, time and size of generated code per node type
+    and per top-level function.
+
+    cumtime and bytes of a node type count only outermost visits of the
+    type, so that recursive nodes are not counted twice; tottime excludes
+    time spent in child nodes
+    """
+    def __init__(self, clock=time.perf_counter):
+        self.clock = clock
+        self.nodes = {}
+        self.functions = {}
+        self._stack = []
+        self._active = {}
+        self._function = None
+        self._function_depth = 0
+
+    def enter(self, node):
+        name = node.__class__.__name__
+        stack = self._stack
+        if self._function is None and isinstance(node, FUNCTION_NODES) and \
+                (not stack or len(stack) == 1 and stack[0][0] == 'Module'):
+            self._function = '{}:{}'.format(node.name, getattr(node, 'lineno', 0))
+            self._function_depth = len(stack)
+        self._active[name] = self._active.get(name, 0) + 1
+        self._stack.append([name, self.clock(), 0.0])
+
+    def leave(self, node, code):
+        name, start, child_time = self._stack.pop()
+        elapsed = self.clock() - start
+        size = len(code) if code else 0
+        depth = self._active[name] - 1
+        self._active[name] = depth
+        try:
+            stats = self.nodes[name]
+        except KeyError:
+            stats = self.nodes[name] = {'count': 0, 'cumtime': 0.0, 'tottime': 0.0, 'bytes': 0}
+        stats['count'] += 1
+        stats['tottime'] += elapsed - child_time
+        if not depth:
+            stats['cumtime'] += elapsed
+            stats['bytes'] += size
+        if self._stack:
+            self._stack[-1][2] += elapsed
+        if self._function is not None:
+            try:
+                func_stats = self.functions[self._function]
+            except KeyError:
+                func_stats = self.functions[self._function] = {'count': 0, 'cumtime': 0.0, 'bytes': 0}
+            func_stats['count'] += 1
+            if len(self._stack) == self._function_depth:
+                func_stats['cumtime'] += elapsed
+                func_stats['bytes'] += size
+                self._function = None
+
+    def report(self):
+        return {'nodes': self.nodes, 'functions': self.functions}
+
+    def to_json(self):
+        return json.dumps(self.report(), indent=2, sort_keys=True)
+
+
+def format_profile(profile, sort='tottime', limit=None):
+    """
+    Formats NodeProfile as tables of node types and top-level functions
+    sorted by descending `sort` key
+    """
+    lines = ['{:<20} {:>8} {:>10} {:>10} {:>10}'.format('node', 'count', 'tottime', 'cumtime', 'bytes')]
+    nodes = sorted(profile.nodes.items(), key=lambda item: item[1][sort], reverse=True)
+    for name, s in nodes[:limit]:
+        lines.append('{:<20} {:>8} {:>10.4f} {:>10.4f} {:>10}'.format(
+            name, s['count'], s['tottime'], s['cumtime'], s['bytes']
+        ))
+    if profile.functions:
+        func_sort = sort if sort != 'tottime' else 'cumtime'
+        functions = sorted(profile.functions.items(), key=lambda item: item[1][func_sort], reverse=True)
+        lines.append('')
+        lines.append('{:<20} {:>8} {:>10} {:>10}'.format('function', 'nodes', 'cumtime', 'bytes'))
+        for name, s in functions[:limit]:
+            lines.append('{:<20} {:>8} {:>10.4f} {:>10}'.format(name, s['count'], s['cumtime'], s['bytes']))
+    return '\n'.join(lines)
@@ -0,0 +1,142 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from .cache import TranslationCache
+from .translator import Translator
+
+
+SOURCE_EXT = '.py'
+TARGET_EXT = '.lua'
+
+
+class TranslationResult:
+    """
+    Outcome of translating one source. `code` is the generated code when
+    it isn't written to out_file, `error` the message of a failure
+    """
+    __slots__ = ('src_file', 'out_file', 'error', 'code')
+
+    def __init__(self, src_file, out_file, error=None, code=None):
+        self.src_file = src_file
+        self.out_file = out_file
+        self.error = error
+        self.code = code
+
+    @property
+    def ok(self):
+        return self.error is None
+
+
+def lua_path(rel_path):
+    """
+    Maps relative path of python module to relative path of lua module,
+    package __init__ modules become init.lua to be found by require()
+    """
+    head, tail = os.path.split(rel_path)
+    name = tail[:-len(SOURCE_EXT)]
+    if name == '__init__':
+        name = 'init'
+    return os.path.join(head, name + TARGET_EXT)
+
+
+def find_sources(src_dir):
+    """
+    Returns sorted relative paths of all python files under src_dir
+    """
+    sources = []
+    for root, dirs, files in os.walk(src_dir):
+        dirs[:] = sorted(d for d in dirs if not d.startswith('.') and d != '__pycache__')
+        for name in sorted(files):
+            if name.endswith(SOURCE_EXT):
+                sources.append(os.path.relpath(os.path.join(root, name), src_dir))
+    return sources
+
+
+def _make_out_dir(out_file):
+    out_dir = os.path.dirname(out_file)
+    if out_dir:
+        os.makedirs(out_dir, exist_ok=True)
+
+
+def error_message(e):
+    return '{}: {}'.format(e.__class__.__name__, e)
+
+
+def translate_file(src_file, out_file, cache=None, options=None):
+    """
+    Translates a single file, returns TranslationResult with the error
+    message instead of raising so that one broken file doesn't stop a batch.
+    Options are passed to Translator as keyword arguments, cache is a
+    TranslationCache shared by calls
+    """
+    try:
+        with open(src_file) as src:
+            source = src.read()
+        _make_out_dir(out_file)
+        Translator(out_file=out_file, cache=cache, **(options or {})).translate(source)
+    except Exception as e:
+        if os.path.exists(out_file):
+            os.remove(out_file)
+        return TranslationResult(src_file, out_file, error_message(e))
+    return TranslationResult(src_file, out_file)
+
+
+# cache of a worker process, made by the pool initializer
+_worker_cache = None
+
+
+def _init_worker(cache_dir):
+    global _worker_cache
+    _worker_cache = TranslationCache(cache_dir) if cache_dir else None
+
+
+def _translate_in_worker(src_file, out_file, options):
+    return translate_file(src_file, out_file, _worker_cache, options)
+
+
+def _cached_file(cache, options, src_file, out_file):
+    try:
+        with open(src_file) as src:
+            source = src.read()
+        _make_out_dir(out_file)
+        return cache.copy_to(cache.key(source, options), out_file)
+    except OSError:
+        return False
+
+
+def translate_project(src_dir, out_dir, jobs=None, cache_dir=None, options=None):
+    """
+    Translates every python file under src_dir into out_dir keeping the
+    package layout. Files are translated in a pool of `jobs` processes.
+    When cache_dir is given, files found in the cache are copied in this
+    process and only the rest is sent to the pool. Results of cache hits
+    are yielded first, then the others in source order
+    """
+    tasks = [
+        (os.path.join(src_dir, rel_path), os.path.join(out_dir, lua_path(rel_path)))
+        for rel_path in find_sources(src_dir)
+    ]
+    cache = None
+    if cache_dir:
+        cache = TranslationCache(cache_dir)
+        cache_options = Translator(**(options or {})).options()
+        misses = []
+        for src_file, out_file in tasks:
+            if _cached_file(cache, cache_options, src_file, out_file):
+                yield TranslationResult(src_file, out_file)
+            else:
+                misses.append((src_file, out_file))
+        tasks = misses
+
+    if jobs == 1 or len(tasks) < 2:
+        for src_file, out_file in tasks:
+            yield translate_file(src_file, out_file, cache, options)
+        return
+
+    workers = jobs or os.cpu_count() or 1
+    chunksize = max(1, len(tasks) // (workers * 4))
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(cache_dir,)) as executor:
+        src_files, out_files = zip(*tasks)
+        options = [options] * len(tasks)
+        for result in executor.map(_translate_in_worker, src_files, out_files, options, chunksize=chunksize):
+            yield result
@@ -0,0 +1,928 @@
+import os
+import ast
+
+from .inference import NUMBER, STRING
+
+
+RUNTIME_MODULE = 'py3lua_runtime'
+RUNTIME_MODES = ('full', 'used', 'shared')
+RUNTIME_HEADER = """
+-- standard library code
+"""
+RUNTIME_FOOTER = """
+-- generated code
+
+"""
+# (name, dependencies, code) in the order of definition, parts are
+# separated by an empty line
+RUNTIME_PARTS = (
+    ('builtins', (), """
+local type, select, error = type, select, error
+local rawget, getmetatable, setmetatable = rawget, getmetatable, setmetatable
+local math_max, string_sub, table_concat = math.max, string.sub, table.concat
+"""),
+    ('_add_op', ('builtins',), """
+local function _add_op(a, b)
+    if type(a) == "string" then
+        return a .. b
+    else
+        return a + b
+    end
+end
+"""),
+    ('list', ('builtins',), """
+local list_methods = {}
+local list_mt = {}
+
+-- lists keep python indexes: elements are stored at 0..n-1
+function list_mt.__index(lst, key)
+    if type(key) ~= "number" then
+        return list_methods[key]
+    end
+    local n = lst.n
+    if key < 0 then
+        key = key + n
+        if key >= 0 then
+            return rawget(lst, key)
+        end
+    elseif key < n then
+        return nil
+    end
+    error("list index out of range", 2)
+end
+
+-- stores of absent elements end up here, lists grow through rawset
+function list_mt.__newindex(lst, key, value)
+    if type(key) == "number" then
+        local n = lst.n
+        if key < 0 then
+            key = key + n
+        end
+        if key < 0 or key >= n then
+            error("list assignment index out of range", 2)
+        end
+    end
+    rawset(lst, key, value)
+end
+
+function list_mt.__len(lst)
+    return lst.n
+end
+
+local function list(...)
+    local n = select("#", ...)
+    local lst = {...}
+    if n > 0 then
+        lst[0] = lst[1]
+        for i = 1, n - 1 do
+            lst[i] = lst[i + 1]
+        end
+        lst[n] = nil
+    end
+    lst.n = n
+    return setmetatable(lst, list_mt)
+end
+
+function list_methods.append(lst, v)
+    local n = lst.n
+    rawset(lst, n, v)
+    lst.n = n + 1
+end
+
+function list_methods.extend(lst, other)
+    local n = lst.n
+    if getmetatable(other) == list_mt then
+        for i = 0, other.n - 1 do
+            rawset(lst, n + i, other[i])
+        end
+        lst.n = n + other.n
+    else
+        for v in other:iter() do
+            rawset(lst, n, v)
+            n = n + 1
+        end
+        lst.n = n
+    end
+end
+
+function list_methods.insert(lst, i, v)
+    local n = lst.n
+    if i < 0 then
+        i = math_max(i + n, 0)
+    elseif i > n then
+        i = n
+    end
+    for j = n, i + 1, -1 do
+        rawset(lst, j, lst[j - 1])
+    end
+    rawset(lst, i, v)
+    lst.n = n + 1
+end
+
+function list_methods.pop(lst, i)
+    local n = lst.n
+    if i == nil then
+        i = n - 1
+    elseif i < 0 then
+        i = i + n
+    end
+    if i < 0 or i >= n then
+        error("pop index out of range", 2)
+    end
+    local v = lst[i]
+    for j = i, n - 2 do
+        lst[j] = lst[j + 1]
+    end
+    lst[n - 1] = nil
+    lst.n = n - 1
+    return v
+end
+
+function list_methods.index(lst, v)
+    for i = 0, lst.n - 1 do
+        if lst[i] == v then
+            return i
+        end
+    end
+    error("value is not in list", 2)
+end
+
+function list_methods.iter(lst)
+    local i = -1
+    return function()
+        i = i + 1
+        if i < lst.n then
+            return lst[i]
+        end
+    end
+end
+"""),
+    ('_table_new', (), """
+-- preallocates tables where table.new, a luajit extension, is available
+local table_new
+do
+    local ok, new = pcall(require, "table.new")
+    table_new = ok and new or function() return {} end
+end
+"""),
+    ('_list_of', ('builtins', 'list'), """
+-- list literals are table constructors like {[0]=a,b,n=2}, which size
+-- the table for them
+local function _list_of(lst)
+    return setmetatable(lst, list_mt)
+end
+"""),
+    ('_list_alloc', ('builtins', 'list', '_table_new'), """
+-- empty list with room for n elements
+local function _list_alloc(n)
+    local lst = table_new(n > 0 and n or 0, 1)
+    lst.n = 0
+    return setmetatable(lst, list_mt)
+end
+"""),
+    ('dict', ('builtins',), """
+local dict_methods = {}
+local dict_mt = {}
+local dict_view_methods = {}
+local dict_view_mt = {__index = dict_view_methods}
+
+-- dicts keep items in their own table, so subscripts are plain table
+-- accesses. Translated code calls methods through _call and _iter, which
+-- find them in __methods, items don't hide them there. Other missing
+-- keys raise KeyError. None values are not stored
+dict_mt.__methods = dict_methods
+
+function dict_mt.__index(d, key)
+    local method = dict_methods[key]
+    if method == nil then
+        error("KeyError: " .. tostring(key), 2)
+    end
+    return method
+end
+
+function dict_mt.__len(d)
+    local n = 0
+    for _ in next, d do
+        n = n + 1
+    end
+    return n
+end
+
+local function dict(items)
+    local d = {}
+    if items then
+        for k, v in next, items do
+            d[k] = v
+        end
+    end
+    return setmetatable(d, dict_mt)
+end
+
+function dict_methods.get(d, key, default)
+    local v = rawget(d, key)
+    if v == nil then
+        return default
+    end
+    return v
+end
+
+function dict_methods.pop(d, key, default)
+    local v = rawget(d, key)
+    if v == nil then
+        if default == nil then
+            error("KeyError: " .. tostring(key), 2)
+        end
+        return default
+    end
+    d[key] = nil
+    return v
+end
+
+function dict_methods.setdefault(d, key, default)
+    local v = rawget(d, key)
+    if v == nil then
+        d[key] = default
+        return default
+    end
+    return v
+end
+
+function dict_methods.update(d, other)
+    for k, v in next, other do
+        d[k] = v
+    end
+end
+
+function dict_methods.copy(d)
+    return dict(d)
+end
+
+function dict_methods.iter(d)
+    local key
+    return function()
+        key = next(d, key)
+        return key
+    end
+end
+
+-- keys(), values() and items() are views of the dict, items are
+-- iterated as two values
+function dict_methods.keys(d)
+    return setmetatable({d, "keys"}, dict_view_mt)
+end
+
+function dict_methods.values(d)
+    return setmetatable({d, "values"}, dict_view_mt)
+end
+
+function dict_methods.items(d)
+    return setmetatable({d, "items"}, dict_view_mt)
+end
+
+function dict_view_mt.__len(view)
+    return dict_mt.__len(view[1])
+end
+
+function dict_view_methods.iter(view)
+    local d, kind, key = view[1], view[2], nil
+    return function()
+        local value
+        key, value = next(d, key)
+        if key == nil or kind == "keys" then
+            return key
+        elseif kind == "values" then
+            return value
+        end
+        return key, value
+    end
+end
+
+function dict_view_methods.__contains__(view, item)
+    local d = view[1]
+    if view[2] == "keys" then
+        return rawget(d, item) ~= nil
+    end
+    for _, v in next, d do
+        if v == item then
+            return true
+        end
+    end
+    return false
+end
+"""),
+    ('_dict_of', ('builtins', 'dict'), """
+-- dict literals are table constructors, which size the table for them
+local function _dict_of(d)
+    return setmetatable(d, dict_mt)
+end
+"""),
+    ('_dict_alloc', ('builtins', 'dict', '_table_new'), """
+-- empty dict with room for n items
+local function _dict_alloc(n)
+    return setmetatable(table_new(0, n > 0 and n or 0), dict_mt)
+end
+"""),
+    ('_contains', ('builtins', 'list', 'dict'), """
+-- the in operator
+local function _contains(container, item)
+    if type(container) == "string" then
+        return string.find(container, item, 1, true) ~= nil
+    end
+    local mt = getmetatable(container)
+    if mt == dict_mt then
+        return rawget(container, item) ~= nil
+    elseif mt == list_mt then
+        for i = 0, container.n - 1 do
+            if container[i] == item then
+                return true
+            end
+        end
+        return false
+    elseif mt == nil then
+        -- sets built by comprehensions are plain tables
+        return container[item] ~= nil
+    end
+    local contains = container.__contains__
+    if contains then
+        return contains(container, item)
+    end
+    for v in container:iter() do
+        if v == item then
+            return true
+        end
+    end
+    return false
+end
+"""),
+    ('_call', ('builtins',), """
+-- methods are looked up in __methods of the metatable when it has them
+local function _method(obj, name)
+    local mt = getmetatable(obj)
+    local methods = type(mt) == "table" and rawget(mt, "__methods")
+    if methods then
+        return methods[name]
+    end
+    return obj[name]
+end
+
+-- calls of methods which dicts have
+local function _call(obj, name, ...)
+    return _method(obj, name)(obj, ...)
+end
+"""),
+    ('_iter', ('builtins', '_call'), """
+-- the iterator of a for loop
+local function _iter(obj)
+    return _method(obj, "iter")(obj)
+end
+"""),
+    ('_join', ('builtins', 'list'), """
+-- str.join, lists are concatenated in place
+local function _join(sep, items)
+    if getmetatable(items) == list_mt then
+        return table_concat(items, sep, 0, items.n - 1)
+    end
+    local parts, n = {}, 0
+    for v in items:iter() do
+        n = n + 1
+        parts[n] = v
+    end
+    return table_concat(parts, sep, 1, n)
+end
+"""),
+    ('len', ('builtins',), """
+local function len(obj)
+    local mt = getmetatable(obj)
+    if mt and mt.__len then
+        return mt.__len(obj)
+    end
+    return #obj
+end
+"""),
+    ('_slice_bounds', ('builtins',), """
+local function _slice_bounds(n, start, stop, step)
+    if step > 0 then
+        if start == nil then
+            start = 0
+        elseif start < 0 then
+            start = math_max(start + n, 0)
+        elseif start > n then
+            start = n
+        end
+        if stop == nil then
+            stop = n
+        elseif stop < 0 then
+            stop = math_max(stop + n, 0)
+        elseif stop > n then
+            stop = n
+        end
+        return start, stop - 1
+    end
+    if start == nil then
+        start = n - 1
+    elseif start < 0 then
+        start = math_max(start + n, -1)
+    elseif start >= n then
+        start = n - 1
+    end
+    if stop == nil then
+        stop = -1
+    elseif stop < 0 then
+        stop = math_max(stop + n, -1)
+    elseif stop >= n then
+        stop = n - 1
+    end
+    return start, stop + 1
+end
+"""),
+    ('_slice', ('builtins', 'list', '_slice_bounds'), """
+local function _slice(obj, start, stop, step)
+    step = step or 1
+    if step == 0 then
+        error("slice step cannot be zero", 2)
+    end
+    local is_str = type(obj) == "string"
+    local first, last = _slice_bounds(is_str and #obj or obj.n, start, stop, step)
+    if is_str then
+        if step == 1 then
+            return string_sub(obj, first + 1, last + 1)
+        end
+        local chars = {}
+        for i = first, last, step do
+            chars[#chars + 1] = string_sub(obj, i + 1, i + 1)
+        end
+        return table_concat(chars)
+    end
+    local res = list()
+    local j = 0
+    for i = first, last, step do
+        rawset(res, j, obj[i])
+        j = j + 1
+    end
+    res.n = j
+    return res
+end
+"""),
+    ('range', ('list',), """
+local function range(start, stop, step)
+    if stop == nil then
+        start, stop = 0, start
+    end
+    step = step or 1
+    if step == 0 then
+        error("range() arg 3 must not be zero", 2)
+    end
+    local lst = list()
+    local n = 0
+    for i = start, step > 0 and stop - 1 or stop + 1, step do
+        rawset(lst, n, i)
+        n = n + 1
+    end
+    lst.n = n
+    return lst
+end
+"""),
+    ('generator', ('builtins',), """
+local coroutine_create, coroutine_resume, coroutine_status, coroutine_yield =
+    coroutine.create, coroutine.resume, coroutine.status, coroutine.yield
+local generator_methods = {}
+local generator_mt = {__index = generator_methods}
+
+-- generator functions run their body in a coroutine, every yield
+-- produces a value and the body returns when it is exhausted
+local function generator(body)
+    return setmetatable({co = coroutine_create(body)}, generator_mt)
+end
+
+-- returns the next value and false, or the return value and true when
+-- the generator is exhausted
+local function _resume(gen, ...)
+    local co = gen.co
+    if coroutine_status(co) == "dead" then
+        return nil, true
+    end
+    local ok, v = coroutine_resume(co, ...)
+    if not ok then
+        error(v, 0)
+    end
+    return v, coroutine_status(co) == "dead"
+end
+
+function generator_methods.iter(gen)
+    return function()
+        local v, done = _resume(gen)
+        if not done then
+            return v
+        end
+    end
+end
+
+function generator_methods.send(gen, value)
+    local v, done = _resume(gen, value)
+    if done then
+        error("StopIteration", 2)
+    end
+    return v
+end
+"""),
+    ('next', ('builtins', 'generator'), """
+local function next(gen, ...)
+    local v, done = _resume(gen)
+    if done then
+        if select("#", ...) > 0 then
+            return (...)
+        end
+        error("StopIteration", 2)
+    end
+    return v
+end
+"""),
+    ('_yield_from', ('builtins', 'generator'), """
+-- yields values of an iterable from the running generator, returns
+-- the return value of a delegated generator
+local function _yield_from(it)
+    if getmetatable(it) ~= generator_mt then
+        for v in it:iter() do
+            coroutine_yield(v)
+        end
+        return nil
+    end
+    local value
+    while true do
+        local v, done = _resume(it, value)
+        if done then
+            return v
+        end
+        value = coroutine_yield(v)
+    end
+end
+"""),
+    ('class', ('builtins', '_table_new'), """
+-- classes are metatables of their instances and look up methods of
+-- their bases through __index. Instances of classes with slots keep
+-- slot values in the array part, at indexes of the slots
+local class_metamethods = {
+    "__tostring", "__eq", "__lt", "__le", "__len", "__call", "__add", "__sub", "__mul", "__div", "__mod", "__unm"
+}
+
+local function _new_instance(cls, ...)
+    local nslots = cls.__nslots
+    local obj = setmetatable(nslots > 0 and table_new(nslots, 0) or {}, cls)
+    local init = cls.__init__
+    if init then
+        init(obj, ...)
+    end
+    return obj
+end
+
+-- slots of a class follow those of its base. Instances of classes with
+-- slots take other attributes too when the class or one of its bases
+-- doesn't declare slots
+local function class(name, base, slots)
+    local cls = {__name = name, __nslots = 0}
+    local open = false
+    if base then
+        -- metamethods are not looked up through __index
+        for _, key in ipairs(class_metamethods) do
+            cls[key] = rawget(base, key)
+        end
+        local base_slots = rawget(base, "__slots")
+        if base_slots then
+            open = rawget(base, "__open") or not slots
+            local merged = {}
+            for i, slot in ipairs(base_slots) do
+                merged[i] = slot
+            end
+            for _, slot in ipairs(slots or {}) do
+                local found = false
+                for _, other in ipairs(base_slots) do
+                    found = found or other == slot
+                end
+                if not found then
+                    merged[#merged + 1] = slot
+                end
+            end
+            slots = merged
+        else
+            open = true
+        end
+    end
+    if slots then
+        local index = {}
+        for i, slot in ipairs(slots) do
+            index[slot] = i
+        end
+        cls.__slots, cls.__open, cls.__nslots = slots, open, #slots
+        function cls.__index(obj, key)
+            local i = index[key]
+            if i then
+                return rawget(obj, i)
+            end
+            return cls[key]
+        end
+        function cls.__newindex(obj, key, value)
+            local i = index[key]
+            if i then
+                rawset(obj, i, value)
+            elseif slots[key] ~= nil or open then
+                -- translated code stores slots by their indexes
+                rawset(obj, key, value)
+            else
+                error("'" .. name .. "' object has no attribute '" .. tostring(key) .. "'", 2)
+            end
+        end
+    else
+        cls.__index = cls
+    end
+    return setmetatable(cls, {__index = base, __call = _new_instance})
+end
+"""),
+    ('lru_cache', ('builtins',), """
+local cache_methods = {}
+local cache_mt = {__index = cache_methods}
+local lru_cache_mt = {__index = cache_methods}
+-- stand for nil arguments and results and nan arguments, which can't be
+-- table keys
+local _cache_nil = {}
+local _cache_nan = {}
+
+local function _cache_arg(v)
+    if v == nil then
+        return _cache_nil
+    elseif v ~= v then
+        return _cache_nan
+    end
+    return v
+end
+
+-- a single argument is its own key. Keys of several arguments are leaves
+-- of a tree of the cache, which is looked up by the number of arguments
+-- and then by one argument at a time, so they are compared like single
+-- ones. The second result tells that the key is a leaf
+local function _cache_key(cache, ...)
+    local n = select("#", ...)
+    if n == 1 then
+        return _cache_arg((...))
+    end
+    local node = cache.tree
+    for i = 0, n do
+        local arg = i == 0 and n or _cache_arg((select(i, ...)))
+        local child = node.children[arg]
+        if child == nil then
+            child = {children = {}, count = 0, parent = node, arg = arg}
+            node.children[arg] = child
+            node.count = node.count + 1
+        end
+        node = child
+    end
+    return node, true
+end
+
+-- removes the leaf of an evicted key and the nodes left without leaves
+local function _cache_prune(node)
+    local parent = node.parent
+    while parent and parent.children[node.arg] == node do
+        parent.children[node.arg] = nil
+        parent.count = parent.count - 1
+        if parent.count > 0 then
+            return
+        end
+        node, parent = parent, parent.parent
+    end
+end
+
+-- unbounded cache maps keys to results
+function cache_mt.__call(cache, ...)
+    local key = _cache_key(cache, ...)
+    local value = cache.map[key]
+    if value ~= nil then
+        cache.hits = cache.hits + 1
+        if value == _cache_nil then
+            return nil
+        end
+        return value
+    end
+    cache.misses = cache.misses + 1
+    value = cache.func(...)
+    if value == nil then
+        cache.map[key] = _cache_nil
+    else
+        cache.map[key] = value
+    end
+    cache.size = cache.size + 1
+    return value
+end
+
+-- bounded cache maps keys to nodes of a list ordered from the most
+-- recently used, the last node is evicted when the cache is full
+function lru_cache_mt.__call(cache, ...)
+    local maxsize = cache.maxsize
+    if maxsize <= 0 then
+        cache.misses = cache.misses + 1
+        return cache.func(...)
+    end
+    local key, leaf = _cache_key(cache, ...)
+    local head = cache.head
+    local node = cache.map[key]
+    if node ~= nil then
+        cache.hits = cache.hits + 1
+        if head.next ~= node then
+            node.prev.next, node.next.prev = node.next, node.prev
+            node.prev, node.next = head, head.next
+            head.next.prev = node
+            head.next = node
+        end
+        return node.value
+    end
+    cache.misses = cache.misses + 1
+    local value = cache.func(...)
+    if cache.map[key] == nil then
+        if cache.size >= maxsize then
+            local last = head.prev
+            last.prev.next, head.prev = head, last.prev
+            cache.map[last.key] = nil
+            if last.leaf then
+                _cache_prune(last.key)
+            end
+            cache.size = cache.size - 1
+        end
+        node = {key = key, leaf = leaf, value = value, prev = head, next = head.next}
+        head.next.prev = node
+        head.next = node
+        cache.map[key] = node
+        cache.size = cache.size + 1
+    end
+    return value
+end
+
+function cache_methods.cache_info(cache)
+    return {hits = cache.hits, misses = cache.misses, maxsize = cache.maxsize, currsize = cache.size}
+end
+
+function cache_methods.cache_clear(cache)
+    cache.map, cache.tree = {}, {children = {}, count = 0}
+    cache.hits, cache.misses, cache.size = 0, 0, 0
+    if cache.head then
+        cache.head.prev, cache.head.next = cache.head, cache.head
+    end
+end
+
+local function lru_cache(func, maxsize)
+    local cache = {
+        func = func, map = {}, tree = {children = {}, count = 0}, hits = 0, misses = 0, size = 0, maxsize = maxsize
+    }
+    if maxsize == nil then
+        return setmetatable(cache, cache_mt)
+    end
+    local head = {}
+    head.prev, head.next = head, head
+    cache.head = head
+    return setmetatable(cache, lru_cache_mt)
+end
+"""),
+)
+# runtime names generated code refers to
+RUNTIME_EXPORTS = (
+    '_add_op', 'list', 'len', '_slice', 'range', 'generator', 'next', '_yield_from', 'lru_cache', '_join',
+    '_list_alloc', 'class', '_list_of', 'dict', '_dict_of', '_dict_alloc', '_contains', '_call', '_iter',
+)
+# functools decorators translated to lru_cache
+MEMOIZERS = ('cache', 'lru_cache')
+# methods called through _call, as keys of dict items would hide them
+DICT_METHODS = frozenset(['get', 'pop', 'setdefault', 'update', 'copy', 'keys', 'values', 'items'])
+
+
+def runtime_refs(tree, types=None, target=None, numeric_loop=None):
+    """
+    Returns runtime names which translation of the tree may refer to.
+    Additions are skipped when types (TypeInference of the tree) tell
+    they are translated to native operators. Preallocated lists are
+    referred to when the target (targets.Target) has table.new. Loops
+    refer to _iter unless numeric_loop tells they are lowered to
+    a numeric for
+    """
+    refs = set()
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Name):
+            if node.id in RUNTIME_EXPORTS:
+                refs.add(node.id)
+        elif isinstance(node, ast.List):
+            refs.add('_list_of')
+        elif isinstance(node, (ast.ListComp, ast.GeneratorExp)):
+            refs.add('list')
+            if target is not None and target.table_new:
+                refs.add('_list_alloc')
+        elif isinstance(node, ast.Dict):
+            refs.add('_dict_of')
+        elif isinstance(node, ast.DictComp):
+            refs.add('dict')
+            if target is not None and target.table_new:
+                refs.add('_dict_alloc')
+        elif isinstance(node, ast.Compare):
+            if any(isinstance(op, (ast.In, ast.NotIn)) for op in node.ops):
+                refs.add('_contains')
+        elif isinstance(node, (ast.For, ast.comprehension)):
+            if numeric_loop is None or not numeric_loop(node):
+                refs.add('_iter')
+        elif isinstance(node, ast.Yield):
+            refs.add('generator')
+        elif isinstance(node, ast.YieldFrom):
+            refs.update(('generator', '_yield_from'))
+        elif isinstance(node, ast.ClassDef):
+            refs.add('class')
+        elif isinstance(node, ast.Call) and isinstance(node.func, ast.Attribute) and node.func.attr == 'join':
+            if isinstance(node.func.value, ast.Constant) and isinstance(node.func.value.value, str):
+                refs.add('_join')
+        elif isinstance(node, ast.Call) and isinstance(node.func, ast.Attribute) and node.func.attr in DICT_METHODS:
+            refs.add('_call')
+        elif isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+            for dec in node.decorator_list:
+                if isinstance(dec, ast.Call):
+                    dec = dec.func
+                name = getattr(dec, 'id', None) or getattr(dec, 'attr', None)
+                if name in MEMOIZERS:
+                    refs.add('lru_cache')
+        elif isinstance(node, ast.Subscript):
+            if isinstance(node.slice, ast.Slice):
+                refs.add('_slice')
+        elif isinstance(node, ast.BinOp) and isinstance(node.op, ast.Add):
+            if types is None or types.add_type(node) not in (NUMBER, STRING):
+                refs.add('_add_op')
+    return refs
+
+
+def runtime_parts(names):
+    """
+    Returns names of runtime parts defining given names together with
+    their dependencies, in the order of definition
+    """
+    deps = {name: part_deps for name, part_deps, _ in RUNTIME_PARTS}
+    needed = set()
+    stack = list(names)
+    while stack:
+        name = stack.pop()
+        if name not in needed:
+            needed.add(name)
+            stack.extend(deps[name])
+    return [name for name, _, _ in RUNTIME_PARTS if name in needed]
+
+
+def runtime_code(parts=None):
+    """
+    Returns runtime code to be inlined into a module, with all parts when
+    parts is None, only exported helpers become locals of the module
+    """
+    codes = [code for name, _, code in RUNTIME_PARTS if parts is None or name in parts]
+    if not codes:
+        return RUNTIME_FOOTER
+    code = ''.join(codes)
+    # lua allows 200 locals in a function, so the runtime is defined in a
+    # function of its own which returns the exported helpers
+    names = ', '.join(name for name in RUNTIME_EXPORTS if '\nlocal function {}('.format(name) in code)
+    return '{}local {} = (function(){}\nreturn {}\nend)()\n{}'.format(
+        RUNTIME_HEADER, names, code, names, RUNTIME_FOOTER
+    )
+
+
+def runtime_import(names):
+    """
+    Returns code binding given names of the shared runtime module to locals
+    """
+    names = [name for name in RUNTIME_EXPORTS if name in names]
+    if not names:
+        return RUNTIME_FOOTER
+    lines = ['local _runtime = require("{}")'.format(RUNTIME_MODULE)]
+    lines.extend('local {0} = _runtime.{0}'.format(name) for name in names)
+    return '\n' + '\n'.join(lines) + '\n' + RUNTIME_FOOTER
+
+
+def runtime_module():
+    """
+    Returns code of the shared runtime lua module
+    """
+    exports = ''.join('    {0} = {0},\n'.format(name) for name in RUNTIME_EXPORTS)
+    codes = ''.join(code for _, _, code in RUNTIME_PARTS)
+    return '-- py3lua runtime\n' + codes + '\nreturn {\n' + exports + '}\n'
+
+
+def write_runtime(out_dir):
+    """
+    Writes the shared runtime module into out_dir unless it is up to date,
+    returns path of the file
+    """
+    path = os.path.join(out_dir, RUNTIME_MODULE + '.lua')
+    code = runtime_module()
+    try:
+        with open(path) as f:
+            if f.read() == code:
+                return path
+    except OSError:
+        pass
+    if out_dir:
+        os.makedirs(out_dir, exist_ok=True)
+    with open(path, 'w') as f:
+        f.write(code)
+    return path
+
+
+STDLIB = runtime_code()
@@ -1,6 +1,18 @@
+import io
 import os
+import sys
 import argparse
 from .. import Translator
+from ..bundler import bundle, bundle_file
+from ..cache import TranslationCache, default_cache_dir
+from ..inference import type_report
+from ..minifier import MINIFY_MODES, minify
+from ..optimizer import format_stats
+from ..profiler import NodeProfile, format_profile
+from ..project import translate_project
+from ..runtime import RUNTIME_MODES, write_runtime
+from ..server import serve
+from ..targets import TARGETS, DEFAULT_TARGET
 
 
 def parse_args():
@@ -8,25 +20,229 @@ def parse_args():
         description="Python to Lua source to source translator"
     )
     parser.add_argument(
-        'src_file', type=str,
-        help="Source Python file to translate"
+        'src_file', type=str, nargs='?',
+        help="Source Python file or package directory to translate"
     )
     parser.add_argument(
         "-o", "--output",
         action="store",
         type=str,
-        help="Output file name"
+        help="Output file name, or output directory when translating a directory"
+    )
+    parser.add_argument(
+        "-j", "--jobs",
+        action="store",
+        type=int,
+        default=None,
+        help="Number of worker processes for directory mode (default: number of CPUs)"
+    )
+    parser.add_argument(
+        "-O",
+        dest="opt_level",
+        type=int,
+        choices=(0, 1, 2, 3),
+        default=0,
+        help="Optimization level: 0 - none, 1 - constant folding and dead code elimination, "
+             "2 - also propagation of module-level constants, 3 - also inlining of small functions "
+             "(default: %(default)s)"
+    )
+    parser.add_argument(
+        "--opt-stats",
+        action="store_true",
+        help="Print what each optimization pass did"
+    )
+    parser.add_argument(
+        "--profile",
+        nargs="?",
+        const="table",
+        choices=("table", "json"),
+        help="Print visit counts, time and generated code size per node type and "
+             "per top-level function as a table (default) or JSON"
+    )
+    parser.add_argument(
+        "--runtime",
+        choices=RUNTIME_MODES,
+        default="full",
+        help="How runtime helpers are included: full - whole runtime in every module, "
+             "used - only helpers the module refers to, shared - required from py3lua_runtime.lua "
+             "which is written next to the output (default: %(default)s)"
+    )
+    parser.add_argument(
+        "--target",
+        choices=tuple(TARGETS),
+        default=DEFAULT_TARGET,
+        help="Lua version of generated code: luajit and 5.1 call bitwise functions of the bit library, "
+             "5.3 and 5.4 use native bitwise and floor division operators (default: %(default)s)"
+    )
+    parser.add_argument(
+        "--bundle",
+        action="store_true",
+        help="Translate the source file and local modules it imports into a single lua file "
+             "which preloads them"
+    )
+    parser.add_argument(
+        "--minify",
+        nargs="?",
+        const="compact",
+        choices=MINIFY_MODES,
+        help="Strip comments, needless whitespace and parentheses from generated code, "
+             "names - also shorten local names, module exports keep theirs (default: compact). "
+             "Sizes before and after are reported except for directories"
+    )
+    parser.add_argument(
+        "--cache-dir",
+        action="store",
+        type=str,
+        default=default_cache_dir(),
+        help="Directory of translation cache (default: %(default)s)"
+    )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="Don't use translation cache"
+    )
+    parser.add_argument(
+        "--type-report",
+        action="store_true",
+        help="Print how many additions were specialized by inferred operand types"
+    )
+    parser.add_argument(
+        "--serve",
+        action="store_true",
+        help="Run as a server translating JSON-lines requests from stdin"
+    )
+    parser.add_argument(
+        "--socket",
+        action="store",
+        type=str,
+        help="Serve requests on this unix socket instead of stdin"
+    )
+    parser.add_argument(
+        "--watch",
+        action="append",
+        default=[],
+        metavar="DIR",
+        help="Retranslate changed files of this directory while serving, may be repeated"
+    )
+    args = parser.parse_args()
+    if not args.serve and not args.src_file:
+        parser.error("the following arguments are required: src_file")
+    return args
+
+
+def translator_options(args):
+    return {'opt_level': args.opt_level, 'runtime': args.runtime, 'target': args.target, 'minify': args.minify}
+
+
+def write_minified(code, out_file, mode):
+    """
+    Writes minified code to out_file and reports sizes before and after
+    """
+    minified = minify(code, names=mode == 'names')
+    with open(out_file, 'w') as out:
+        out.write(minified)
+    print("Minified {}: {} -> {} bytes".format(out_file, len(code), len(minified)))
+
+
+def run_project(args):
+    # files are minified by the workers which translate them, so unlike
+    # with write_minified their sizes are not reported
+    src_dir = os.path.normpath(args.src_file)
+    out_dir = args.output or os.path.basename(os.path.abspath(src_dir)) + '_lua'
+    if os.path.realpath(out_dir) == os.path.realpath(src_dir):
+        sys.exit("output directory is the source directory, use -o to choose another one")
+    failed = 0
+    total = 0
+    cache_dir = None if args.no_cache else args.cache_dir
+    results = translate_project(
+        src_dir, out_dir, jobs=args.jobs, cache_dir=cache_dir, options=translator_options(args)
+    )
+    for result in results:
+        total += 1
+        if not result.ok:
+            failed += 1
+            print("{}: {}".format(result.src_file, result.error), file=sys.stderr)
+    if args.runtime == 'shared':
+        write_runtime(out_dir)
+    print("Translated {} of {} files into {}".format(total - failed, total, out_dir))
+    return 1 if failed else 0
+
+
+def run_bundle(args):
+    out_file = args.output or os.path.basename(args.src_file).split('.')[0] + '.lua'
+    options = translator_options(args)
+    if args.minify:
+        code = io.StringIO()
+        modules = bundle(args.src_file, code, options=dict(options, minify=None))
+        write_minified(code.getvalue(), out_file, args.minify)
+    else:
+        modules = bundle_file(args.src_file, out_file, options=options)
+    print("Bundled {} modules into {}".format(len(modules), out_file))
+    return 0
+
+
+def run_server(args):
+    cache_dir = None if args.no_cache else args.cache_dir
+    cache = TranslationCache(cache_dir) if cache_dir else None
+    watch_dirs = []
+    for src_dir in args.watch:
+        src_dir = os.path.normpath(src_dir)
+        if args.output and len(args.watch) == 1:
+            out_dir = args.output
+        else:
+            out_dir = os.path.join(args.output or '', os.path.basename(src_dir))
+        watch_dirs.append((src_dir, out_dir))
+        if args.runtime == 'shared':
+            write_runtime(out_dir)
+    options = translator_options(args)
+    serve(
+        Translator(cache=cache, **options),
+        socket_path=args.socket,
+        watch_dirs=watch_dirs,
+        cache_dir=cache_dir,
+        options=options
     )
-    return parser.parse_args()
 
 
 def run():
     args = parse_args()
+    if args.serve:
+        return run_server(args)
+    if args.bundle:
+        if os.path.isdir(args.src_file):
+            sys.exit("--bundle needs an entry file")
+        sys.exit(run_bundle(args))
+    if os.path.isdir(args.src_file):
+        if args.profile:
+            sys.exit("--profile is supported for single files only")
+        sys.exit(run_project(args))
     out_file = args.output
     if not out_file:
         out_file = os.path.basename(args.src_file).split('.')[0] + '.lua'
-    translator = Translator(out_file=out_file)
-    translator.translate(open(args.src_file).read())
+    stats = [] if args.opt_stats else None
+    profile = NodeProfile() if args.profile else None
+    cache = None if args.no_cache or args.opt_stats or profile else TranslationCache(args.cache_dir)
+    options = translator_options(args)
+    # minified code is written here to report its size
+    translator = Translator(
+        out_file=None if args.minify else out_file, cache=cache, collectors=[profile] if profile else (),
+        **dict(options, minify=None)
+    )
+    source = open(args.src_file).read()
+    code = translator.translate(source, stats=stats)
+    if args.minify:
+        write_minified(code, out_file, args.minify)
+    if args.runtime == 'shared':
+        write_runtime(os.path.dirname(out_file))
+    if stats is not None:
+        print(format_stats(stats))
+    if profile is not None:
+        print(profile.to_json() if args.profile == 'json' else format_profile(profile))
+    if args.type_report:
+        report = type_report(source)
+        print("Specialized {} of {} additions: {} numeric, {} string".format(
+            report['number'] + report['string'], report['sites'], report['number'], report['string']
+        ))
 
 
 if __name__ == '__main__':
@@ -0,0 +1,184 @@
+import os
+import sys
+import json
+import threading
+import socketserver
+
+from .cache import TranslationCache
+from .project import find_sources, lua_path, translate_file
+from .translator import Translator
+
+
+POLL_INTERVAL = 0.5
+
+
+def error_info(e):
+    """
+    Returns JSON-serializable description of translation error
+    """
+    info = {'type': e.__class__.__name__, 'message': str(e)}
+    if isinstance(e, SyntaxError):
+        info.update(message=e.msg, lineno=e.lineno, offset=e.offset)
+    return info
+
+
+def handle_request(translator, line):
+    """
+    Handles a single JSON request line.
+
+    Request is an object with `source` (python code) or `path` (python
+    file) and optional `id` and `out_file` fields. Response has the same
+    `id`, `ok` flag and either `lua` code or `error` description
+    """
+    try:
+        request = json.loads(line)
+        if not isinstance(request, dict):
+            raise ValueError("request must be a JSON object")
+    except ValueError as e:
+        return {'id': None, 'ok': False, 'error': {'type': 'ProtocolError', 'message': str(e)}}
+
+    response = {'id': request.get('id'), 'ok': True}
+    try:
+        if 'path' in request:
+            with open(request['path']) as src:
+                source = src.read()
+        elif 'source' in request:
+            source = request['source']
+        else:
+            raise ValueError("request must have 'source' or 'path'")
+        lua = translator.translate(source)
+        if request.get('out_file'):
+            with open(request['out_file'], 'w') as out:
+                out.write(lua)
+        else:
+            response['lua'] = lua
+    except Exception as e:
+        response['ok'] = False
+        response['error'] = error_info(e)
+    return response
+
+
+def serve_stream(translator, rfile, wfile, lock=None):
+    """
+    Serves JSON-lines requests from rfile until EOF
+    """
+    lock = lock or threading.Lock()
+    for line in rfile:
+        if not line.strip():
+            continue
+        response = json.dumps(handle_request(translator, line))
+        with lock:
+            wfile.write(response + '\n')
+            wfile.flush()
+
+
+class _TextWriter:
+    __slots__ = ('_raw',)
+
+    def __init__(self, raw):
+        self._raw = raw
+
+    def write(self, s):
+        self._raw.write(s.encode())
+
+    def flush(self):
+        self._raw.flush()
+
+
+class _RequestHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        rfile = (line.decode() for line in self.rfile)
+        wfile = _TextWriter(self.wfile)
+        serve_stream(self.server.translator, rfile, wfile)
+
+
+class UnixServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, path, translator):
+        if os.path.exists(path):
+            os.remove(path)
+        self.translator = translator
+        super().__init__(path, _RequestHandler)
+
+    def server_close(self):
+        super().server_close()
+        if os.path.exists(self.server_address):
+            os.remove(self.server_address)
+
+
+class Watcher(threading.Thread):
+    """
+    Polls source directories and retranslates changed python files.
+
+    Each entry of `dirs` is a (src_dir, out_dir) pair. Results are reported
+    as JSON lines written to `events`
+    """
+    def __init__(self, dirs, events=None, interval=POLL_INTERVAL, cache_dir=None, options=None):
+        super().__init__(daemon=True)
+        self.dirs = dirs
+        self.events = events or sys.stderr
+        self.interval = interval
+        self.cache = TranslationCache(cache_dir) if cache_dir else None
+        self.options = options
+        self._mtimes = {}
+        self._stop_event = threading.Event()
+        self.scan()
+
+    def scan(self):
+        """
+        Returns list of (src_file, out_file) pairs changed since the last scan
+        """
+        changed = []
+        for src_dir, out_dir in self.dirs:
+            for rel_path in find_sources(src_dir):
+                src_file = os.path.join(src_dir, rel_path)
+                try:
+                    mtime = os.stat(src_file).st_mtime_ns
+                except FileNotFoundError:
+                    continue
+                if self._mtimes.get(src_file) != mtime:
+                    self._mtimes[src_file] = mtime
+                    changed.append((src_file, os.path.join(out_dir, lua_path(rel_path))))
+        return changed
+
+    def poll(self):
+        for src_file, out_file in self.scan():
+            result = translate_file(src_file, out_file, self.cache, self.options)
+            event = {'event': 'translated', 'src_file': src_file, 'out_file': out_file, 'ok': result.ok}
+            if not result.ok:
+                event['error'] = result.error
+            self.events.write(json.dumps(event) + '\n')
+            self.events.flush()
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            self.poll()
+
+    def stop(self):
+        self._stop_event.set()
+
+
+def serve(translator=None, socket_path=None, watch_dirs=(), cache_dir=None, options=None):
+    """
+    Runs translation server on stdin/stdout or on a unix socket,
+    optionally watching source directories. Options are translator keyword
+    arguments used for watched files
+    """
+    translator = translator or Translator()
+    watcher = None
+    if watch_dirs:
+        watcher = Watcher(watch_dirs, cache_dir=cache_dir, options=options)
+        watcher.start()
+    try:
+        if socket_path:
+            with UnixServer(socket_path, translator) as server:
+                try:
+                    server.serve_forever()
+                except KeyboardInterrupt:
+                    pass
+        else:
+            serve_stream(translator, sys.stdin, sys.stdout)
+    finally:
+        if watcher is not None:
+            watcher.stop()
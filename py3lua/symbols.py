@@ -0,0 +1,320 @@
+import ast
+
+
+FUNCTION_NODES = (ast.FunctionDef, ast.AsyncFunctionDef)
+COMPREHENSION_NODES = (ast.ListComp, ast.SetComp, ast.DictComp, ast.GeneratorExp)
+# fields which never hold names
+LEAF_FIELDS = frozenset(['ctx', 'op', 'ops', 'kind', 'type_comment', 'value_type'])
+_child_fields = {}
+
+
+def child_fields(node_class):
+    try:
+        return _child_fields[node_class]
+    except KeyError:
+        fields = tuple(f for f in node_class._fields if f not in LEAF_FIELDS)
+        _child_fields[node_class] = fields
+        return fields
+
+
+def namespace_decorator(tree):
+    """
+    Returns namespace given to a function by @ns("name") decorator or None
+    """
+    for dec in tree.decorator_list:
+        if isinstance(dec, ast.Call) and isinstance(dec.func, ast.Name) and dec.func.id == 'ns':
+            return dec.args[0].value
+    return None
+
+
+def param_names(tree):
+    args = tree.args
+    names = [a.arg for a in args.posonlyargs + args.args + args.kwonlyargs]
+    for a in (args.vararg, args.kwarg):
+        if a is not None:
+            names.append(a.arg)
+    return names
+
+
+def loop_target_names(target):
+    """
+    Returns names bound by a for loop target which is a name or a tuple of
+    names, lua loops bind them as locals of the loop, otherwise None
+    """
+    if target.__class__ is ast.Name:
+        return [target.id]
+    if target.__class__ is ast.Tuple and all(elt.__class__ is ast.Name for elt in target.elts):
+        return [elt.id for elt in target.elts]
+    return None
+
+
+class SymbolTable:
+    """
+    Names of a module or a function scope.
+
+    `names` maps names bound in the scope to lua expressions they are
+    translated to, names of enclosing scopes are copied there on the first
+    lookup so that resolution is a single dict lookup. `declared` holds statements and import aliases which
+    declare a new lua local, `predeclared` lists locals which are declared
+    at the beginning of the scope because they are bound in nested blocks
+    or referred to before their first assignment. `bound` of the table of
+    the root scope has all names bound anywhere in the tree and '*' when
+    it has star imports. `generator` tells that the scope is a generator
+    function
+    """
+    __slots__ = ('node', 'parent', 'names', 'declared', 'predeclared', 'bound', 'generator')
+
+    def __init__(self, node, parent=None):
+        self.node = node
+        self.parent = parent
+        self.names = {}
+        self.declared = set()
+        self.predeclared = []
+        self.bound = frozenset()
+        self.generator = False
+
+    def resolve(self, name):
+        try:
+            return self.names[name]
+        except KeyError:
+            value = self.parent.resolve(name) if self.parent is not None else name
+            self.names[name] = value
+            return value
+
+
+class _Bindings:
+    """
+    Names bound directly in a scope and names which every statement of
+    the scope body refers to, bodies of nested functions and classes are
+    not entered. Names bound by lambdas and comprehensions are kept apart
+    in `inner` as they are not locals of the scope. Methods of classes are
+    scopes nested in the scope defining the class, names they refer to
+    count as mentioned by the class statement
+    """
+    __slots__ = (
+        'assigned', 'loop_targets', 'globals', 'nonlocals', 'functions', 'classes', 'methods', 'mentions', 'free',
+        'inner', 'star_import', 'generator'
+    )
+
+    def __init__(self):
+        self.assigned = set()
+        self.loop_targets = set()
+        self.globals = set()
+        self.nonlocals = set()
+        self.functions = []
+        self.classes = []
+        self.methods = []
+        self.mentions = []
+        self.free = set()
+        self.inner = set()
+        self.star_import = False
+        self.generator = False
+
+    def scan(self, tree, names, functions):
+        stack = [tree]
+        while stack:
+            node = stack.pop()
+            node_class = node.__class__
+            if node_class is ast.Name:
+                names.add(node.id)
+                if node.ctx.__class__ is not ast.Load:
+                    self.assigned.add(node.id)
+                continue
+            if node_class is ast.FunctionDef or node_class is ast.AsyncFunctionDef:
+                names.add(node.name)
+                self.functions.append(node)
+                functions.append(node)
+                stack.extend(node.decorator_list)
+                stack.extend(d for d in node.args.defaults + node.args.kw_defaults if d is not None)
+                continue
+            if node_class is ast.ClassDef:
+                names.add(node.name)
+                self.classes.append(node)
+                stack.extend(node.decorator_list)
+                stack.extend(node.bases)
+                for stmt in node.body:
+                    if isinstance(stmt, FUNCTION_NODES):
+                        self.methods.append(stmt)
+                        functions.append(stmt)
+                        stack.extend(stmt.decorator_list)
+                        stack.extend(d for d in stmt.args.defaults + stmt.args.kw_defaults if d is not None)
+                    elif isinstance(stmt, ast.Assign):
+                        stack.append(stmt.value)
+                continue
+            if node_class is ast.For and loop_target_names(node.target):
+                for name in loop_target_names(node.target):
+                    names.add(name)
+                    self.loop_targets.add(name)
+                stack.append(node.iter)
+                stack.extend(node.body)
+                stack.extend(node.orelse)
+                continue
+            if node_class is ast.alias:
+                if node.name != '*':
+                    name = (node.asname or node.name).split('.')[0]
+                    names.add(name)
+                    self.assigned.add(name)
+                else:
+                    self.star_import = True
+                continue
+            if node_class in COMPREHENSION_NODES:
+                for gen in node.generators:
+                    for target in ast.walk(gen.target):
+                        if target.__class__ is ast.Name:
+                            names.add(target.id)
+                            self.inner.add(target.id)
+                    stack.append(gen.iter)
+                    stack.extend(gen.ifs)
+                stack.extend(getattr(node, f) for f in ('elt', 'key', 'value') if hasattr(node, f))
+                continue
+            if node_class is ast.arg:
+                self.inner.add(node.arg)
+                continue
+            if node_class is ast.Global or node_class is ast.Nonlocal:
+                names.update(node.names)
+                (self.globals if node_class is ast.Global else self.nonlocals).update(node.names)
+                continue
+            if node_class is ast.Constant:
+                continue
+            if node_class is ast.Yield or node_class is ast.YieldFrom:
+                self.generator = True
+            if node_class is ast.ExceptHandler and node.name:
+                names.add(node.name)
+                self.assigned.add(node.name)
+            for field in child_fields(node_class):
+                value = getattr(node, field, None)
+                if value.__class__ is list:
+                    stack.extend(v for v in value if isinstance(v, ast.AST))
+                elif isinstance(value, ast.AST):
+                    stack.append(value)
+
+
+def _bindings(tree, found):
+    """
+    Collects bindings of tree and functions nested in it. Names which
+    a nested function refers to but doesn't bind count as mentioned by
+    the statement defining the function
+    """
+    bindings = _Bindings()
+    found[tree] = bindings
+    nested = []
+    for stmt in getattr(tree, 'body', ()):
+        names = set()
+        functions = []
+        bindings.scan(stmt, names, functions)
+        bindings.mentions.append(names)
+        nested.append(functions)
+    for names, functions in zip(bindings.mentions, nested):
+        for func in functions:
+            names |= _bindings(func, found).free
+    if isinstance(tree, FUNCTION_NODES):
+        own = bindings.assigned | bindings.loop_targets | _defined_names(bindings)
+        own = (own | set(param_names(tree))) - bindings.globals - bindings.nonlocals
+        bindings.free = set().union(*bindings.mentions) - own
+    return bindings
+
+
+def _defined_names(bindings):
+    return {f.name for f in bindings.functions} | {c.name for c in bindings.classes}
+
+
+def _first_mentions(mentions):
+    """
+    Maps names to index of the first statement which refers to them
+    """
+    first = {}
+    for i, names in enumerate(mentions):
+        for name in names:
+            first.setdefault(name, i)
+    return first
+
+
+def _declare(table, body, to_declare, mentions):
+    first = _first_mentions(mentions)
+    inline = set()
+    for i, stmt in enumerate(body):
+        if isinstance(stmt, ast.Assign):
+            targets = [t.id for t in stmt.targets if isinstance(t, ast.Name)]
+            if len(targets) == len(stmt.targets) and \
+                    all(name in to_declare and first[name] == i for name in targets):
+                table.declared.add(stmt)
+                inline.update(targets)
+        elif isinstance(stmt, (ast.Import, ast.ImportFrom)):
+            for alias in stmt.names:
+                name = (alias.asname or alias.name).split('.')[0]
+                dotted = alias.asname is None and '.' in alias.name
+                if name in to_declare and first[name] == i and name not in inline and not dotted:
+                    table.declared.add(alias)
+                    inline.add(name)
+        elif isinstance(stmt, FUNCTION_NODES + (ast.ClassDef,)):
+            if stmt.name in to_declare and first[stmt.name] == i and stmt.name not in inline:
+                table.declared.add(stmt)
+                inline.add(stmt.name)
+    last = len(body)
+    table.predeclared = sorted(to_declare - inline, key=lambda name: (first.get(name, last), name))
+
+
+def _build(tree, parent, bindings, module_prefix, module_globals, tables):
+    b = bindings[tree]
+    table = SymbolTable(tree, parent)
+    table.generator = b.generator
+    is_module = isinstance(tree, ast.Module)
+    outer = b.globals | b.nonlocals
+    params = set() if is_module else set(param_names(tree))
+    namespaced = {}
+    for func in b.functions:
+        namespace = namespace_decorator(func)
+        if namespace is None and is_module:
+            namespace = module_prefix
+        if namespace:
+            namespaced[func.name] = namespace + '.' + func.name
+    if is_module:
+        # classes are exported like functions
+        for cls in b.classes:
+            namespaced[cls.name] = module_prefix + '.' + cls.name
+    to_declare = b.assigned | _defined_names(b)
+    if is_module:
+        to_declare |= module_globals
+    to_declare -= outer | params | set(namespaced)
+    for name in to_declare | params | (b.loop_targets - outer):
+        table.names[name] = name
+    table.names.update(namespaced)
+    if b.globals and parent is not None:
+        module = parent
+        while module.parent is not None:
+            module = module.parent
+        for name in b.globals:
+            table.names[name] = module.resolve(name)
+    _declare(table, getattr(tree, 'body', []), to_declare, b.mentions)
+    tables[tree] = table
+    for func in b.functions + b.methods:
+        _build(func, table, bindings, module_prefix, module_globals, tables)
+
+
+def build_symbols(tree, module_prefix='M', parent=None):
+    """
+    Builds symbol tables of a module or a function and of all functions
+    nested in it, returns a dict mapping scope nodes to their tables.
+
+    Functions defined at module level are translated to fields of the
+    module table module_prefix, names assigned by functions which declare
+    them global become locals of the module
+    """
+    bindings = {}
+    _bindings(tree, bindings)
+    module_globals = set()
+    if isinstance(tree, ast.Module):
+        for node, b in bindings.items():
+            if node is not tree:
+                module_globals |= b.globals & (b.assigned | _defined_names(b))
+    tables = {}
+    _build(tree, parent, bindings, module_prefix, module_globals, tables)
+    bound = set()
+    for node, b in bindings.items():
+        bound |= b.assigned | b.loop_targets | b.inner | _defined_names(b)
+        if isinstance(node, FUNCTION_NODES):
+            bound.update(param_names(node))
+        if b.star_import:
+            bound.add('*')
+    tables[tree].bound = frozenset(bound)
+    return tables
@@ -0,0 +1,25 @@
+class Target:
+    """
+    Lua version generated code runs on.
+
+    bit_library names the library of bitwise functions of versions
+    without bitwise operators, floor_div tells that the // operator exists
+    and table_new that tables can be preallocated with table.new
+    """
+    __slots__ = ('name', 'bit_library', 'floor_div', 'table_new')
+
+    def __init__(self, name, bit_library=None, floor_div=False, table_new=False):
+        self.name = name
+        self.bit_library = bit_library
+        self.floor_div = floor_div
+        self.table_new = table_new
+
+
+TARGETS = {
+    'luajit': Target('luajit', bit_library='bit', table_new=True),
+    # bit is the LuaBitOp module, which has the same functions as in luajit
+    '5.1': Target('5.1', bit_library='bit'),
+    '5.3': Target('5.3', floor_div=True),
+    '5.4': Target('5.4', floor_div=True),
+}
+DEFAULT_TARGET = 'luajit'
@@ -1,76 +1,55 @@
 import ast
 import operator
-from functools import reduce
-
-
-STDLIB = """
--- standard library code
-
-local function _add_op(a, b)
-    if type(a) == "string" then
-        return a .. b
-    else
-        return a + b
-    end
-end
-
-function list(...)
-    local lst = {}
-  
-    function lst.append(elt)
-        table.insert(lst, elt)
-    end
-
-    function lst.iter()
-        i = 0
-        return function()
-            i = i + 1
-            local v = lst[i]
-            if v then
-                return v
-            end
-        end, lst, 0
-    end
-
-    for i, v in ipairs({...}) do
-        lst[i] = v
-    end
-
-    return lst
-end
-
-function range(...)
-    local lst = list()
-    args = {...}
-    if #args == 1 then
-        start = 0
-        end_ = args[1] - 1
-        step = 1
-    elseif #args == 2 then
-        start = args[1]
-        end_ = args[2] - 1
-        if start > end_ then
-          step = -1
-        else
-          step = 1
-        end
-    else
-        start = args[1]
-        end_ = args[2] - 1
-        step = args[3]
-    end
-
-    for i=start, end_, step do
-        lst.append(i)
-    end
-
-    return lst
-end
-
--- generated code
-
-"""
+import threading
+
+from .classes import METAMETHODS, ClassLayout, class_layouts, instance_names, slot_names
+from .emitter import Emitter
+from .inference import TypeInference, NUMBER, STRING
+from .minifier import LUA_KEYWORDS, MINIFY_MODES, minify
+from .optimizer import Optimizer
+from .targets import TARGETS, DEFAULT_TARGET
+from .symbols import build_symbols, namespace_decorator
+from .runtime import (
+    STDLIB, RUNTIME_MODES, MEMOIZERS, DICT_METHODS, runtime_code, runtime_import, runtime_parts, runtime_refs
+)
+
+
 TAB_SPACES = 4
+BIN_OPS = {
+    ast.Sub: '-',
+    ast.Mult: '*',
+    ast.Div: '/',
+    ast.Mod: '%',
+    ast.Pow: '^',
+    ast.FloorDiv: '//'
+}
+LUA_MODULES = frozenset([
+    'bit', 'bit32', 'coroutine', 'debug', 'io', 'math', 'os', 'package', 'string', 'table', 'utf8'
+])
+PREFIX_EXPRS = (ast.Name, ast.Attribute, ast.Call, ast.Subscript)
+BIT_OPS = {
+    ast.LShift: 'lshift',
+    # python shifts right keeping the sign
+    ast.RShift: 'arshift',
+    ast.BitOr: 'bor',
+    ast.BitXor: 'bxor',
+    ast.BitAnd: 'band',
+}
+NATIVE_BIT_OPS = {
+    ast.LShift: '<<',
+    ast.BitOr: '|',
+    ast.BitXor: '~',
+    ast.BitAnd: '&',
+}
+# builtins consuming a comprehension passed to them in the same loop
+FUSED_BUILTINS = frozenset(['sum', 'any', 'all', 'max', 'min'])
+LRU_CACHE_MAXSIZE = 128
+COMPREHENSIONS = {ast.ListComp: 'list', ast.GeneratorExp: 'list', ast.SetComp: 'set', ast.DictComp: 'dict'}
+LITERAL_TYPES = (
+    (ast.Str, str),
+    (ast.Bytes, str),
+    (ast.Num, int),
+)
 
 
 class TranslatorException(Exception):
@@ -86,113 +65,531 @@ class InvalidBinOp(TranslatorException):
 
 
 def indent(func):
-    def wrapper(*args, **kwargs):
-        indent_level = kwargs.get('indent_level', 0)
-        kwargs['indent_level'] = 0
-        return ' ' * indent_level * TAB_SPACES + func(*args, **kwargs)
+    def wrapper(self, tree, ctx=None):
+        if ctx is None:
+            ctx = Context()
+        indent_level = ctx.indent_level
+        if not indent_level:
+            return func(self, tree, ctx)
+        line_level = ctx.line_level
+        ctx.indent_level, ctx.line_level = 0, indent_level
+        res = func(self, tree, ctx)
+        ctx.indent_level, ctx.line_level = indent_level, line_level
+        return ' ' * indent_level * TAB_SPACES + res if res else res
 
     return wrapper
 
 
-class Env:
-    __slots__ = ('namespace', '_maps', 'parent', 'child', 'globals')
+def literal_type(tree):
+    """
+    Returns python type of a literal node or None for non-literals
+    """
+    for node_type, value_type in LITERAL_TYPES:
+        if isinstance(tree, node_type):
+            return value_type
+    return None
+
 
-    def __init__(self, namespace=''):
-        self.namespace = namespace
-        self._maps = {}
-        self.globals = set()
-        self.child = None
-        self.parent = None
+def is_lua_name(value):
+    """
+    Checks that value is a string which can be a field name in lua code
+    """
+    return isinstance(value, str) and value.isidentifier() and value.isascii() and value not in LUA_KEYWORDS
 
-    def set(self, name, val):
-        self._maps[name] = val
 
-    def get(self, name):
-        return self._maps.get(name, None)
+def literal_int(tree):
+    """
+    Returns value of an integer literal node (possibly negated) or None
+    """
+    negate = False
+    if isinstance(tree, ast.UnaryOp) and isinstance(tree.op, ast.USub):
+        negate = True
+        tree = tree.operand
+    if literal_type(tree) is not int or not isinstance(tree.n, int) or isinstance(tree.n, bool):
+        return None
+    return -tree.n if negate else tree.n
 
-    def add_child(self, env):
-        self.child = env
-        env.parent = self
+
+def is_fused_join(tree):
+    """
+    Checks that tree is a "sep".join() call of a single comprehension
+    """
+    return is_str_join(tree) and isinstance(tree.args[0], (ast.GeneratorExp, ast.ListComp))
+
+
+def is_str_join(tree):
+    """
+    Checks that tree is a "sep".join() call with a single argument
+    """
+    return (
+        isinstance(tree, ast.Call) and isinstance(tree.func, ast.Attribute) and tree.func.attr == 'join' and
+        isinstance(tree.func.value, ast.Constant) and isinstance(tree.func.value.value, str) and
+        len(tree.args) == 1 and not tree.keywords and not isinstance(tree.args[0], ast.Starred)
+    )
+
+
+def accumulation(tree):
+    """
+    Returns (name node, pieces) of `s = s + x + ...` statement which
+    extends variable s, otherwise None
+    """
+    if isinstance(tree, ast.Assign) and len(tree.targets) == 1 and isinstance(tree.targets[0], ast.Name):
+        pieces = []
+        value = tree.value
+        while isinstance(value, ast.BinOp) and isinstance(value.op, ast.Add):
+            pieces.append(value.right)
+            value = value.left
+        if pieces and isinstance(value, ast.Name) and value.id == tree.targets[0].id:
+            pieces.reverse()
+            return value, pieces
+    return None
+
+
+def string_accumulations(tree, types):
+    """
+    Maps for loops to `s = s + x` statements nested in them whose
+    additions types (TypeInference of the tree) tell to be string
+    concatenations
+    """
+    if not any(types.add_type(site) == STRING for site in types.sites):
+        return {}
+    loops = {}
+    stack = [(tree, ())]
+    while stack:
+        node, fors = stack.pop()
+        node_class = node.__class__
+        if node_class is ast.Assign:
+            if fors and accumulation(node) is not None and types.add_type(node.value) == STRING:
+                for loop in fors:
+                    loops.setdefault(loop, []).append(node)
+            continue
+        if node_class is ast.For:
+            fors += (node,)
+        stack.extend((child, fors) for child in ast.iter_child_nodes(node))
+    return loops
+
+
+def shared_names(scope):
+    """
+    Returns names declared global or nonlocal in a scope node and names
+    which functions nested in it refer to
+    """
+    names = set()
+    for node in ast.walk(scope):
+        if isinstance(node, (ast.Global, ast.Nonlocal)):
+            names.update(node.names)
+        elif isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.Lambda)) and node is not scope:
+            names.update(n.id for n in ast.walk(node) if isinstance(n, ast.Name))
+    return names
+
+
+def imported_names(tree):
+    """
+    Returns names bound by imports in the tree
+    """
+    names = set()
+    for node in ast.walk(tree):
+        if isinstance(node, (ast.Import, ast.ImportFrom)):
+            names.update((a.asname or a.name).split('.')[0] for a in node.names)
+    return names
+
+
+def dotted_name(tree):
+    """
+    Returns 'a.b' of a name or an attribute of a name, otherwise None
+    """
+    if isinstance(tree, ast.Name):
+        return tree.id
+    if isinstance(tree, ast.Attribute) and isinstance(tree.value, ast.Name):
+        return tree.value.id + '.' + tree.attr
+    return None
+
+
+def memoizer_names(tree):
+    """
+    Maps names which refer to functools.cache and functools.lru_cache
+    after imports at module level to the decorator, and names of imported
+    functools which are used only for them to None
+    """
+    names = {}
+    modules = set()
+    for node in getattr(tree, 'body', ()):
+        if isinstance(node, ast.ImportFrom) and node.module == 'functools':
+            for alias in node.names:
+                if alias.name in MEMOIZERS:
+                    names[alias.asname or alias.name] = alias.name
+        elif isinstance(node, ast.Import):
+            for alias in node.names:
+                if alias.name == 'functools':
+                    modules.add(alias.asname or alias.name)
+                    for name in MEMOIZERS:
+                        names[(alias.asname or alias.name) + '.' + name] = name
+    if modules:
+        # loads of the module name which are not memoizer attributes
+        other_uses = dict.fromkeys(modules, 0)
+        for node in ast.walk(tree):
+            if isinstance(node, ast.Name) and node.id in modules:
+                other_uses[node.id] += 1
+            elif isinstance(node, ast.Attribute) and isinstance(node.value, ast.Name) and \
+                    node.value.id in modules and node.attr in MEMOIZERS:
+                other_uses[node.value.id] -= 1
+        for name, count in other_uses.items():
+            if count == 0:
+                names[name] = None
+    return names
+
+
+def temp_namer(tree, taken):
+    """
+    Returns function making names of temporary locals from a base name,
+    the names differ from `taken` names and from names used in the tree
+    """
+    taken = set(taken)
+    taken.update(node.id for node in ast.walk(tree) if isinstance(node, ast.Name))
+
+    def temp(base):
+        name = '_' + base
+        i = 1
+        while name in taken:
+            name = '_{}{}'.format(base, i)
+            i += 1
+        taken.add(name)
+        return name
+
+    return temp
+
+
+def library_refs(tree, types=None, target=None):
+    """
+    Returns (library, function) pairs of lua library functions which
+    translation of the tree for target (the default one when None) may
+    reference. With types (TypeInference of the tree) string accumulations
+    which may be collected in buffers are taken into account
+    """
+    if target is None:
+        target = TARGETS[DEFAULT_TARGET]
+    bit_library = target.bit_library
+    refs = set()
+    for node in ast.walk(tree):
+        if isinstance(node, ast.BinOp):
+            op_class = node.op.__class__
+            if op_class in BIT_OPS:
+                if bit_library:
+                    refs.add((bit_library, BIT_OPS[op_class]))
+            elif op_class is ast.Mult and literal_type(node.left) is str:
+                refs.add(('string', 'rep'))
+            elif op_class is ast.FloorDiv and not target.floor_div:
+                refs.add(('math', 'floor'))
+        elif isinstance(node, ast.UnaryOp) and isinstance(node.op, ast.Invert):
+            if bit_library:
+                refs.add((bit_library, 'bnot'))
+        elif isinstance(node, ast.Yield):
+            refs.add(('coroutine', 'yield'))
+        elif isinstance(node, ast.Assign) and types is not None and accumulation(node) is not None:
+            if types.add_type(node.value) == STRING:
+                refs.add(('table', 'concat'))
+        elif isinstance(node, ast.Call) and isinstance(node.func, ast.Attribute):
+            value = node.func.value
+            if isinstance(value, ast.Name) and value.id in LUA_MODULES:
+                refs.add((value.id, node.func.attr))
+            elif is_fused_join(node):
+                refs.add(('table', 'concat'))
+    return refs
+
+
+def hoisted_names(tree, bound=frozenset(), types=None, target=None):
+    """
+    Maps library functions referenced in the tree to names of module
+    locals holding them. Functions whose library or local name is bound
+    by the module are left out, they are looked up at every call
+    """
+    if '*' in bound:
+        return {}
+    hoisted = {}
+    for lib, func in library_refs(tree, types, target):
+        name = lib + '_' + func
+        if lib not in bound and name not in bound:
+            hoisted[lib, func] = name
+    return hoisted
+
+
+class Context:
+    """
+    Translation state shared by visitors.
+
+    A single context is passed down the tree; visitors which change
+    a field restore it before returning
+    """
+    __slots__ = (
+        'indent_level', 'scope', 'symbols', 'module_prefix', 'from_mod', 'bound_names', 'modules', 'types',
+        'library', 'line_level', 'memoizers', 'buffers', 'accumulations', 'classes', 'instances', 'method',
+        'submodules'
+    )
+
+    def __init__(self, indent_level=0, scope=None, symbols=None, module_prefix=None, from_mod=None,
+                 bound_names=frozenset(), modules=frozenset(), types=None, library=None, memoizers=None,
+                 buffers=None, accumulations=None, classes=None, instances=None, submodules=frozenset()):
+        self.indent_level = indent_level
+        # indentation of the statement being translated, used by
+        # expressions which span several lines
+        self.line_level = indent_level
+        self.memoizers = memoizers or {}
+        # string variables collected in table buffers by enclosing loops,
+        # mapped to names of the buffer and of its length
+        self.buffers = buffers or {}
+        self.accumulations = accumulations or {}
+        # layouts of classes by name and of instances held by names of
+        # the scope, see classes.py
+        self.classes = classes or {}
+        self.instances = instances or {}
+        # (class layout, name of the first parameter) of the method being
+        # translated
+        self.method = None
+        self.scope = scope
+        self.symbols = symbols or {}
+        self.module_prefix = module_prefix
+        self.from_mod = from_mod
+        self.bound_names = bound_names
+        self.modules = modules
+        self.types = types
+        self.library = library or {}
+        # dotted names of modules which `from package import name` imports
+        # are known to refer to
+        self.submodules = submodules
 
 
 class Translator:
     """
-    Main translator class
+    Main translator class.
+
+    runtime selects how runtime helpers get into generated modules:
+    'full' inlines the whole runtime, 'used' inlines only parts the module
+    refers to and 'shared' requires them from the py3lua_runtime module.
+
+    collectors are profiler.Collector instances notified about every
+    visited node, without them visiting has no instrumentation overhead.
+
+    target names the lua version of generated code, one of targets.TARGETS
+
+    minify is None for readable code, 'compact' for code without comments,
+    needless whitespace and parentheses and 'names' to also rename locals.
+
+    State of a translation lives in its Context, so one instance can
+    translate in several threads at once. Collectors keep a stack of
+    visited nodes, translations of an instance with collectors take turns.
+    Instances can be pickled to be sent to worker processes, collectors
+    of a copy don't report to the original ones
     """
-    def __init__(self, out_file=None):
+    def __init__(self, out_file=None, cache=None, opt_level=0, passes=None, runtime='full', collectors=(),
+                 target=DEFAULT_TARGET, minify=None):
+        if runtime not in RUNTIME_MODES:
+            raise ValueError("runtime must be one of: {}".format(', '.join(RUNTIME_MODES)))
+        if target not in TARGETS:
+            raise ValueError("target must be one of: {}".format(', '.join(TARGETS)))
+        if minify is not None and minify not in MINIFY_MODES:
+            raise ValueError("minify must be one of: {}".format(', '.join(MINIFY_MODES)))
+        self._minify = minify
+        self._target = TARGETS[target]
         self._out = out_file
+        self._cache = cache
+        self._runtime = runtime
+        self._optimizer = Optimizer(opt_level, passes)
+        self._dispatch = {}
+        self._op_dispatch = {}
+        self._collectors = tuple(collectors)
+        self._visit_lock = threading.RLock()
+        if self._collectors:
+            self.visit = self._instrumented_visit
+
+    def __getstate__(self):
+        state = dict(self.__dict__, _dispatch={}, _op_dispatch={})
+        del state['_visit_lock']
+        state.pop('visit', None)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._visit_lock = threading.RLock()
+        if self._collectors:
+            self.visit = self._instrumented_visit
 
     def _output_line(self, line):
         return line + '\n'
 
     def _out_fmt(self, *args, delimiter=''):
-        fmt_str = delimiter.join(['{}' for _ in args])
-        return fmt_str.format(*args)
+        return delimiter.join(map(str, args))
 
-    def _translate_Module(self, tree, **kwargs):
-        env = Env(namespace='M')
-        mod_begin = self._output_line("local M = {}")
+    def _op_meth(self, op):
+        op_class = op.__class__
+        try:
+            return self._op_dispatch[op_class]
+        except KeyError:
+            op_meth = getattr(self, '_op_' + op_class.__name__, None)
+            self._op_dispatch[op_class] = op_meth
+            return op_meth
+
+    def _library(self, lib, func, ctx=None):
+        """
+        Returns expression referring to a lua library function, a module
+        local when the function was hoisted
+        """
+        if ctx is not None:
+            name = ctx.library.get((lib, func))
+            if name is not None:
+                return name
+        return lib + '.' + func
+
+    def _translate_body(self, body, ctx):
+        lines = [self.visit(v, ctx) for v in body]
+        return ''.join([line + '\n' for line in lines if line])
+
+    def _emit_Module(self, tree, emitter, submodules=frozenset()):
+        symbols = build_symbols(tree, 'M')
+        bound = symbols[tree].bound
+        types = TypeInference(tree)
+        classes = class_layouts(tree)
+        ctx = Context(
+            scope=symbols.get(tree), symbols=symbols, module_prefix='M',
+            bound_names=bound, modules=imported_names(tree),
+            types=types, library=hoisted_names(tree, bound, types, self._target), memoizers=memoizer_names(tree),
+            accumulations=string_accumulations(tree, types), classes=classes,
+            instances=instance_names(tree, classes) if classes else None, submodules=submodules
+        )
+        emitter.write_line("local M = {}")
+        emitter.write(self._runtime_code(tree, ctx))
+        if ctx.library:
+            for (lib, func), name in sorted(ctx.library.items()):
+                emitter.write_line('local {} = {}.{}'.format(name, lib, func))
+            emitter.write_line()
         try:
             body = tree.body
         except AttributeError:
             body = []
-        mod_body = self._output_line(
-            reduce(
-                lambda a, v: a + self._output_line(self.visit(v, module_prefix="M", env=env)),
-                body, ""
-            )
+        if ctx.scope is not None and ctx.scope.predeclared:
+            emitter.write_line('local ' + ', '.join(ctx.scope.predeclared))
+            emitter.write_line()
+        for v in body:
+            emitter.write_line(self.visit(v, ctx))
+        emitter.write_line()
+        emitter.write_line("return M")
+
+    def _runtime_code(self, tree, ctx):
+        if self._runtime == 'full':
+            return STDLIB
+        refs = runtime_refs(
+            tree, ctx.types, self._target, lambda loop: self._range_args(loop.target, loop.iter, ctx) is not None
         )
-        mod_end = self._output_line("return M")
-        return self._out_fmt(mod_begin, STDLIB, mod_body, mod_end)
+        if self._runtime == 'shared':
+            return runtime_import(refs)
+        return runtime_code(runtime_parts(refs))
+
+    def _translate_Module(self, tree, ctx=None):
+        emitter = Emitter()
+        self._emit_Module(tree, emitter, ctx.submodules if ctx is not None else frozenset())
+        return emitter.getvalue()
 
-    def _translate_Global(self, tree, **kwargs):
-        env = kwargs.get('env', Env())
-        env.globals = set(tree.names)
+    def _translate_Global(self, tree, ctx=None):
         return ''
+    _translate_Nonlocal = _translate_Global
+
+    def _declares(self, tree, ctx):
+        """
+        Checks that a binding statement declares a new local, without
+        symbol tables every binding does
+        """
+        return ctx.scope is None or tree in ctx.scope.declared
 
     @indent
-    def _translate_Assign(self, tree, **kwargs):
-        non_local = kwargs.get('non_local', False)
-        var_names = [t.id for t in tree.targets]
-        global_ = bool(set(var_names).intersection(kwargs.get('env', Env()).globals))
-        targets = ','.join(var_names)
-        values = ','.join([self.visit(tree.value, **kwargs) for _ in tree.targets])
-        return self._out_fmt('local ' if not non_local and not global_ else '', targets, '=', values)
+    def _translate_Assign(self, tree, ctx):
+        if ctx.buffers and tree.targets[0].__class__ is ast.Name and tree.targets[0].id in ctx.buffers:
+            buf, n = ctx.buffers[tree.targets[0].id]
+            _, pieces = accumulation(tree)
+            lines = [buf + '[' + n + '+' + str(i) + ']=' + self.visit(piece, ctx) for i, piece in enumerate(pieces, 1)]
+            lines.append(n + '=' + n + '+' + str(len(pieces)))
+            return ('\n' + ' ' * ctx.line_level * TAB_SPACES).join(lines)
+        if len(tree.targets) == 1 and isinstance(tree.targets[0], ast.Name):
+            reduction = self._reduction(tree.value, ctx)
+            if reduction is not None:
+                code = self._lower_assign(tree, reduction, ctx)
+                if code is not None:
+                    return code
+        targets = ','.join([t.id if t.__class__ is ast.Name else self.visit(t, ctx) for t in tree.targets])
+        values = ','.join([self.visit(tree.value, ctx)] * len(tree.targets))
+        return self._out_fmt('local ' if self._declares(tree, ctx) else '', targets, '=', values)
 
     @indent
-    def _translate_Return(self, tree, **kwargs):
-        return self._out_fmt('return ' + self.visit(tree.value, **kwargs))
+    def _translate_Return(self, tree, ctx):
+        reduction = self._reduction(tree.value, ctx) if tree.value is not None else None
+        if reduction is not None:
+            return self._lower_block(reduction, ctx, returns=True)
+        return 'return ' + self.visit(tree.value, ctx)
 
     @indent
-    def _translate_Num(self, tree, **kwargs):
+    def _translate_Yield(self, tree, ctx):
+        value = '' if tree.value is None else self.visit(tree.value, ctx)
+        return self._library('coroutine', 'yield', ctx) + '(' + value + ')'
+
+    @indent
+    def _translate_YieldFrom(self, tree, ctx):
+        return '_yield_from(' + self.visit(tree.value, ctx) + ')'
+
+    @indent
+    def _translate_Num(self, tree, ctx):
         return str(tree.n)
 
     @indent
-    def _translate_Str(self, tree, **kwargs):
+    def _translate_Str(self, tree, ctx):
         return '"' + tree.s + '"'
     _translate_Bytes = _translate_Str
 
     @indent
-    def _translate_Name(self, tree, **kwargs):
+    def _translate_NameConstant(self, tree, ctx):
+        if tree.value is None:
+            return 'nil'
+        return 'true' if tree.value else 'false'
+
+    def _translate_Constant(self, tree, ctx=None):
+        if isinstance(tree.value, (str, bytes)):
+            return self._translate_Str(tree, ctx)
+        elif tree.value is None or isinstance(tree.value, bool):
+            return self._translate_NameConstant(tree, ctx)
+        else:
+            return self._translate_Num(tree, ctx)
+
+    @indent
+    def _translate_Name(self, tree, ctx):
+        if ctx.scope is not None and isinstance(tree.ctx, ast.Load):
+            return ctx.scope.resolve(tree.id)
         return tree.id
 
-    def _op_Add(self, left, right):
+    def _op_Add(self, left, right, ctx=None):
         return '_add_op(' + left + ',' + right + ')'
 
-    def _op_LShift(self, left, right):
-        return 'bit.lshift(' + left + ',' + right + ')'
-    
-    def _op_RShift(self, left, right):
-        return 'bit.rshift(' + left + ',' + right + ')'
+    def _bit_op(self, op_class, left, right, ctx):
+        library = self._target.bit_library
+        if library is None:
+            return '(' + left + NATIVE_BIT_OPS[op_class] + right + ')'
+        return self._library(library, BIT_OPS[op_class], ctx) + '(' + left + ',' + right + ')'
 
-    def _op_BitOr(self, left, right):
-        return 'bit.bor(' + left + ',' + right + ')'
-    
-    def _op_BitXor(self, left, right):
-        return 'bit.bxor(' + left + ',' + right + ')'
-    
-    def _op_BitAnd(self, left, right):
-        return 'bit.band(' + left + ',' + right + ')'
+    def _op_LShift(self, left, right, ctx=None):
+        return self._bit_op(ast.LShift, left, right, ctx)
+
+    def _op_RShift(self, left, right, ctx=None):
+        if self._target.bit_library is None:
+            # >> of lua shifts in zeros, floor division keeps the sign
+            shift = int(right) if right.isdigit() else None
+            divisor = str(1 << shift) if shift is not None and shift < 63 else '(1<<' + right + ')'
+            return '(' + left + '//' + divisor + ')'
+        return self._bit_op(ast.RShift, left, right, ctx)
+
+    def _op_BitOr(self, left, right, ctx=None):
+        return self._bit_op(ast.BitOr, left, right, ctx)
+
+    def _op_BitXor(self, left, right, ctx=None):
+        return self._bit_op(ast.BitXor, left, right, ctx)
+
+    def _op_BitAnd(self, left, right, ctx=None):
+        return self._bit_op(ast.BitAnd, left, right, ctx)
 
     def _op_Eq(self):
         return '=='
@@ -218,176 +615,807 @@ class Translator:
     def _op_And(self):
         return 'and'
 
-    def _translate_BoolOp(self, tree, **kwargs):
-        op_meth = getattr(self, '_op_{}'.format(tree.op.__class__.__name__), None)
+    def _translate_BoolOp(self, tree, ctx=None):
+        op_meth = self._op_meth(tree.op)
         if op_meth:
-            return '(' + (' ' + op_meth() + ' ').join([self.visit(v, **kwargs) for v in tree.values]) + ')'
+            return '(' + (' ' + op_meth() + ' ').join([self.visit(v, ctx) for v in tree.values]) + ')'
 
-    def _translate_Expr(self, tree, **kwargs):
-        return self.visit(tree.value, **kwargs)
+    def _translate_Expr(self, tree, ctx=None):
+        if ctx is None:
+            ctx = Context()
+        if self._reduction(tree.value, ctx) is not None:
+            return self._translate_discarded(tree.value, ctx)
+        code = self.visit(tree.value, ctx)
+        statement = code.lstrip(' ')
+        if statement.startswith('('):
+            # lua would take the parenthesis as a call of the previous
+            # statement, ; doesn't help at the start of a block in lua 5.1
+            return code[:len(code) - len(statement)] + 'do local _=' + statement + ' end'
+        return code
 
     @indent
-    def _translate_Call(self, tree, **kwargs):
-        args = ','.join([self.visit(a, **kwargs) for a in tree.args])
-        cur_env = kwargs.get('env', None)
-        arg_list = '(' + args + ')'
-        if isinstance(tree.func, ast.Name) and cur_env:
-            real_name = cur_env.get(tree.func.id)
-            while real_name is None and cur_env.parent:
-                cur_env = cur_env.parent
-                real_name = cur_env.get(tree.func.id)
+    def _translate_discarded(self, tree, ctx):
+        # a function call expression can't start a statement, lua would
+        # take it as arguments of the previous statement
+        return self._lower_block(self._reduction(tree, ctx), ctx)
 
-            return (tree.func.id if real_name is None else real_name) + arg_list
+    @indent
+    def _translate_Call(self, tree, ctx):
+        reduction = self._fused_reduction(tree, ctx)
+        if reduction is not None:
+            return self._lower_expression(reduction, ctx)
+        if is_str_join(tree):
+            return '_join(' + self.visit(tree.func.value, ctx) + ',' + self.visit(tree.args[0], ctx) + ')'
+        args = ','.join([self.visit(a, ctx) for a in tree.args])
+        arg_list = '(' + args + ')'
+        if ctx.method is not None and self._is_super(tree.func, ctx):
+            layout, first = ctx.method
+            if layout.base_expr is None:
+                if tree.func.attr == '__init__':
+                    # object.__init__ does nothing
+                    return ''
+                raise TranslatorException("super() of class {} without a base".format(layout.name))
+            return layout.base_expr + '.' + tree.func.attr + '(' + first + (',' + args if args else '') + ')'
+        if ctx.classes and isinstance(tree.func, ast.Attribute) and isinstance(tree.func.value, ast.Name) and \
+                tree.func.value.id in ctx.classes:
+            # methods called through the class get self as an argument
+            layout = ctx.classes[tree.func.value.id]
+            separator = ':' if tree.func.attr in layout.classmethods else '.'
+            return self.visit(tree.func.value, ctx) + separator + tree.func.attr + arg_list
+        if isinstance(tree.func, ast.Attribute) and not self._is_module(tree.func.value, ctx):
+            receiver = self.visit(tree.func.value, ctx)
+            if tree.func.attr in DICT_METHODS:
+                return '_call(' + receiver + ',"' + tree.func.attr + '"' + (',' + args if args else '') + ')'
+            if not isinstance(tree.func.value, PREFIX_EXPRS):
+                receiver = '(' + receiver + ')'
+            return receiver + ':' + tree.func.attr + arg_list
+        elif isinstance(tree.func, ast.Attribute) and isinstance(tree.func.value, ast.Name) and \
+                (tree.func.value.id, tree.func.attr) in ctx.library:
+            return ctx.library[tree.func.value.id, tree.func.attr] + arg_list
         else:
-            return self.visit(tree.func, **kwargs) + arg_list
+            return self.visit(tree.func, ctx) + arg_list
+
+    def _is_super(self, func, ctx):
+        """
+        Checks that func is an attribute of super() called without arguments
+        or with the class and the first parameter of the method
+        """
+        if not isinstance(func, ast.Attribute) or not self._is_builtin_call(func.value, 'super', ctx):
+            return False
+        args = func.value.args
+        return not args or len(args) == 2 and all(isinstance(a, ast.Name) for a in args) and \
+            args[0].id == ctx.method[0].name and args[1].id == ctx.method[1]
 
-    def _translate_Compare(self, tree, **kwargs):
-        def op_to_str(op):
-            op_meth = getattr(self, '_op_{}'.format(op.__class__.__name__), None)
-            if op_meth:
-                return op_meth()
+    def _is_module(self, tree, ctx):
+        """
+        Checks that tree refers to an imported module or a lua library,
+        attributes of modules are called as functions, attributes of other
+        objects are called as methods
+        """
+        while isinstance(tree, ast.Attribute):
+            tree = tree.value
+        return isinstance(tree, ast.Name) and (tree.id in ctx.modules or tree.id in LUA_MODULES)
 
+    def _translate_Compare(self, tree, ctx=None):
         cond = []
-        last_comp = self.visit(tree.left, **kwargs)
+        last_comp = self.visit(tree.left, ctx)
         for op, comp in zip(tree.ops, tree.comparators):
-            cond.append(last_comp + op_to_str(op) + self.visit(comp, **kwargs)) 
-            last_comp = self.visit(comp, **kwargs)
+            comp = self.visit(comp, ctx)
+            if op.__class__ is ast.In:
+                cond.append('_contains(' + comp + ',' + last_comp + ')')
+            elif op.__class__ is ast.NotIn:
+                cond.append('(not _contains(' + comp + ',' + last_comp + '))')
+            else:
+                cond.append(last_comp + self._op_meth(op)() + comp)
+            last_comp = comp
         return '(' + ' and '.join(cond) + ')'
 
-    def _translate_FunctionDef(self, tree, **kwargs):
-        env = kwargs.get('env', Env())
-        indent_level = kwargs.get('indent_level', 0)
+    def _translate_FunctionDef(self, tree, ctx=None, real_name=None, cls=None):
+        """
+        Methods are translated with real_name, the field of the class
+        holding them, and cls, the layout of the class
+        """
+        if ctx is None:
+            ctx = Context()
+        outer_scope, outer_symbols = ctx.scope, ctx.symbols
+        symbols = outer_symbols
+        scope = symbols.get(tree)
+        if scope is None:
+            symbols = build_symbols(tree, parent=outer_scope)
+            scope = symbols[tree]
+        indent_level = ctx.indent_level
         indent = ' ' * indent_level * TAB_SPACES
         func_args = ', '.join([a.arg for a in tree.args.args])
-        real_name = tree.name
-        func_namespace = env.namespace
-        for dec in tree.decorator_list:
-            if isinstance(dec.func, ast.Name) and dec.func.id == 'ns':
-                func_namespace = dec.args[0].s
-                break
-        if func_namespace:
-            real_name = self._out_fmt(func_namespace + '.', tree.name)
+        if real_name is None:
+            if outer_scope is not None:
+                real_name = outer_scope.resolve(tree.name)
+            else:
+                namespace = namespace_decorator(tree)
+                real_name = namespace + '.' + tree.name if namespace else tree.name
+        if '.' in real_name or not self._declares(tree, ctx):
             func_begin = indent + "function {}({})\n".format(real_name, func_args)
         else:
             func_begin = indent + "local function {}({})\n".format(real_name, func_args)
-        kwargs['indent_level'] = indent_level + 1
-        kwargs['non_local'] = False
-        env.set(tree.name, real_name)
-        env.add_child(Env())
-        kwargs['env'] = env.child
-        func_body = reduce(lambda a, v: a + (self.visit(v, **kwargs) + '\n'), tree.body, "")
+        body_level = indent_level + 1
         func_end = indent + "end\n"
-        return self._output_line(self._out_fmt(func_begin, func_body, func_end))
+        if scope.generator:
+            # the body runs in a coroutine when the generator is iterated
+            func_begin += indent + ' ' * TAB_SPACES + 'return generator(function()\n'
+            func_end = indent + ' ' * TAB_SPACES + 'end)\n' + func_end
+            body_level += 1
+        if scope.predeclared:
+            func_begin += ' ' * body_level * TAB_SPACES + 'local ' + ', '.join(scope.predeclared) + '\n'
+        instances, method = ctx.instances, ctx.method
+        ctx.method = None
+        if cls is not None and tree.args.args and tree.name not in cls.staticmethods:
+            ctx.method = (cls, tree.args.args[0].arg)
+        if ctx.classes or cls is not None:
+            self_layout = cls if ctx.method is not None and tree.name not in cls.classmethods else None
+            ctx.instances = instance_names(tree, ctx.classes, self_layout)
+        ctx.indent_level, ctx.scope, ctx.symbols = body_level, scope, symbols
+        func_body = self._translate_body(tree.body, ctx)
+        ctx.indent_level, ctx.scope, ctx.symbols = indent_level, outer_scope, outer_symbols
+        ctx.instances, ctx.method = instances, method
+        if ctx.memoizers:
+            ctx.indent_level = 0
+            maxsize = self._memoizer_maxsize(tree, ctx)
+            ctx.indent_level = indent_level
+            if maxsize is not None:
+                func_end += indent + real_name + '=lru_cache(' + real_name + maxsize + ')\n'
+        return func_begin + func_body + func_end + '\n'
+
+    def _memoizer_maxsize(self, tree, ctx):
+        """
+        Returns ',maxsize' argument of lru_cache for a function decorated
+        with functools.cache or lru_cache, '' for an unbounded cache and None
+        for other functions
+        """
+        for dec in tree.decorator_list:
+            call = dec if isinstance(dec, ast.Call) else None
+            kind = ctx.memoizers.get(dotted_name(dec.func if call else dec))
+            if kind is None:
+                continue
+            if kind == 'cache':
+                return ''
+            maxsize = None
+            if call is not None:
+                if call.args:
+                    maxsize = call.args[0]
+                for keyword in call.keywords:
+                    if keyword.arg == 'maxsize':
+                        maxsize = keyword.value
+            if maxsize is None:
+                return ',' + str(LRU_CACHE_MAXSIZE)
+            if isinstance(maxsize, ast.Constant) and maxsize.value is None:
+                return ''
+            return ',' + self.visit(maxsize, ctx)
+        return None
 
-    def _translate_If(self, tree, **kwargs):
-        indent_level = kwargs.get('indent_level', 0)
+    def _translate_ClassDef(self, tree, ctx=None):
+        if ctx is None:
+            ctx = Context()
+        if tree.decorator_list:
+            raise TranslatorException("Class decorators are not supported")
+        if tree.keywords:
+            raise TranslatorException("Metaclasses are not supported")
+        bases = [b for b in tree.bases if not (isinstance(b, ast.Name) and b.id == 'object')]
+        if len(bases) > 1:
+            raise TranslatorException("Multiple inheritance is not supported")
+        layout = ctx.classes.get(tree.name)
+        if layout is None:
+            # the name is bound several times, the base is not known
+            layout = ClassLayout(tree, foreign=bool(bases))
+        indent_level = ctx.indent_level
         indent = ' ' * indent_level * TAB_SPACES
-        if_begin = indent + 'if ' + self.visit(tree.test) + ' then\n'
-        kwargs['indent_level'] = indent_level + 1
-        kwargs['non_local'] = True
-        if_body = reduce(lambda a, v: a + (self.visit(v, **kwargs) + '\n'), tree.body, "")
+        name = ctx.scope.resolve(tree.name) if ctx.scope is not None else tree.name
+        ctx.indent_level = 0
+        args = ['"' + tree.name + '"']
+        layout.expr = name
+        layout.base_expr = self.visit(bases[0], ctx) if bases else None
+        slots = slot_names(tree)
+        if slots is not None:
+            args.append(layout.base_expr or 'nil')
+            args.append('{' + ','.join('"' + slot + '"' for slot in slots) + '}')
+        elif bases:
+            args.append(layout.base_expr)
+        declare = 'local ' if '.' not in name and self._declares(tree, ctx) else ''
+        lines = [indent + declare + name + '=class(' + ','.join(args) + ')\n']
+        for stmt in tree.body:
+            if isinstance(stmt, ast.FunctionDef):
+                ctx.indent_level = indent_level
+                method = self._translate_FunctionDef(stmt, ctx, name + '.' + stmt.name, layout)
+                if stmt.name in METAMETHODS:
+                    # the blank line after the method goes after the alias
+                    alias = indent + name + '.' + METAMETHODS[stmt.name] + '=' + name + '.' + stmt.name + '\n'
+                    method = method[:-1] + alias + '\n'
+                lines.append(method)
+            elif isinstance(stmt, ast.Assign) and all(isinstance(t, ast.Name) for t in stmt.targets):
+                if any(t.id == '__slots__' for t in stmt.targets):
+                    continue
+                ctx.indent_level = 0
+                value = self.visit(stmt.value, ctx)
+                for target in stmt.targets:
+                    lines.append(indent + name + '.' + target.id + '=' + value + '\n')
+            elif isinstance(stmt, ast.Pass) or isinstance(stmt, ast.Expr) and literal_type(stmt.value) is str:
+                continue
+            else:
+                raise TranslatorException(
+                    "Unsupported statement in class body: {}".format(stmt.__class__.__name__)
+                )
+        ctx.indent_level = indent_level
+        return ''.join(lines)
+
+    def _translate_If(self, tree, ctx=None):
+        if ctx is None:
+            ctx = Context()
+        indent_level = ctx.indent_level
+        indent = ' ' * indent_level * TAB_SPACES
+        line_level = ctx.line_level
+        ctx.indent_level, ctx.line_level = 0, indent_level
+        if_begin = indent + 'if ' + self.visit(tree.test, ctx) + ' then\n'
+        ctx.line_level = line_level
+        ctx.indent_level = indent_level + 1
+        if_body = self._translate_body(tree.body, ctx)
         if_orelse = ''
         if tree.orelse:
-            orelse_body = reduce(lambda a, v: a + (self.visit(v, **kwargs) + '\n'), tree.orelse, "")
+            orelse_body = self._translate_body(tree.orelse, ctx)
             if_orelse = indent + 'else\n' + orelse_body
+        ctx.indent_level = indent_level
         if_end = indent + 'end'
-        return self._out_fmt(if_begin, if_body, if_orelse, if_end)
+        return if_begin + if_body + if_orelse + if_end
 
     @indent
-    def _translate_BinOp(self, tree, **kwargs):
-        ops_map = {
-            ast.Sub: '-',
-            ast.Mult: '*',
-            ast.Div: '/',
-            ast.Mod: '%',
-            ast.Pow: '^',
-            ast.FloorDiv: '//'
-        }
-        simple_stmts = (ast.Num, ast.Str, ast.Bytes)
-        op = ops_map.get(tree.op.__class__, None)
-        op_meth = getattr(self, '_op_{}'.format(tree.op.__class__.__name__), None)
-        left = self.visit(tree.left, **kwargs)
-        right = self.visit(tree.right, **kwargs)
+    def _translate_BinOp(self, tree, ctx):
+        op = BIN_OPS.get(tree.op.__class__, None)
+        left = self.visit(tree.left, ctx)
+        right = self.visit(tree.right, ctx)
+        if tree.op.__class__ is ast.FloorDiv and not self._target.floor_div:
+            return self._library('math', 'floor', ctx) + '(' + left + '/' + right + ')'
         if op:
-            if tree.left.__class__ in (ast.Str, ast.Bytes) and tree.right.__class__ in (ast.Num, ast.Name):
-                return 'string.rep(' + left + ',' + right + ')'
-            elif (tree.left.__class__ in simple_stmts) and (tree.right.__class__ in simple_stmts) and tree.left.__class__ != tree.right.__class__:
+            left_type = literal_type(tree.left)
+            right_type = literal_type(tree.right)
+            if left_type is str and (right_type is int or isinstance(tree.right, ast.Name)):
+                return self._library('string', 'rep', ctx) + '(' + left + ',' + right + ')'
+            elif left_type and right_type and left_type is not right_type:
                 raise TypeError("unsupported operand types for {}".format(op))
+            elif right.startswith('-'):
+                # a space keeps '--' from starting a lua comment
+                return '(' + left + op + ' ' + right + ')'
             else:
                 return '(' + left + op + right + ')'
-        elif op_meth is not None:
-            return op_meth(left, right)
+        if isinstance(tree.op, ast.Add) and ctx.types is not None:
+            add_type = ctx.types.add_type(tree)
+            if add_type == NUMBER:
+                return '(' + left + '+' + right + ')'
+            elif add_type == STRING:
+                return '(' + left + '..' + right + ')'
+        op_meth = self._op_meth(tree.op)
+        if op_meth is not None:
+            return op_meth(left, right, ctx)
         else:
             raise InvalidBinOp("Invalid binary operation: {}".format(tree.op.__class__.__name__))
 
-    def _translate_NoneType(self, tree, **kwargs):
+    @indent
+    def _translate_UnaryOp(self, tree, ctx):
+        operand = self.visit(tree.operand, ctx)
+        if isinstance(tree.op, ast.USub):
+            if literal_type(tree.operand) is int:
+                return '-' + operand
+            return '(-' + operand + ')'
+        elif isinstance(tree.op, ast.UAdd):
+            return operand
+        elif isinstance(tree.op, ast.Not):
+            return '(not ' + operand + ')'
+        elif isinstance(tree.op, ast.Invert):
+            if self._target.bit_library is None:
+                return '(~' + operand + ')'
+            return self._library(self._target.bit_library, 'bnot', ctx) + '(' + operand + ')'
+        raise TranslatorException("Invalid unary operation: {}".format(tree.op.__class__.__name__))
+
+    def _translate_NoneType(self, tree, ctx=None):
         return 'nil'
 
     @indent
-    def _translate_Attribute(self, tree, **kwargs):
-        return '(' + self.visit(tree.value, **kwargs) + '.' + tree.attr + ')'
+    def _translate_Attribute(self, tree, ctx):
+        value = tree.value
+        if ctx.instances and value.__class__ is ast.Name and value.id in ctx.instances:
+            index = ctx.instances[value.id].index.get(tree.attr)
+            if index is not None:
+                return self.visit(value, ctx) + '[' + str(index) + ']'
+        if isinstance(tree.ctx, ast.Load):
+            return '(' + self.visit(value, ctx) + '.' + tree.attr + ')'
+        return self.visit(value, ctx) + '.' + tree.attr
 
     @indent
-    def _translate_Import(self, tree, **kwargs):
-        return '\n'.join([self.visit(n, **kwargs) for n in tree.names])
+    def _translate_Import(self, tree, ctx):
+        return '\n'.join([self.visit(n, ctx) for n in tree.names])
 
     @indent
-    def _translate_ImportFrom(self, tree, **kwargs):
-        kwargs['from_mod'] = tree.module
-        return '\n'.join([self.visit(n, **kwargs) for n in tree.names])
+    def _translate_ImportFrom(self, tree, ctx):
+        from_mod = ctx.from_mod
+        ctx.from_mod = tree.module
+        res = '\n'.join([code for code in [self.visit(n, ctx) for n in tree.names] if code])
+        ctx.from_mod = from_mod
+        return res
 
     @indent
-    def _translate_List(self, tree, **kwargs):
-        elts = ','.join([self.visit(elt, **kwargs) for elt in tree.elts])
-        return 'list(' + elts + ')'
-    
+    def _translate_List(self, tree, ctx):
+        # the constructor gets the array part sized for the elements
+        elts = [self.visit(elt, ctx) for elt in tree.elts]
+        if len(elts) > 1 and not isinstance(tree.elts[-1], (ast.Name, ast.Constant)):
+            # a call in the last position would add all of its results
+            elts[-1] = '(' + elts[-1] + ')'
+        fields = ['[0]=' + elts[0]] + elts[1:] if elts else []
+        fields.append('n=' + str(len(elts)))
+        return '_list_of({' + ','.join(fields) + '})'
+
     @indent
-    def _translate_Dict(self, tree, **kwargs):
-        items = ','.join([
-            self.visit(k, **kwargs) + ':' + self.visit(v, **kwargs) 
-            for k, v in zip(tree.keys, tree.values)
-        ])
-        return '{' + items + '}'
+    def _translate_Dict(self, tree, ctx):
+        # the constructor gets the hash part sized for the items
+        fields = []
+        for k, v in zip(tree.keys, tree.values):
+            if k is None:
+                raise TranslatorException("Dict unpacking is not supported")
+            if isinstance(k, ast.Constant) and is_lua_name(k.value):
+                key = k.value
+            else:
+                key = '[' + self.visit(k, ctx) + ']'
+            fields.append(key + '=' + self.visit(v, ctx))
+        return '_dict_of({' + ','.join(fields) + '})'
+
+    def _translate_ListComp(self, tree, ctx=None):
+        if ctx is None:
+            ctx = Context()
+        return self._lower_expression(self._reduction(tree, ctx), ctx)
+    _translate_SetComp = _translate_DictComp = _translate_GeneratorExp = _translate_ListComp
 
     @indent
-    def _translate_Subscript(self, tree, **kwargs):
-        return self.visit(tree.value, **kwargs) + '[' + self.visit(tree.slice, **kwargs) + ']'
+    def _translate_Subscript(self, tree, ctx):
+        if isinstance(tree.slice, ast.Slice):
+            bounds = [tree.slice.lower, tree.slice.upper, tree.slice.step]
+            while bounds and bounds[-1] is None:
+                bounds.pop()
+            args = [self.visit(tree.value, ctx)]
+            args.extend('nil' if b is None else self.visit(b, ctx) for b in bounds)
+            return '_slice(' + ','.join(args) + ')'
+        return self.visit(tree.value, ctx) + '[' + self.visit(tree.slice, ctx) + ']'
     
     @indent
-    def _translate_Index(self, tree, **kwargs):
-        return self.visit(tree.value, **kwargs)
+    def _translate_Index(self, tree, ctx):
+        return self.visit(tree.value, ctx)
 
     @indent
-    def _translate_alias(self, tree, **kwargs):
-        from_mod = kwargs.get('from_mod', None)
+    def _translate_alias(self, tree, ctx):
+        if ctx.from_mod == 'functools' and tree.name in MEMOIZERS or \
+                ctx.from_mod is None and tree.name == 'functools' and (tree.asname or tree.name) in ctx.memoizers:
+            # the decorators are translated to the runtime lru_cache
+            return ''
         asname = tree.asname if tree.asname is not None else tree.name
-        if from_mod:
-            return asname + '=require("' + from_mod + '").' + tree.name
+        if ctx.scope is not None and tree in ctx.scope.declared:
+            asname = 'local ' + asname
+        if ctx.from_mod and ctx.from_mod + '.' + tree.name in ctx.submodules:
+            return asname + '=require("' + ctx.from_mod + '.' + tree.name + '")'
+        if ctx.from_mod:
+            return asname + '=require("' + ctx.from_mod + '").' + tree.name
         else:
             return asname + '=require("' + tree.name + '")'
 
-    def _translate_For(self, tree, **kwargs):
-        indent_level = kwargs.get('indent_level', 0)
+    def _is_builtin_call(self, tree, name, ctx):
+        """
+        Checks that tree calls builtin `name` which is not rebound in the module
+        """
+        return (
+            isinstance(tree, ast.Call) and isinstance(tree.func, ast.Name) and tree.func.id == name and
+            name not in ctx.bound_names and '*' not in ctx.bound_names
+        )
+
+    def _range_args(self, target, iter_, ctx):
+        """
+        Returns (start, stop, step) arguments of the range() call iter_ when
+        a loop over it is lowered to a numeric for, otherwise None
+        """
+        if not isinstance(target, ast.Name) or not self._is_builtin_call(iter_, 'range', ctx):
+            return None
+        args = iter_.args
+        if not 1 <= len(args) <= 3 or iter_.keywords or any(isinstance(a, ast.Starred) for a in args):
+            return None
+        if len(args) == 1:
+            start, stop, step = None, args[0], None
+        elif len(args) == 2:
+            start, stop, step = args[0], args[1], None
+        else:
+            start, stop, step = args
+        if step is not None and not isinstance(step, ast.Name) and not literal_int(step):
+            return None
+        return start, stop, step
+
+    def _range_bounds(self, args, ctx):
+        """
+        Returns 'start,stop,step' of a numeric for loop equivalent to range()
+        called with args
+        """
+        start, stop, step = args
+        if isinstance(step, ast.Name):
+            # sign of the step is known at runtime only, the name is
+            # evaluated twice which is safe as it has no side effects
+            step_str = self.visit(step, ctx)
+            limit = self.visit(stop, ctx) + '-(' + step_str + '>0 and 1 or -1)'
+        else:
+            step_value = 1 if step is None else literal_int(step)
+            step_str = str(step_value)
+            stop_value = literal_int(stop)
+            if stop_value is not None:
+                limit = str(stop_value - 1 if step_value > 0 else stop_value + 1)
+            else:
+                limit = self.visit(stop, ctx) + ('-1' if step_value > 0 else '+1')
+        bounds = ('0' if start is None else self.visit(start, ctx)) + ',' + limit
+        if step_str != '1':
+            bounds += ',' + step_str
+        return bounds
+
+    def _comprehension_size(self, comp, ctx):
+        """
+        Returns length of the list or dict built by the comprehension when the
+        target can preallocate tables and the length is known before the
+        loop, which is the case for a single range() generator without
+        step and conditions. Bounds are evaluated twice, so they are
+        restricted to names and literals
+        """
+        if not self._target.table_new or len(comp.generators) != 1:
+            return None
+        gen = comp.generators[0]
+        if gen.ifs or not self._is_builtin_call(gen.iter, 'range', ctx) or gen.iter.keywords:
+            return None
+        args = gen.iter.args
+        if not 1 <= len(args) <= 2 or not all(isinstance(a, ast.Name) or literal_int(a) is not None for a in args):
+            return None
+        if len(args) == 1:
+            start, stop = 0, args[0]
+        else:
+            start, stop = args
+            start_value = literal_int(start)
+            start = self.visit(start, ctx) if start_value is None else start_value
+        stop_value = literal_int(stop)
+        if isinstance(start, int) and stop_value is not None:
+            return str(stop_value - start)
+        stop = self.visit(stop, ctx) if stop_value is None else '(' + str(stop_value) + ')'
+        if isinstance(start, int):
+            return stop if not start else stop + ('-' if start > 0 else '+') + str(abs(start))
+        return stop + '-' + start
+
+    def _translate_For(self, tree, ctx=None):
+        if ctx is None:
+            ctx = Context()
+        builders = self._string_builders(tree, ctx)
+        if builders:
+            return self._translate_buffered_For(tree, builders, ctx)
+        indent_level = ctx.indent_level
         indent = ' ' * indent_level * TAB_SPACES
-        kwargs['indent_level'] = indent_level + 1
-        for_body = reduce(lambda a, v: a + (self.visit(v, **kwargs) + '\n'), tree.body, "")
-        kwargs['indent_level'] = 0
-        target = self.visit(tree.target, **kwargs)
-        iter_ = self.visit(tree.iter, **kwargs)
-        for_begin = indent + 'for ' + target + ' in (' + iter_ + ').iter() do\n'
+        ctx.indent_level = indent_level + 1
+        for_body = self._translate_body(tree.body, ctx)
+        line_level = ctx.line_level
+        ctx.indent_level, ctx.line_level = 0, indent_level
+        for_begin = indent + self._loop_header(tree.target, tree.iter, ctx) + '\n'
+        ctx.indent_level, ctx.line_level = indent_level, line_level
         for_end = indent + 'end\n'
-        return self._out_fmt(for_begin, for_body, for_end)
+        return for_begin + for_body + for_end
+
+    def _string_builders(self, tree, ctx):
+        """
+        Returns names of string locals which a loop changes only by
+        `s = s + x` statements and which no nested function shares
+        """
+        found = ctx.accumulations.get(tree)
+        if not found or ctx.scope is None:
+            return []
+        names = set()
+        accounted = set()
+        for node in found:
+            names.add(node.targets[0].id)
+            accounted.add(node.targets[0])
+            accounted.add(accumulation(node)[0])
+        names.difference_update(ctx.buffers)
+        if not names:
+            return []
+        for node in ast.walk(tree):
+            if isinstance(node, ast.Name) and node.id in names and node not in accounted:
+                names.discard(node.id)
+        names = {name for name in names if ctx.scope.resolve(name) == name}
+        if names:
+            names -= shared_names(ctx.scope.node)
+        return sorted(names)
+
+    def _translate_buffered_For(self, tree, builders, ctx):
+        """
+        Translates a loop which extends strings: pieces are stored in
+        table buffers which are concatenated once after the loop
+        """
+        indent_level = ctx.indent_level
+        indent = ' ' * (indent_level + 1) * TAB_SPACES
+        temp = temp_namer(tree, ctx.bound_names)
+        buffers = ctx.buffers
+        ctx.buffers = dict(buffers)
+        begin, end = [], []
+        concat = self._library('table', 'concat', ctx)
+        for name in builders:
+            buf, n = temp('buf'), temp('nb')
+            ctx.buffers[name] = buf, n
+            begin.append(indent + 'local ' + buf + ',' + n + '={' + name + '},1\n')
+            end.append(indent + name + '=' + concat + '(' + buf + ',"",1,' + n + ')\n')
+        ctx.indent_level = indent_level + 1
+        loop = self._translate_For(tree, ctx)
+        ctx.indent_level, ctx.buffers = indent_level, buffers
+        outer = ' ' * indent_level * TAB_SPACES
+        return outer + 'do\n' + ''.join(begin) + loop + ''.join(end) + outer + 'end\n'
+
+    def _loop_header(self, target, iter_, ctx):
+        args = self._range_args(target, iter_, ctx)
+        bounds = None if args is None else self._range_bounds(args, ctx)
+        if isinstance(target, ast.Tuple) and all(isinstance(elt, ast.Name) for elt in target.elts):
+            # iterators of dict items return two values
+            target = ','.join(elt.id for elt in target.elts)
+        else:
+            target = self.visit(target, ctx)
+        if bounds is not None:
+            return 'for ' + target + '=' + bounds + ' do'
+        return 'for ' + target + ' in _iter(' + self.visit(iter_, ctx) + ') do'
+
+    def _fused_reduction(self, tree, ctx):
+        """
+        Returns (kind, comprehension, args) when call tree consumes
+        a single comprehension which is fused into its loop, otherwise None
+        """
+        if not isinstance(tree, ast.Call) or tree.keywords or not tree.args:
+            return None
+        func = tree.func
+        if isinstance(func, ast.Name) and func.id in FUSED_BUILTINS:
+            comp = tree.args[0]
+            if isinstance(comp, (ast.GeneratorExp, ast.ListComp)) and self._is_builtin_call(tree, func.id, ctx) and \
+                    (len(tree.args) == 1 or func.id == 'sum' and len(tree.args) == 2):
+                return func.id, comp, tree.args[1:]
+        elif is_fused_join(tree):
+            return 'join', tree.args[0], [func.value]
+        return None
+
+    def _reduction(self, tree, ctx):
+        """
+        Returns (kind, comprehension, args) of an expression which is
+        lowered to a loop, a comprehension or a fused call, otherwise None
+        """
+        kind = COMPREHENSIONS.get(tree.__class__)
+        if kind is not None:
+            return kind, tree, ()
+        return self._fused_reduction(tree, ctx)
+
+    def _reduction_loop(self, reduction, result, ctx, level, returns=False):
+        """
+        Returns (result, init, setup, lines) of a loop computing reduction
+        into local `result`, a temporary one when it is None. init is the
+        initial value of the result or None, setup and lines are
+        (level, code) pairs of locals declared before the loop and of the
+        loop itself, which starts at indentation `level`. With `returns` any() and all() return from the enclosing
+        function as soon as the result is known, otherwise they break the loop
+        """
+        kind, comp, args = reduction
+        temp = temp_namer(comp, ctx.bound_names if result is None else ctx.bound_names | {result})
+        if result is None:
+            result = temp('r')
+        for gen in comp.generators:
+            if gen.is_async:
+                raise TranslatorException("Asynchronous comprehensions are not supported")
+        indent_level, line_level = ctx.indent_level, ctx.line_level
+        ctx.indent_level = 0
+        headers = []
+        for gen in comp.generators:
+            ctx.line_level = level
+            header = self._loop_header(gen.target, gen.iter, ctx)
+            level += 1
+            cond = None
+            if gen.ifs:
+                ctx.line_level = level
+                cond = ' and '.join(self.visit(test, ctx) for test in gen.ifs)
+                level += 1
+            headers.append((header, cond))
+        ctx.line_level = level
+        init, setup, after = None, [], []
+        if kind == 'dict':
+            body = [(0, result + '[' + self.visit(comp.key, ctx) + ']=' + self.visit(comp.value, ctx))]
+        else:
+            elt = self.visit(comp.elt, ctx)
+        if kind == 'list':
+            n = temp('n')
+            size = self._comprehension_size(comp, ctx)
+            init = 'list()' if size is None else '_list_alloc(' + size + ')'
+            setup = [(0, 'local ' + n + '=0')]
+            body = [(0, 'rawset(' + result + ',' + n + ',' + elt + ')'), (0, n + '=' + n + '+1')]
+            after = [(0, result + '.n=' + n)]
+        elif kind == 'dict':
+            size = self._comprehension_size(comp, ctx)
+            init = 'dict()' if size is None else '_dict_alloc(' + size + ')'
+        elif kind == 'set':
+            init = '{}'
+            body = [(0, result + '[' + elt + ']=true')]
+        elif kind == 'sum':
+            init = self.visit(args[0], ctx) if args else '0'
+            body = [(0, result + '=' + result + '+' + elt)]
+        elif kind in ('any', 'all'):
+            init, found = ('false', 'true') if kind == 'any' else ('true', 'false')
+            cond = elt if kind == 'any' else '(not ' + elt + ')'
+            if returns:
+                body = [(0, 'if ' + cond + ' then'), (1, 'return ' + found), (0, 'end')]
+            else:
+                body = [(0, 'if ' + cond + ' then'), (1, result + '=' + found), (1, 'break'), (0, 'end')]
+        elif kind in ('max', 'min'):
+            v = temp('v')
+            body = [
+                (0, 'local ' + v + '=' + elt),
+                (0, 'if ' + result + '==nil or ' + v + ('>' if kind == 'max' else '<') + result + ' then'),
+                (1, result + '=' + v),
+                (0, 'end'),
+            ]
+            after = [
+                (0, 'if ' + result + '==nil then'),
+                (1, 'error("{}() arg is an empty sequence")'.format(kind)),
+                (0, 'end'),
+            ]
+        else:
+            parts, k = temp('parts'), temp('k')
+            setup = [(0, 'local ' + parts + ',' + k + '={},0')]
+            body = [(0, k + '=' + k + '+1'), (0, parts + '[' + k + ']=' + elt)]
+            after = [(0, result + '=' + self._library('table', 'concat', ctx) + '(' + parts + ',' +
+                      self.visit(args[0], ctx) + ')')]
+        lines = body
+        for header, cond in reversed(headers):
+            if cond is not None:
+                lines = [(0, 'if ' + cond + ' then')] + [(l + 1, c) for l, c in lines] + [(0, 'end')]
+            lines = [(0, header)] + [(l + 1, c) for l, c in lines] + [(0, 'end')]
+        ctx.indent_level, ctx.line_level = indent_level, line_level
+        return result, init, setup, lines + after
+
+    def _render(self, lines, level):
+        return '\n'.join(' ' * (level + l) * TAB_SPACES + code for l, code in lines)
+
+    def _declaration(self, result, init):
+        return 'local ' + result + ('' if init is None else '=' + init)
+
+    def _lower_expression(self, reduction, ctx):
+        """
+        Translates reduction used as a part of an expression to a function
+        which is called in place
+        """
+        result, init, setup, lines = self._reduction_loop(reduction, None, ctx, ctx.line_level + 1, returns=True)
+        body = [(1, self._declaration(result, init))] + [(l + 1, c) for l, c in setup + lines]
+        body.append((1, 'return ' + result))
+        return '(function()\n' + self._render(body, ctx.line_level) + '\n' + \
+            ' ' * ctx.line_level * TAB_SPACES + 'end)()'
+
+    def _lower_block(self, reduction, ctx, returns=False):
+        """
+        Translates reduction whose value is returned or discarded to a loop
+        in a do block
+        """
+        kind, comp, _ = reduction
+        level = ctx.line_level
+        if kind in ('any', 'all') and len(comp.generators) > 1 and not returns:
+            # break leaves only the innermost loop
+            ctx.line_level = level + 1
+            code = self._lower_expression(reduction, ctx)
+            ctx.line_level = level
+            return 'do\n' + ' ' * (level + 1) * TAB_SPACES + 'local _=' + code + '\n' + \
+                ' ' * level * TAB_SPACES + 'end'
+        result, init, setup, lines = self._reduction_loop(reduction, None, ctx, level + 1, returns)
+        body = [(1, self._declaration(result, init))] + [(l + 1, c) for l, c in setup + lines]
+        if returns:
+            body.append((1, 'return ' + result))
+        return 'do\n' + self._render(body + [(0, 'end')], level)
+
+    def _lower_assign(self, tree, reduction, ctx):
+        """
+        Translates assignment of reduction to a loop which fills the target
+        directly or returns None when the reduction refers to the target
+        """
+        kind, comp, args = reduction
+        name = tree.targets[0].id
+        if kind in ('any', 'all') and len(comp.generators) > 1:
+            return None
+        for node in ast.walk(tree.value):
+            if isinstance(node, ast.Name) and node.id == name:
+                return None
+        # list and join loops are wrapped in a do block with their counters
+        level = ctx.line_level + (kind in ('list', 'join'))
+        result, init, setup, lines = self._reduction_loop(reduction, name, ctx, level)
+        head = []
+        if self._declares(tree, ctx):
+            head.append(self._declaration(name, init))
+        elif init is not None:
+            head.append(name + '=' + init)
+        if setup:
+            lines = [(0, 'do')] + [(l + 1, c) for l, c in setup + lines] + [(0, 'end')]
+        code = self._render(lines, ctx.line_level)
+        if not head:
+            return code.lstrip(' ')
+        return head[0] + '\n' + code
+
+    def visit(self, tree, ctx=None):
+        node_class = tree.__class__
+        try:
+            parse_meth = self._dispatch[node_class]
+        except KeyError:
+            parse_meth = getattr(self, '_translate_' + node_class.__name__)
+            self._dispatch[node_class] = parse_meth
+        return parse_meth(tree, ctx)
+
+    def _instrumented_visit(self, tree, ctx=None):
+        # the outermost visit holds the lock until the whole tree is visited
+        with self._visit_lock:
+            for collector in self._collectors:
+                collector.enter(tree)
+            res = type(self).visit(self, tree, ctx)
+            for collector in reversed(self._collectors):
+                collector.leave(tree, res)
+            return res
+
+    def _minified(self, code):
+        return minify(code, names=self._minify == 'names') if self._minify else code
+
+    def _write_tree(self, tree, stream, submodules=frozenset()):
+        if self._minify:
+            # renaming needs the whole module, so it isn't written in chunks
+            stream.write(self._minified(self.visit(tree, Context(submodules=submodules))))
+            return
+        emitter = Emitter(stream)
+        if self._collectors:
+            # statements of the module are visited one by one, collectors
+            # have to see them together
+            with self._visit_lock:
+                self._emit_Module(tree, emitter, submodules)
+        else:
+            self._emit_Module(tree, emitter, submodules)
+        emitter.flush()
 
-    def visit(self, tree, **kwargs):
-        parse_meth = getattr(self, '_translate_{}'.format(tree.__class__.__name__))
-        if parse_meth:
-            return parse_meth(tree, **kwargs)
+    def translate_to(self, source, stream, stats=None):
+        """
+        Translates source and writes resulting code to an open text stream
+        in chunks, without building the whole output in memory
+        """
+        self._write_tree(self._parse(source, stats), stream)
 
-    def translate(self, source, **kwargs):
-        tree = ast.parse(source)
-        tree_str = self.visit(tree)
+    def options(self):
+        """
+        Returns options which affect generated code, used as a part of
+        cache key
+        """
+        cls = self.__class__
+        return {
+            'translator': cls.__module__ + '.' + cls.__qualname__,
+            'passes': tuple(p.__module__ + '.' + p.__qualname__ for p in self._optimizer.passes),
+            'runtime': self._runtime,
+            'target': self._target.name,
+            'minify': self._minify,
+        }
+
+    def _parse(self, source, stats=None):
+        return self._optimizer.run(ast.parse(source), stats)
+
+    def translate(self, source, stats=None, **kwargs):
+        cache_key = None
+        if self._cache is not None:
+            cache_key = self._cache.key(source, self.options())
+            if self._out:
+                if self._cache.copy_to(cache_key, self._out):
+                    return
+            else:
+                code = self._cache.get(cache_key)
+                if code is not None:
+                    return code
+        tree = self._parse(source, stats)
         if self._out:
             with open(self._out, 'w') as out:
-                out.write(tree_str)
+                self._write_tree(tree, out)
+            if cache_key is not None:
+                self._cache.put_file(cache_key, self._out)
         else:
-            return tree_str
+            code = self._minified(self.visit(tree))
+            if cache_key is not None:
+                self._cache.put(cache_key, code)
+            return code
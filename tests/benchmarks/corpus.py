@@ -0,0 +1,115 @@
+"""
+Generators of synthetic python sources used to benchmark translation
+"""
+
+
+def deep_nesting(depth):
+    """
+    Returns a function with `depth` levels of nested if and for statements
+    """
+    lines = ['def nested(n):', '    total = 0']
+    indent = 1
+    for level in range(depth):
+        pad = '    ' * indent
+        if level % 2:
+            lines.append('{}for i{} in range(n):'.format(pad, level))
+        else:
+            lines.append('{}if n > {}:'.format(pad, level))
+        lines.append('{}    total = total + {}'.format(pad, level))
+        indent += 1
+    lines.append('    return total')
+    return '\n'.join(lines) + '\n'
+
+
+def long_module(statements):
+    """
+    Returns a module of `statements` top-level assignments and expressions
+    """
+    lines = ['import os']
+    for i in range(statements):
+        if i % 4 == 0:
+            lines.append('v{0} = {0} * 2 + 1'.format(i))
+        elif i % 4 == 1:
+            lines.append('s{0} = "item" + "{0}"'.format(i))
+        elif i % 4 == 2:
+            lines.append('l{0} = [{0}, {0} + 1, v{1}]'.format(i, i - 2))
+        else:
+            lines.append('os.getenv(s{})'.format(i - 2))
+    return '\n'.join(lines) + '\n'
+
+
+def many_functions(count):
+    """
+    Returns a module of `count` small functions calling each other
+    """
+    lines = []
+    for i in range(count):
+        lines.append('def f{}(a, b):'.format(i))
+        lines.append('    c = a + b')
+        lines.append('    if c > {}:'.format(i))
+        lines.append('        c = c - b')
+        if i:
+            lines.append('    return f{}(c, a)'.format(i - 1))
+        else:
+            lines.append('    return c')
+        lines.append('')
+    return '\n'.join(lines) + '\n'
+
+
+def package_modules(count):
+    """
+    Returns {module name: source} of a program whose main module imports
+    `count` modules, which all import a shared helpers module
+    """
+    modules = {'helpers': 'def scale(n):\n    return [n * 2][0]\n'}
+    main = []
+    for i in range(count):
+        modules['mod{}'.format(i)] = (
+            'import helpers\nVALUES = [{0}, {0} + 1]\n\n\ndef f(n):\n    return helpers.scale(n) + {0}\n'
+        ).format(i)
+        main.append('import mod{}'.format(i))
+    main.append('total = 0')
+    main.extend('total = total + mod{}.f(1)'.format(i) for i in range(count))
+    modules['main'] = '\n'.join(main) + '\n'
+    return modules
+
+
+# name: (generator, size at scale 1)
+CORPORA = {
+    'deep_nesting': (deep_nesting, 80),
+    'long_module': (long_module, 20000),
+    'many_functions': (many_functions, 3000),
+}
+
+
+KERNELS = '''
+def loop(n):
+    total = 0
+    for i in range(n):
+        total = total + i * 2
+    return total
+
+
+def build_list(n):
+    lst = []
+    for i in range(n):
+        lst.append(i)
+    return len(lst)
+
+
+def concat(n):
+    s = ""
+    for i in range(n):
+        s = s + "x"
+    return len(s)
+'''
+
+# modules of the cold start program at scale 1
+COLD_START_MODULES = 100
+
+# kernel: argument at scale 1
+KERNEL_ARGS = {
+    'loop': 10000000,
+    'build_list': 1000000,
+    'concat': 20000,
+}
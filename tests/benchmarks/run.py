@@ -0,0 +1,271 @@
+"""
+Benchmarks translation throughput and runtime of generated code.
+
+    python tests/benchmarks/run.py -o results.json
+    python tests/benchmarks/run.py --baseline results.json
+
+Translation of every synthetic corpus is timed and its peak memory is
+measured with tracemalloc. Generated kernels are run when a lua
+interpreter (luajit, lua5.x, lua) or the lupa module is available.
+With an interpreter, cold start of a program of many modules is timed
+both for separate files and for a bundle.
+Results are saved as JSON and can be compared with a baseline, the exit
+code is 1 when some metric regressed more than the threshold
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import tempfile
+import tracemalloc
+import subprocess
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+
+from py3lua import __version__, Translator  # noqa: E402
+from py3lua.bundler import bundle_file  # noqa: E402
+from py3lua.project import translate_project  # noqa: E402
+from py3lua.runtime import write_runtime  # noqa: E402
+from corpus import CORPORA, KERNELS, KERNEL_ARGS, COLD_START_MODULES, package_modules  # noqa: E402
+
+
+LUA_INTERPRETERS = ('luajit', 'lua5.4', 'lua5.3', 'lua5.2', 'lua5.1', 'lua')
+HARNESS = """
+local M = dofile(arg[1])
+local n = tonumber(arg[3])
+local start = os.clock()
+M[arg[2]](n)
+print(os.clock() - start)
+"""
+
+
+def bench_translation(source, repeat):
+    """
+    Returns best time of `repeat` translations and peak memory of one
+    """
+    translator = Translator()
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        code = translator.translate(source)
+        times.append(time.perf_counter() - start)
+    tracemalloc.start()
+    translator.translate(source)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        'lines': source.count('\n'),
+        'bytes': len(code),
+        'time': min(times),
+        'peak_memory': peak,
+    }
+
+
+def find_interpreter():
+    """
+    Returns (name, path) of an available lua interpreter or (None, None)
+    """
+    for name in LUA_INTERPRETERS:
+        path = shutil.which(name)
+        if path:
+            return name, path
+    return None, None
+
+
+def find_lua():
+    """
+    Returns (name, runner) of an available lua, runner takes path of
+    generated module, kernel name and argument and returns run time
+    """
+    name, path = find_interpreter()
+    if path:
+        return name, lambda module, kernel, n: _run_interpreter(path, module, kernel, n)
+    try:
+        import lupa
+    except ImportError:
+        return None, None
+    return 'lupa', _run_lupa
+
+
+def _run_interpreter(path, module, kernel, n):
+    with tempfile.NamedTemporaryFile('w', suffix='.lua', delete=False) as harness:
+        harness.write(HARNESS)
+    try:
+        out = subprocess.run(
+            [path, harness.name, module, kernel, str(n)], check=True, capture_output=True, text=True
+        )
+    finally:
+        os.remove(harness.name)
+    return float(out.stdout.split()[-1])
+
+
+def _run_lupa(module, kernel, n):
+    import lupa
+    lua = lupa.LuaRuntime()
+    with open(module) as f:
+        mod = lua.execute(f.read())
+    func = mod[kernel]
+    start = time.perf_counter()
+    func(n)
+    return time.perf_counter() - start
+
+
+def bench_kernels(run_kernel, scale, repeat):
+    with tempfile.TemporaryDirectory() as tmp:
+        module = os.path.join(tmp, 'kernels.lua')
+        Translator(out_file=module).translate(KERNELS)
+        return {
+            name: min(run_kernel(module, name, max(1, int(arg * scale))) for _ in range(repeat))
+            for name, arg in sorted(KERNEL_ARGS.items())
+        }
+
+
+def _best_run(args, cwd, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run(args, cwd=cwd, check=True, capture_output=True)
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def bench_cold_start(path, scale, repeat):
+    """
+    Returns best wall time of starting a program of many modules
+    translated to separate files and bundled into one file
+    """
+    modules = package_modules(max(2, int(COLD_START_MODULES * scale)))
+    with tempfile.TemporaryDirectory() as tmp:
+        src_dir = os.path.join(tmp, 'src')
+        out_dir = os.path.join(tmp, 'out')
+        os.makedirs(src_dir)
+        for name, source in modules.items():
+            with open(os.path.join(src_dir, name + '.py'), 'w') as f:
+                f.write(source)
+        options = {'runtime': 'shared'}
+        for result in translate_project(src_dir, out_dir, jobs=1, options=options):
+            if not result.ok:
+                raise RuntimeError(result.error)
+        write_runtime(out_dir)
+        bundle = os.path.join(tmp, 'bundle.lua')
+        bundle_file(os.path.join(src_dir, 'main.py'), bundle, options=options)
+        return {
+            'modules': _best_run([path, 'main.lua'], out_dir, repeat),
+            'bundle': _best_run([path, bundle], tmp, repeat),
+        }
+
+
+def run(scale=1.0, repeat=3, kernels=True):
+    results = {
+        'version': __version__,
+        'python': platform.python_version(),
+        'scale': scale,
+        'translate': {},
+        'kernels': {},
+        'cold_start': {},
+        'lua': None,
+    }
+    for name, (generate, size) in sorted(CORPORA.items()):
+        source = generate(max(1, int(size * scale)))
+        results['translate'][name] = bench_translation(source, repeat)
+    if kernels:
+        lua, run_kernel = find_lua()
+        results['lua'] = lua
+        if run_kernel is not None:
+            results['kernels'] = bench_kernels(run_kernel, scale, repeat)
+        _, path = find_interpreter()
+        if path:
+            results['cold_start'] = bench_cold_start(path, scale, repeat)
+    return results
+
+
+def compare(results, baseline, threshold):
+    """
+    Returns lines describing changes of metrics against baseline and
+    a flag of regression above threshold (a fraction)
+    """
+    lines = []
+    regressed = False
+    metrics = [
+        ('translate', name, key)
+        for name in sorted(results['translate']) for key in ('time', 'peak_memory')
+    ]
+    for group in ('kernels', 'cold_start'):
+        metrics.extend((group, name, None) for name in sorted(results.get(group, ())))
+    for group, name, key in metrics:
+        try:
+            old = baseline[group][name]
+        except KeyError:
+            continue
+        new = results[group][name]
+        if key is not None:
+            old, new = old[key], new[key]
+        if not old:
+            continue
+        change = (new - old) / old
+        mark = ''
+        if change > threshold:
+            mark = '  REGRESSION'
+            regressed = True
+        label = '.'.join(p for p in (group, name, key) if p)
+        lines.append('{:<40} {:>12.4g} {:>12.4g} {:>+8.1%}{}'.format(label, old, new, change, mark))
+    return lines, regressed
+
+
+def format_results(results):
+    lines = ['{:<20} {:>8} {:>10} {:>10} {:>12}'.format('corpus', 'lines', 'bytes', 'time, s', 'peak, KiB')]
+    for name, r in sorted(results['translate'].items()):
+        lines.append('{:<20} {:>8} {:>10} {:>10.4f} {:>12.0f}'.format(
+            name, r['lines'], r['bytes'], r['time'], r['peak_memory'] / 1024
+        ))
+    if results['kernels']:
+        lines.append('')
+        lines.append('kernels ({}):'.format(results['lua']))
+        for name, t in sorted(results['kernels'].items()):
+            lines.append('{:<20} {:>10.4f}'.format(name, t))
+    elif results['lua'] is None:
+        lines.append('')
+        lines.append('kernels skipped: no lua interpreter or lupa found')
+    if results['cold_start']:
+        lines.append('')
+        lines.append('cold start:')
+        for name, t in sorted(results['cold_start'].items()):
+            lines.append('{:<20} {:>10.4f}'.format(name, t))
+    return '\n'.join(lines)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="py3lua benchmarks")
+    parser.add_argument("-o", "--output", help="Save results as JSON to this file")
+    parser.add_argument("--baseline", help="Compare results with JSON results saved before")
+    parser.add_argument("--threshold", type=float, default=0.1,
+                        help="Relative slowdown reported as regression (default: %(default)s)")
+    parser.add_argument("--scale", type=float, default=1.0,
+                        help="Multiplier of corpus sizes and kernel arguments (default: %(default)s)")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs of every benchmark (default: %(default)s)")
+    parser.add_argument("--no-kernels", action="store_true", help="Don't run generated code")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    results = run(args.scale, args.repeat, not args.no_kernels)
+    print(format_results(results))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        lines, regressed = compare(results, baseline, args.threshold)
+        print()
+        print('\n'.join(lines))
+        return 1 if regressed else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,40 @@
+"""
+Runs generated code in lua interpreters embedded by lupa, tests which
+need them are skipped when lupa is not installed
+"""
+import importlib
+
+
+# lupa modules of lua versions by target
+LUPA_MODULES = {
+    'luajit': ('lupa.luajit21', 'lupa.luajit20'),
+    '5.1': ('lupa.lua51',),
+    '5.3': ('lupa.lua53',),
+    '5.4': ('lupa.lua54',),
+}
+
+
+def lua_runtime(target='luajit'):
+    """
+    Returns a new LuaRuntime of the target lua version or None
+    """
+    for name in LUPA_MODULES[target]:
+        try:
+            return importlib.import_module(name).LuaRuntime()
+        except ImportError:
+            continue
+    return None
+
+
+def has_lua(target='luajit'):
+    return lua_runtime(target) is not None
+
+
+def run_lua(code, script, target='luajit'):
+    """
+    Executes module code, then script with the module table as global M,
+    returns what script returns
+    """
+    lua = lua_runtime(target)
+    lua.globals().M = lua.execute(code)
+    return lua.execute(script)
@@ -0,0 +1,104 @@
+import os
+import pickle
+import asyncio
+import tempfile
+import unittest
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from py3lua import Translator, translate_many, translate_many_async
+from py3lua.profiler import NodeProfile
+
+
+SOURCES = [
+    ('a', 'def f(a):\n    return [a][0]\n'),
+    ('b', 'x = 1 + 2\n'),
+    ('bad', 'def (\n'),
+    ('c', 'class A:\n    __slots__ = ("x",)\n    def __init__(self, x):\n        self.x = x\n'),
+]
+
+
+class TestBatch(unittest.TestCase):
+    def setUp(self):
+        self.translator = Translator(runtime='used')
+        self.expected = {}
+        for name, source in SOURCES:
+            if name != 'bad':
+                self.expected[name] = Translator(runtime='used').translate(source)
+
+    def _check_results(self, results):
+        self.assertEqual(sorted(r.src_file for r in results), ['a', 'b', 'bad', 'c'])
+        for result in results:
+            if result.src_file == 'bad':
+                self.assertFalse(result.ok)
+                self.assertTrue(result.error.startswith('SyntaxError: '))
+                self.assertIsNone(result.code)
+            else:
+                self.assertTrue(result.ok)
+                self.assertEqual(result.code, self.expected[result.src_file])
+
+    def test_sequential(self):
+        results = list(translate_many(SOURCES, self.translator))
+        self.assertEqual([r.src_file for r in results], ['a', 'b', 'bad', 'c'])
+        self._check_results(results)
+        self.assertRaises(ValueError, translate_many, SOURCES, Translator(out_file='x.lua'))
+
+    def test_threads(self):
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            self._check_results(list(translate_many(SOURCES, self.translator, executor)))
+            results = list(translate_many(SOURCES * 8, self.translator, executor))
+        self.assertEqual(len(results), 32)
+        for result in results:
+            if result.ok:
+                self.assertEqual(result.code, self.expected[result.src_file])
+
+    def test_threads_with_collectors(self):
+        profile = NodeProfile()
+        translator = Translator(runtime='used', collectors=[profile])
+        sources = [(name, source) for name, source in SOURCES if name != 'bad'] * 4
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            results = list(translate_many(sources, translator, executor))
+        self.assertTrue(all(r.code == self.expected[r.src_file] for r in results))
+        self.assertEqual(profile.nodes['Module']['count'], 12)
+        self.assertEqual(profile._stack, [])
+
+    def test_processes(self):
+        with ProcessPoolExecutor(max_workers=2) as executor:
+            self._check_results(list(translate_many(SOURCES, self.translator, executor)))
+
+    def test_pickle(self):
+        profile = NodeProfile()
+        translator = Translator(runtime='used', collectors=[profile])
+        translator.translate('x = 1\n')
+        copy = pickle.loads(pickle.dumps(translator))
+        self.assertEqual(copy.options(), translator.options())
+        self.assertEqual(copy.translate('y = 2\n'), translator.translate('y = 2\n'))
+        self.assertEqual(profile.nodes['Module']['count'], 2)
+
+    def test_async(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            files = []
+            for name, source in SOURCES:
+                src_file = os.path.join(tmp, name + '.py')
+                with open(src_file, 'w') as f:
+                    f.write(source)
+                files.append((src_file, os.path.join(tmp, 'out', name + '.lua')))
+            files.append((os.path.join(tmp, 'missing.py'), os.path.join(tmp, 'out', 'missing.lua')))
+
+            async def collect():
+                with ThreadPoolExecutor(max_workers=2) as executor:
+                    return [r async for r in translate_many_async(files, self.translator, executor)]
+
+            results = asyncio.run(collect())
+            self.assertEqual(sorted(r.src_file for r in results), sorted(src for src, _ in files))
+            failed = sorted(os.path.basename(r.src_file) for r in results if not r.ok)
+            self.assertEqual(failed, ['bad.py', 'missing.py'])
+            for name, code in self.expected.items():
+                with open(os.path.join(tmp, 'out', name + '.lua')) as f:
+                    self.assertEqual(f.read(), code)
+            self.assertFalse(os.path.exists(os.path.join(tmp, 'out', 'bad.lua')))
+
+
+suite = unittest.TestLoader().loadTestsFromTestCase(TestBatch)
+
+
+if __name__ == '__main__':
+    unittest.TextTestRunner(verbosity=2).run(suite)
@@ -0,0 +1,94 @@
+import io
+import os
+import ast
+import tempfile
+import unittest
+from py3lua.bundler import bundle, bundle_file, module_file, required_modules
+from lua_vm import has_lua, lua_runtime
+
+
+class TestBundler(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.root = self.tmp.name
+        files = {
+            'main.py': 'import util\nfrom pkg import helper, sub\nimport os\nx = util.f(1)\ny = sub.g(helper)\n',
+            'util.py': 'def f(a):\n    return [a][0]\n',
+            'pkg/__init__.py': 'import util\nimport main\nhelper = 1\n',
+            'pkg/sub.py': 'def g(a):\n    return a + 1\n',
+            'unused.py': 'y = 2\n',
+        }
+        for rel_path, source in files.items():
+            path = os.path.join(self.root, rel_path)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'w') as f:
+                f.write(source)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_module_file(self):
+        self.assertEqual(module_file('util', self.root), os.path.join(self.root, 'util.py'))
+        self.assertEqual(module_file('pkg', self.root), os.path.join(self.root, 'pkg', '__init__.py'))
+        self.assertIsNone(module_file('os', self.root))
+
+    def test_required_modules(self):
+        tree = ast.parse('import a, b.c\nfrom d import e\nfrom . import f\ndef g():\n    import h\n')
+        self.assertEqual(sorted(required_modules(tree)), ['a', 'b.c', 'd', 'h'])
+        # names imported from packages are their submodules when there are such files
+        tree = ast.parse('from pkg import helper, sub\n')
+        self.assertEqual(required_modules(tree, self.root), ['pkg', 'pkg.sub'])
+
+    def test_bundle(self):
+        out = io.StringIO()
+        modules = bundle(os.path.join(self.root, 'main.py'), out)
+        self.assertEqual(modules, ['main', 'util', 'pkg', 'pkg.sub'])
+        code = out.getvalue()
+        self.assertEqual(code.count('package.preload["py3lua_runtime"] = function(...)\n'), 1)
+        self.assertEqual(code.count('local function list('), 1)
+        for name in modules:
+            self.assertIn('package.preload["{}"] = function(...)\nlocal M = {{}}\n'.format(name), code)
+        self.assertNotIn('unused', code)
+        self.assertIn('local os=require("os")', code)
+        self.assertIn('local helper=require("pkg").helper\nlocal sub=require("pkg.sub")\n', code)
+        self.assertTrue(code.endswith('return M\nend\n\nreturn require("main")\n'))
+
+    @unittest.skipUnless(has_lua(), "lupa is not installed")
+    def test_bundle_execute(self):
+        files = {
+            'app/run.py': 'from lib import sub\ndef h():\n    return sub.g(2)\n',
+            'app/lib/__init__.py': 'name = "lib"\n',
+            'app/lib/sub.py': 'def g(a):\n    return a + 1\n',
+        }
+        for rel_path, source in files.items():
+            path = os.path.join(self.root, rel_path)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'w') as f:
+                f.write(source)
+        out = io.StringIO()
+        self.assertEqual(bundle(os.path.join(self.root, 'app', 'run.py'), out), ['run', 'lib', 'lib.sub'])
+        self.assertEqual(lua_runtime().execute(out.getvalue()).h(), 3)
+
+    def test_bundle_file(self):
+        out_file = os.path.join(self.root, 'out', 'app.lua')
+        modules = bundle_file(os.path.join(self.root, 'util.py'), out_file)
+        self.assertEqual(modules, ['util'])
+        with open(out_file) as f:
+            self.assertTrue(f.read().startswith('-- util bundled by py3lua\n'))
+
+    def test_bundle_minified(self):
+        out = io.StringIO()
+        bundle(os.path.join(self.root, 'main.py'), out, options={'minify': 'names'})
+        code = out.getvalue()
+        self.assertEqual(code.count('\n'), 1)
+        self.assertIn('package.preload["util"]=function(...)', code)
+        self.assertRegex(code, r'function \w+\.f\(\w+\)')
+        self.assertTrue(code.endswith('return require("main")\n'))
+        self.assertRaises(ValueError, bundle, os.path.join(self.root, 'main.py'), out, options={'minify': 'all'})
+
+
+suite = unittest.TestLoader().loadTestsFromTestCase(TestBundler)
+
+
+if __name__ == '__main__':
+    unittest.TextTestRunner(verbosity=2).run(suite)
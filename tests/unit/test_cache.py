@@ -0,0 +1,87 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+from py3lua import cache
+from py3lua.cache import TranslationCache, code_fingerprint
+from py3lua.translator import Translator
+
+
+class TestTranslationCache(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.cache = TranslationCache(self.tmp.name)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_key(self):
+        key = self.cache.key('x = 1')
+        self.assertEqual(key, self.cache.key('x = 1', {}))
+        self.assertNotEqual(key, self.cache.key('x = 2'))
+        self.assertNotEqual(key, self.cache.key('x = 1', {'opt': 1}))
+
+    def test_key_fingerprint(self):
+        self.assertIs(code_fingerprint(), code_fingerprint())
+        key = self.cache.key('x = 1')
+        with mock.patch.object(cache, '_fingerprint', 'changed'):
+            self.assertNotEqual(self.cache.key('x = 1'), key)
+
+    def test_put_get(self):
+        key = self.cache.key('x = 1')
+        self.assertIsNone(self.cache.get(key))
+        self.cache.put(key, 'local x=1')
+        self.assertEqual(self.cache.get(key), 'local x=1')
+
+    def test_copy_to(self):
+        key = self.cache.key('x = 1')
+        out_file = os.path.join(self.tmp.name, 'out.txt')
+        self.assertFalse(self.cache.copy_to(key, out_file))
+        self.cache.put(key, 'local x=1')
+        self.assertTrue(self.cache.copy_to(key, out_file))
+        with open(out_file) as f:
+            self.assertEqual(f.read(), 'local x=1')
+
+    def test_evict_lru(self):
+        self.cache.max_size = 25
+        keys = [self.cache.key(str(i)) for i in range(3)]
+        for n, key in enumerate(keys[:2]):
+            self.cache.put(key, 'x' * 10)
+            os.utime(self.cache.lookup(key), (n, n))
+        self.cache.get(keys[0])
+        self.cache.put(keys[2], 'x' * 10)
+        self.assertIsNotNone(self.cache.get(keys[0]))
+        self.assertIsNone(self.cache.get(keys[1]))
+        self.assertIsNotNone(self.cache.get(keys[2]))
+
+    def test_evict_occasionally(self):
+        with mock.patch.object(self.cache, 'evict', wraps=self.cache.evict) as evict:
+            for i in range(cache.EVICT_INTERVAL + 1):
+                self.cache.put(self.cache.key(str(i)), 'x')
+            self.assertEqual(evict.call_count, 2)
+            self.cache.max_size = cache.EVICT_INTERVAL + 1
+            self.cache.put(self.cache.key('big'), 'x' * 10)
+            self.assertEqual(evict.call_count, 3)
+        self.assertLessEqual(self.cache._size, self.cache.max_size)
+
+    def test_translator_hit(self):
+        translator = Translator(cache=self.cache)
+        code = translator.translate('x = 1')
+        self.assertEqual(code, Translator().translate('x = 1'))
+        key = self.cache.key('x = 1', translator.options())
+        self.cache.put(key, 'cached')
+        self.assertEqual(translator.translate('x = 1'), 'cached')
+
+    def test_translator_out_file(self):
+        out_file = os.path.join(self.tmp.name, 'out.lua')
+        Translator(out_file=out_file, cache=self.cache).translate('x = 1')
+        key = self.cache.key('x = 1', Translator().options())
+        with open(out_file) as f:
+            self.assertEqual(f.read(), self.cache.get(key))
+
+
+suite = unittest.TestLoader().loadTestsFromTestCase(TestTranslationCache)
+
+
+if __name__ == '__main__':
+    unittest.TextTestRunner(verbosity=2).run(suite)
@@ -0,0 +1,107 @@
+import ast
+import unittest
+from py3lua.classes import class_layouts, instance_names, slot_names
+from py3lua.translator import Translator
+from lua_vm import has_lua, run_lua
+
+
+CLASSES = '''
+class P:
+    __slots__ = ("x", "y")
+    def __init__(self, x, y):
+        self.x = x
+        self.y = y
+    def total(self):
+        return self.x + self.y
+    def __eq__(self, other):
+        return self.x == other.x and self.y == other.y
+class Q(P):
+    __slots__ = ("z",)
+    def __init__(self, x, y, z):
+        P.__init__(self, x, y)
+        self.z = z
+    @classmethod
+    def make(cls):
+        return cls(1, 2, 3)
+class R(Q):
+    pass
+class S:
+    def __init__(self, v):
+        self.v = v
+class T(S):
+    __slots__ = ("x",)
+    def __init__(self, v, x):
+        S.__init__(self, v)
+        self.x = x
+'''
+
+
+class TestClasses(unittest.TestCase):
+    def test_slot_names(self):
+        tree = ast.parse(
+            'class A:\n    __slots__ = ("x", "y")\n'
+            'class B:\n    __slots__ = "x"\n'
+            'class C:\n    __slots__ = names\n'
+            'class D:\n    pass\n'
+        )
+        self.assertEqual([slot_names(c) for c in tree.body], [('x', 'y'), ('x',), None, None])
+
+    def test_layouts(self):
+        layouts = class_layouts(ast.parse(
+            'class B(A):\n    __slots__ = ("z", "x")\n    @classmethod\n    def make(cls):\n        pass\n'
+            'class A(object):\n    __slots__ = ("x", "y")\n    @staticmethod\n    def zero():\n        pass\n'
+            'class C(B):\n    pass\n'
+            'class D(C):\n    __slots__ = ("w",)\n'
+            'class E(Base):\n    __slots__ = ("v",)\n'
+            'class F:\n    pass\n'
+            'F = 1\n'
+            'class G:\n    pass\n'
+            'class H(G):\n    __slots__ = ("x",)\n'
+        ))
+        self.assertEqual(sorted(layouts), ['A', 'B', 'C', 'D', 'E', 'G', 'H'])
+        self.assertEqual(layouts['B'].slots, ('x', 'y', 'z'))
+        self.assertEqual(layouts['B'].index, {'x': 1, 'y': 2, 'z': 3})
+        self.assertEqual((layouts['B'].classmethods, layouts['B'].staticmethods), ({'make'}, {'zero'}))
+        self.assertFalse(layouts['B'].open)
+        self.assertEqual((layouts['C'].slots, layouts['C'].open), (('x', 'y', 'z'), True))
+        self.assertEqual((layouts['D'].slots, layouts['D'].open), (('x', 'y', 'z', 'w'), True))
+        # slots of a class defined elsewhere are not known
+        self.assertEqual((layouts['E'].slots, layouts['E'].open), ((), True))
+        # instances of classes without slots take any attribute, so do those of their subclasses
+        self.assertEqual((layouts['G'].slots, layouts['G'].open), ((), True))
+        self.assertEqual((layouts['H'].slots, layouts['H'].open), (('x',), True))
+
+    def test_instance_names(self):
+        tree = ast.parse(
+            'class P:\n    __slots__ = ("x",)\n    def m(self, other):\n        q = P()\n        r = P()\n'
+            '        r = None\n        return self.x\n'
+            'class Q:\n    pass\n'
+            'p = P()\nq = Q()\n'
+        )
+        layouts = class_layouts(tree)
+        method = tree.body[0].body[1]
+        self.assertEqual(instance_names(method, layouts, layouts['P']), {'self': layouts['P'], 'q': layouts['P']})
+        self.assertEqual(instance_names(method, layouts), {'q': layouts['P']})
+        self.assertEqual(instance_names(tree, layouts), {'p': layouts['P']})
+
+    @unittest.skipUnless(has_lua(), "lupa is not installed")
+    def test_execute(self):
+        for target in ('luajit', '5.4'):
+            code = Translator(target=target).translate(CLASSES)
+            self.assertEqual(tuple(run_lua(code, (
+                'local p, q = M.P(1, 2), M.Q:make()\n'
+                'local r = M.R(4, 5, 6)\n'
+                'r.w = 7\n'
+                'local t = M.T(9, 10)\n'
+                'return p:total(), p.x, q:total() + q.z, r.z + r.w, p == M.P(1, 2), M.S(8).v, t.v + t.x, t[1]'
+            ), target)), (3, 1, 6, 13, True, 8, 19, 10))
+            ok, error = run_lua(code, 'return pcall(function() M.P(1, 2).w = 1 end)', target)
+            self.assertFalse(ok)
+            self.assertIn("'P' object has no attribute 'w'", error)
+
+
+suite = unittest.TestLoader().loadTestsFromTestCase(TestClasses)
+
+
+if __name__ == '__main__':
+    unittest.TextTestRunner(verbosity=2).run(suite)
@@ -0,0 +1,35 @@
+import io
+import unittest
+from py3lua.emitter import Emitter
+
+
+class TestEmitter(unittest.TestCase):
+    def test_getvalue(self):
+        emitter = Emitter()
+        emitter.write('local x')
+        emitter.write_line('=1')
+        emitter.write_line()
+        self.assertEqual(emitter.getvalue(), 'local x=1\n\n')
+
+    def test_stream_chunks(self):
+        stream = io.StringIO()
+        emitter = Emitter(stream, chunk_size=8)
+        emitter.write('abc')
+        self.assertEqual(stream.getvalue(), '')
+        emitter.write('defgh')
+        self.assertEqual(stream.getvalue(), 'abcdefgh')
+        emitter.write('ij')
+        emitter.flush()
+        self.assertEqual(stream.getvalue(), 'abcdefghij')
+
+    def test_stream_getvalue(self):
+        emitter = Emitter(io.StringIO())
+        with self.assertRaises(ValueError):
+            emitter.getvalue()
+
+
+suite = unittest.TestLoader().loadTestsFromTestCase(TestEmitter)
+
+
+if __name__ == '__main__':
+    unittest.TextTestRunner(verbosity=2).run(suite)
@@ -0,0 +1,51 @@
+import ast
+import unittest
+from py3lua.inference import TypeInference, type_report, NUMBER, STRING
+
+
+class TestTypeInference(unittest.TestCase):
+    def _add_types(self, source):
+        inference = TypeInference(ast.parse(source))
+        return [inference.add_type(site) for site in inference.sites]
+
+    def test_literals(self):
+        self.assertEqual(self._add_types('x = 1 + 2\ny = "a" + "b"\nz = 1 + "a"'), [NUMBER, STRING, None])
+
+    def test_assignments(self):
+        source = 'x = 1\ny = x + 2\ns = "a"\ns = s + "b"\nt = 0\nt = "x"\nu = t + 1'
+        self.assertEqual(self._add_types(source), [NUMBER, STRING, None])
+
+    def test_annotations(self):
+        source = (
+            'def f(a: int, b: float) -> int:\n    return a + b\n'
+            'def g(q: str, r) -> str:\n    return q + r\n'
+            'x = f(1, 2) + 1\ny = g("a", 1) + "b"\n'
+        )
+        self.assertEqual(self._add_types(source), [NUMBER, None, NUMBER, STRING])
+
+    def test_scopes(self):
+        source = (
+            'x = "a"\n'
+            'def f():\n    x = 1\n    return x + 1\n'
+            'def g():\n    return x + "b"\n'
+            'def h():\n    global x\n    x = 2\n'
+            'y = x + 1\n'
+        )
+        self.assertEqual(self._add_types(source), [NUMBER, None, None])
+
+    def test_loops(self):
+        source = 'for i in range(10):\n    y = i + 1\nfor j in lst:\n    z = j + 1\n'
+        self.assertEqual(self._add_types(source), [NUMBER, None])
+        source = 'range = list\nfor i in range(10):\n    y = i + 1\n'
+        self.assertEqual(self._add_types(source), [None])
+
+    def test_report(self):
+        report = type_report('x = 1 + 2\ny = "a" + "b"\nz = x + w\n')
+        self.assertEqual(report, {'sites': 3, 'number': 1, 'string': 1, 'dynamic': 1})
+
+
+suite = unittest.TestLoader().loadTestsFromTestCase(TestTypeInference)
+
+
+if __name__ == '__main__':
+    unittest.TextTestRunner(verbosity=2).run(suite)
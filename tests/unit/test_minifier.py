@@ -0,0 +1,89 @@
+import unittest
+from py3lua.minifier import minify, tokenize
+from py3lua.runtime import STDLIB
+from py3lua.translator import Translator
+
+
+class TestMinifier(unittest.TestCase):
+    def test_tokenize(self):
+        tokens = tokenize('local s = "a -- b" .. [[x]] -- c\n--[==[ d ]==] x = 0x1F + 1.5e3 ... ~= a.b')
+        self.assertEqual(
+            [t.text for t in tokens],
+            ['local', 's', '=', '"a -- b"', '..', '[[x]]', 'x', '=', '0x1F', '+', '1.5e3', '...', '~=', 'a', '.', 'b']
+        )
+        self.assertEqual([t.kind for t in tokens[:3]], ['keyword', 'name', 'op'])
+        self.assertRaises(ValueError, tokenize, 'x = $')
+
+    def test_whitespace(self):
+        self.assertEqual(minify('local x = 1\n\n-- comment\nreturn x .. 2\n'), 'local x=1 return x.. 2\n')
+        self.assertEqual(minify('x = a - -b\ny = 1 .. "s"\n'), 'x=a- -b y=1 .."s"\n')
+        self.assertEqual(minify('if a then\n    f()\nend\n'), 'if a then f()end\n')
+
+    def test_parentheses(self):
+        cases = [
+            ('x = (a + (b * 2))', 'x=a+b*2'),
+            ('x = a - (b - 1)', 'x=a-(b-1)'),
+            ('x = (a - b) - 1', 'x=a-b-1'),
+            ('x = -(-a)', 'x=- -a'),
+            ('x = -(a ^ 2)', 'x=-a^2'),
+            ('x = (-a) ^ 2', 'x=(-a)^2'),
+            ('x = 2 ^ (3 ^ a)', 'x=2^3^a'),
+            ('x = (a .. b) .. c', 'x=(a..b)..c'),
+            ('x = a and (b or c)', 'x=a and(b or c)'),
+            ('x = (a < b) and (c == d)', 'x=a<b and c==d'),
+            ('x = (s):len()', 'x=s:len()'),
+            ('x = ("s"):rep(2)', 'x=("s"):rep(2)'),
+            ('x = (a + b).c', 'x=(a+b).c'),
+            ('x = f((a))', 'x=f(a)'),
+            ('return (f())', 'return(f())'),
+            ('return (...), (f()) + 1', 'return(...),f()+1'),
+            ('x = (function() end)()', 'x=(function()end)()'),
+        ]
+        for code, expected in cases:
+            self.assertEqual(minify(code), expected + '\n', code)
+
+    def test_names(self):
+        code = (
+            'local M = {}\n'
+            'local x, y = 1, x\n'
+            'local function f(a, ...)\n'
+            '    local b = a.x\n'
+            '    for i, v in pairs(b) do print(i, v) end\n'
+            '    return {a = a, [b] = y}\n'
+            'end\n'
+            'function M.g(self) return f(self) end\n'
+            'function M:h() return self end\n'
+            'return M\n'
+        )
+        self.assertEqual(minify(code, names=True), (
+            'local a={}local b,c=1,x local function d(e,...)local f=e.x for g,h in pairs(f)do print(g,h)end '
+            'return{a=e,[f]=c}end function a.g(i)return d(i)end function a:h()return self end return a\n'
+        ))
+
+    def test_runtime(self):
+        compact = minify(STDLIB)
+        renamed = minify(STDLIB, names=True)
+        self.assertLess(len(renamed), len(compact))
+        self.assertLess(len(compact), len(STDLIB))
+        self.assertEqual(minify(compact), compact)
+        self.assertNotIn('local function list(', renamed)
+        self.assertIn('("list index out of range",2)', renamed)
+        self.assertIn('rawset(', renamed)
+
+    def test_translator(self):
+        source = 'def f(a, b):\n    return (a + 1) * b\n'
+        self.assertEqual(
+            Translator(runtime='used', minify='compact').translate(source),
+            minify(Translator(runtime='used').translate(source))
+        )
+        code = Translator(runtime='used', minify='names').translate(source)
+        self.assertTrue(code.endswith('function a.f(o,p)return b(o,1)*p end return a\n'))
+        self.assertNotEqual(Translator(minify='names').options(), Translator().options())
+        self.assertRaises(ValueError, Translator, minify='all')
+
+
+suite = unittest.TestLoader().loadTestsFromTestCase(TestMinifier)
+
+
+if __name__ == '__main__':
+    unittest.TextTestRunner(verbosity=2).run(suite)
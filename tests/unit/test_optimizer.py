@@ -0,0 +1,108 @@
+import ast
+import unittest
+from py3lua.optimizer import (
+    Optimizer, ConstantFolding, ConstantPropagation, DeadCodeElimination, Inlining, format_stats
+)
+from py3lua.translator import Translator
+
+
+class TestOptimizer(unittest.TestCase):
+    def _optimize(self, source, passes):
+        stats = []
+        tree = Optimizer(passes=passes).run(ast.parse(source), stats)
+        return ast.unparse(tree), dict(stats)
+
+    def test_constant_folding(self):
+        code, stats = self._optimize(
+            'x = 2 ** 10 * 4\ny = "a" + "b" * 2\nz = 1 < 2 < 3\nw = -(3 - 5)\nv = 1 and y\nu = 0 and y',
+            [ConstantFolding]
+        )
+        self.assertEqual(code, "x = 4096\ny = 'abb'\nz = True\nw = 2\nv = y\nu = 0")
+        self.assertEqual(stats['constant-folding'], {'folded': 8})
+
+    def test_constant_folding_limits(self):
+        source = 'x = 1 / 0\ny = 2 ** 100\nz = "a" * 100000\nw = 10 ** 10 ** 10'
+        code, _ = self._optimize(source, [ConstantFolding])
+        self.assertEqual(code, 'x = 1 / 0\ny = 2 ** 100\nz = \'a\' * 100000\nw = 10 ** 10000000000')
+
+    def test_constant_propagation(self):
+        source = (
+            'def f():\n    return A + B\n'
+            'A = 1\nB = 2\nB = 3\nC = "c"\n'
+            'def g(C):\n    return C\n'
+            'x = A\n'
+        )
+        code, stats = self._optimize(source, [ConstantPropagation])
+        self.assertEqual(
+            code,
+            'def f():\n    return 1 + B\nA = 1\nB = 2\nB = 3\nC = \'c\'\n\ndef g(C):\n    return C\nx = 1'
+        )
+        self.assertEqual(stats['constant-propagation'], {'constants': 2, 'replaced': 2})
+
+    def test_dead_code_elimination(self):
+        source = (
+            'def f(x):\n'
+            '    if False:\n        x = 1\n'
+            '    if True:\n        x = 2\n    else:\n        x = 3\n'
+            '    if x:\n        return 1\n    else:\n        return 2\n'
+            '    x = 4\n'
+        )
+        code, stats = self._optimize(source, [DeadCodeElimination])
+        self.assertEqual(code, 'def f(x):\n    x = 2\n    if x:\n        return 1\n    else:\n        return 2')
+        self.assertEqual(stats['dead-code-elimination'], {'branches': 2, 'statements': 1})
+
+    def test_dead_code_elimination_generators(self):
+        source = (
+            'def g():\n    return\n    yield 1\n'
+            'def h():\n    if False:\n        yield 1\n    def k():\n        yield 2\n    return k\n'
+        )
+        code, stats = self._optimize(source, [DeadCodeElimination])
+        self.assertEqual(code, (
+            'def g():\n    if False:\n        yield\n    return\n\n'
+            'def h():\n    if False:\n        yield\n\n    def k():\n        yield 2\n    return k'
+        ))
+        self.assertEqual(stats['dead-code-elimination'], {'branches': 1, 'statements': 1, 'yield-markers': 2})
+        code = Translator(opt_level=1).translate(source)
+        self.assertIn('function M.g()\n    return generator(function()\n', code)
+        self.assertIn('function M.h()\n    return generator(function()\n', code)
+
+    def test_inlining(self):
+        source = (
+            'def sq(v):\n    """square"""\n    return v * v\n'
+            'def clamp(x, lo, hi):\n    return min(max(x, lo), hi)\n'
+            'def log(v):\n    print(v)\n    return v\n'
+            'def ident(v):\n    return v\n'
+            'def scaled(v):\n    return v * K\n'
+            'def f(p, n, K):\n    return clamp(p.x + 1, 0, n) + sq(p.x) + sq(log(n)) + ident(n) + scaled(n) + sq(n, 1) + sq(n)\n'
+            'fs = [ident]\n'
+        )
+        code, stats = self._optimize(source, [Inlining])
+        self.assertIn(
+            'return min(max(p.x + 1, 0), n) + sq(p.x) + sq(log(n)) + ident(n) + scaled(n) + sq(n, 1) + n * n', code
+        )
+        self.assertEqual(stats['inlining'], {'functions': 2, 'inlined': 2, 'repeated-arguments': 1})
+        # arguments used twice are not computed twice
+        code, stats = self._optimize('def sq(v):\n    return v * v\nx = sq(sq(sq(a)))\n', [Inlining])
+        self.assertTrue(code.endswith('\nx = sq(sq(a * a))'))
+        self.assertEqual(stats['inlining'], {'functions': 1, 'inlined': 1, 'repeated-arguments': 1})
+        code, stats = self._optimize('def inc(v):\n    return v + 1\nx = ' + 'inc(' * 20 + 'a' + ')' * 20 + '\n', [Inlining])
+        self.assertTrue(code.endswith('\nx = inc(a' + ' + 1' * 19 + ')'))
+        self.assertEqual(stats['inlining'], {'functions': 1, 'inlined': 19, 'over-budget': 1})
+
+    def test_levels(self):
+        source = 'N = 4\ndef f(x):\n    if N > 2:\n        return x\n    return 0\n'
+        self.assertEqual(Translator().translate(source), Translator(opt_level=0).translate(source))
+        code = Translator(opt_level=2).translate(source)
+        self.assertIn('function M.f(x)\n    return x\nend\n', code)
+        self.assertNotEqual(Translator(opt_level=1).options(), Translator(opt_level=2).options())
+
+    def test_format_stats(self):
+        stats = [('constant-folding', {'folded': 2}), ('dead-code-elimination', {})]
+        self.assertEqual(format_stats(stats), 'constant-folding         folded=2\ndead-code-elimination    -')
+
+
+suite = unittest.TestLoader().loadTestsFromTestCase(TestOptimizer)
+
+
+if __name__ == '__main__':
+    unittest.TextTestRunner(verbosity=2).run(suite)
@@ -0,0 +1,72 @@
+import json
+import unittest
+from py3lua.profiler import Collector, NodeProfile, format_profile
+from py3lua.translator import Translator
+
+
+class Recorder(Collector):
+    def __init__(self):
+        self.events = []
+
+    def enter(self, node):
+        self.events.append(('enter', node.__class__.__name__))
+
+    def leave(self, node, code):
+        self.events.append(('leave', node.__class__.__name__, code))
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        self.now += 1.0
+        return self.now
+
+
+class TestProfiler(unittest.TestCase):
+    def test_collector_hooks(self):
+        recorder = Recorder()
+        Translator(collectors=[recorder]).translate_to('x = y\n', _Null())
+        self.assertEqual(recorder.events, [
+            ('enter', 'Assign'), ('enter', 'Name'), ('leave', 'Name', 'y'), ('leave', 'Assign', 'local x=y'),
+        ])
+
+    def test_no_collectors(self):
+        translator = Translator()
+        self.assertNotIn('visit', vars(translator))
+        self.assertIn('visit', vars(Translator(collectors=[Collector()])))
+
+    def test_node_profile(self):
+        profile = NodeProfile(clock=FakeClock())
+        source = 'def f(a):\n    return (a + 1) + 2\nx = 1\n'
+        code = Translator(collectors=[profile]).translate(source)
+        nodes = profile.nodes
+        self.assertEqual(nodes['Module']['count'], 1)
+        self.assertEqual(nodes['Module']['bytes'], len(code))
+        self.assertEqual(nodes['BinOp']['count'], 2)
+        # every clock call is a tick: the inner BinOp spans 5 ticks, 2 of
+        # them in its children, the outer one spans 9 ticks
+        self.assertEqual(nodes['BinOp']['cumtime'], 9.0)
+        self.assertEqual(nodes['BinOp']['tottime'], 3.0 + 3.0)
+        self.assertEqual(list(profile.functions), ['f:1'])
+        self.assertEqual(profile.functions['f:1']['count'], 7)
+        self.assertEqual(json.loads(profile.to_json())['functions']['f:1']['count'], 7)
+        table = format_profile(profile, limit=2)
+        self.assertEqual(table.split('\n')[1].split()[0], 'BinOp')
+        self.assertIn('f:1', table)
+
+
+class _Null:
+    def write(self, s):
+        pass
+
+    def flush(self):
+        pass
+
+
+suite = unittest.TestLoader().loadTestsFromTestCase(TestProfiler)
+
+
+if __name__ == '__main__':
+    unittest.TextTestRunner(verbosity=2).run(suite)
@@ -0,0 +1,73 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+from py3lua.cache import TranslationCache
+from py3lua.project import lua_path, find_sources, translate_project
+
+
+class TestProject(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.src_dir = os.path.join(self.tmp.name, 'src')
+        self.out_dir = os.path.join(self.tmp.name, 'out')
+        files = {
+            'pkg/__init__.py': 'x = 1\n',
+            'pkg/mod.py': 'def f(a):\n    return a\n',
+            'pkg/sub/bad.py': 'def (\n',
+            'pkg/readme.txt': 'not python\n',
+        }
+        for rel_path, source in files.items():
+            path = os.path.join(self.src_dir, rel_path)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'w') as f:
+                f.write(source)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_lua_path(self):
+        self.assertEqual(lua_path(os.path.join('pkg', 'mod.py')), os.path.join('pkg', 'mod.lua'))
+        self.assertEqual(lua_path(os.path.join('pkg', '__init__.py')), os.path.join('pkg', 'init.lua'))
+
+    def test_find_sources(self):
+        self.assertEqual(
+            find_sources(self.src_dir),
+            [os.path.join('pkg', '__init__.py'), os.path.join('pkg', 'mod.py'), os.path.join('pkg', 'sub', 'bad.py')]
+        )
+
+    def _check_results(self, results):
+        failed = [r for r in results if not r.ok]
+        self.assertEqual(len(results), 3)
+        self.assertEqual(len(failed), 1)
+        self.assertTrue(failed[0].src_file.endswith('bad.py'))
+        self.assertTrue(failed[0].error.startswith('SyntaxError'))
+        self.assertTrue(os.path.isfile(os.path.join(self.out_dir, 'pkg', 'init.lua')))
+        self.assertTrue(os.path.isfile(os.path.join(self.out_dir, 'pkg', 'mod.lua')))
+        self.assertFalse(os.path.exists(os.path.join(self.out_dir, 'pkg', 'sub', 'bad.lua')))
+
+    def test_translate_project_serial(self):
+        self._check_results(list(translate_project(self.src_dir, self.out_dir, jobs=1)))
+
+    def test_translate_project_parallel(self):
+        self._check_results(list(translate_project(self.src_dir, self.out_dir, jobs=2)))
+
+    def test_translate_project_cached(self):
+        cache_dir = os.path.join(self.tmp.name, 'cache')
+        self._check_results(list(translate_project(self.src_dir, self.out_dir, jobs=1, cache_dir=cache_dir)))
+        self.assertEqual(len(os.listdir(cache_dir)), 2)
+        self._check_results(list(translate_project(self.src_dir, self.out_dir, jobs=2, cache_dir=cache_dir)))
+
+    def test_translate_project_shares_cache(self):
+        cache_dir = os.path.join(self.tmp.name, 'cache')
+        # one cache serves every file, so its directory is scanned on the first store only
+        with mock.patch.object(TranslationCache, 'evict', autospec=True, side_effect=TranslationCache.evict) as evict:
+            self._check_results(list(translate_project(self.src_dir, self.out_dir, jobs=1, cache_dir=cache_dir)))
+        self.assertEqual(evict.call_count, 1)
+
+
+suite = unittest.TestLoader().loadTestsFromTestCase(TestProject)
+
+
+if __name__ == '__main__':
+    unittest.TextTestRunner(verbosity=2).run(suite)
@@ -0,0 +1,167 @@
+import os
+import ast
+import tempfile
+import unittest
+from py3lua.runtime import (
+    STDLIB, RUNTIME_FOOTER, runtime_code, runtime_module, runtime_parts, runtime_refs, write_runtime
+)
+from py3lua.translator import Translator
+from lua_vm import has_lua, run_lua
+
+
+class TestRuntime(unittest.TestCase):
+    def test_runtime_refs(self):
+        tree = ast.parse('x = [1][0:]\ny = len(x) + a\nfor i in range(3):\n    pass\n')
+        self.assertEqual(runtime_refs(tree), {'_list_of', '_slice', 'len', 'range', '_add_op', '_iter'})
+        refs = runtime_refs(tree, numeric_loop=lambda loop: True)
+        self.assertEqual(refs, {'_list_of', '_slice', 'len', 'range', '_add_op'})
+        # loops over range() which are not lowered to a numeric for call _iter
+        source = 'def f(n, step):\n    for i in range(0, n, step()):\n        n = i\n    return [i for i in range(n)]\n'
+        code = Translator(runtime='used').translate(source)
+        self.assertIn('for i in _iter(range(0,n,step())) do', code)
+        self.assertIn('local function _iter(', code)
+        self.assertIn('local _iter = _runtime._iter\n', Translator(runtime='shared').translate(source))
+        code = Translator(runtime='used').translate('def f(n):\n    for i in range(n):\n        n = i\n')
+        self.assertNotIn('_iter', code)
+        code = Translator(runtime='used').translate('range = g\ndef f(n):\n    for i in range(n):\n        n = i\n')
+        self.assertIn('local function _iter(', code)
+        tree = ast.parse('def f(a):\n    yield 1\n    yield from a\nnext(f(x))\n')
+        self.assertEqual(runtime_refs(tree), {'generator', '_yield_from', 'next'})
+        self.assertEqual(runtime_parts(['next']), ['builtins', 'generator', 'next'])
+        tree = ast.parse('@functools.cache\ndef f(a):\n    pass\n@lru_cache(10)\ndef g(a):\n    pass\n')
+        self.assertEqual(runtime_refs(tree), {'lru_cache'})
+        self.assertEqual(runtime_refs(ast.parse('s = ", ".join(x)')), {'_join'})
+        self.assertEqual(runtime_refs(ast.parse('class A:\n    pass\n')), {'class'})
+        self.assertEqual(runtime_refs(ast.parse('x = {1: 2}\ny = 1 in x\n')), {'_dict_of', '_contains'})
+        self.assertEqual(runtime_parts(['_dict_of']), ['builtins', 'dict', '_dict_of'])
+        self.assertEqual(runtime_parts(['class']), ['builtins', '_table_new', 'class'])
+
+    def test_runtime_parts(self):
+        self.assertEqual(runtime_parts([]), [])
+        self.assertEqual(runtime_parts(['len']), ['builtins', 'len'])
+        self.assertEqual(runtime_parts(['_slice']), ['builtins', 'list', '_slice_bounds', '_slice'])
+        self.assertEqual(runtime_code(None), STDLIB)
+        self.assertEqual(runtime_code([]), RUNTIME_FOOTER)
+
+    def test_translate_used(self):
+        code = Translator(runtime='used').translate('x = 1 + 2\ny = len(z)\n')
+        self.assertIn('local function len(obj)', code)
+        self.assertNotIn('_add_op', code)
+        self.assertNotIn('local function list', code)
+        self.assertEqual(
+            Translator(runtime='used').translate('x = 1'),
+            'local M = {}\n' + RUNTIME_FOOTER + 'local x=1\n\nreturn M\n'
+        )
+
+    def test_translate_shared(self):
+        code = Translator(runtime='shared').translate('x = a + b\ny = [1, 2]\n')
+        self.assertEqual(code, (
+            'local M = {}\n\n'
+            'local _runtime = require("py3lua_runtime")\n'
+            'local _add_op = _runtime._add_op\n'
+            'local _list_of = _runtime._list_of\n' + RUNTIME_FOOTER +
+            'local x=_add_op(a,b)\nlocal y=_list_of({[0]=1,2,n=2})\n\nreturn M\n'
+        ))
+        self.assertNotEqual(Translator(runtime='shared').options(), Translator().options())
+        self.assertRaises(ValueError, Translator, runtime='none')
+
+    def test_write_runtime(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            out_dir = os.path.join(tmp, 'out')
+            path = write_runtime(out_dir)
+            self.assertEqual(path, os.path.join(out_dir, 'py3lua_runtime.lua'))
+            with open(path) as f:
+                code = f.read()
+            self.assertEqual(code, runtime_module())
+            self.assertTrue(code.endswith('    _iter = _iter,\n}\n'))
+            mtime = os.stat(path).st_mtime_ns
+            write_runtime(out_dir)
+            self.assertEqual(os.stat(path).st_mtime_ns, mtime)
+
+    @unittest.skipUnless(has_lua(), "lupa is not installed")
+    def test_dict_method_keys(self):
+        code = Translator().translate(
+            'def run():\n'
+            '    d = {"get": 1, "items": 2, "keys": 3, "pop": 4, "iter": 5}\n'
+            '    total = 0\n'
+            '    for k in d:\n'
+            '        total = total + d[k]\n'
+            '    for k, v in d.items():\n'
+            '        total = total + v\n'
+            '    return [d.get("get"), d.get("x", 7), d.pop("pop"), len(d), total, len(d.keys()), d["items"]]\n'
+        )
+        self.assertEqual(
+            tuple(run_lua(code, 'local r = M.run() return r[0], r[1], r[2], r[3], r[4], r[5], r[6]')),
+            (1, 7, 4, 4, 30, 4, 2)
+        )
+
+    @unittest.skipUnless(has_lua(), "lupa is not installed")
+    def test_cache_nil_and_nan(self):
+        code = Translator(runtime='used').translate(
+            'import functools\ncalls = [0]\n@functools.cache\ndef f(x):\n    calls[0] = calls[0] + 1\n    return calls[0]\n'
+        )
+        self.assertEqual(tuple(run_lua(code, 'return M.f(nil), M.f(0/0), M.f(nil), M.f(0/0)')), (1, 2, 1, 2))
+
+    @unittest.skipUnless(has_lua(), "lupa is not installed")
+    def test_cache_several_arguments(self):
+        code = Translator(runtime='used').translate(
+            'import functools\ncalls = [0]\n'
+            '@functools.lru_cache(2)\ndef f(x, y):\n    calls[0] = calls[0] + 1\n    return calls[0]\n'
+            '@functools.cache\ndef g(x, y):\n    calls[0] = calls[0] + 1\n    return calls[0]\n'
+        )
+        script = (
+            'local t = {} local a = M.f(0.3, 1) local b = M.f(0.1 + 0.2, 1) local c = M.f(0.3, 1) '
+            'local d = M.g(0.3, t) local e = M.g(0.1 + 0.2, t) local h = M.g(0.3, t) '
+            'M.f(1, 2) M.f(3, 4) M.f(5, nil) '
+            'return a, b, c, d, e, h, M.f.tree.children[2].count, M.f(5, nil), M.f(5), M.f.size'
+        )
+        for target in ('luajit', '5.4'):
+            # keys of evicted calls are removed from the tree
+            self.assertEqual(tuple(run_lua(code, script, target)), (1, 2, 1, 3, 4, 3, 2, 7, 8, 2))
+
+    @unittest.skipUnless(has_lua(), "lupa is not installed")
+    def test_many_module_names(self):
+        # lua allows 200 locals in a function, the runtime takes a local per exported helper
+        source = ''.join('x{} = {}\n'.format(i, i) for i in range(170)) + 'def f():\n    return x0 + x169\n'
+        code = Translator().translate(source)
+        for target in ('luajit', '5.4'):
+            self.assertEqual(run_lua(code, 'return M.f()', target), 169)
+
+    @unittest.skipUnless(has_lua(), "lupa is not installed")
+    def test_list_stores(self):
+        code = Translator().translate(
+            'def run():\n'
+            '    xs = [x * 2 for x in range(3)]\n'
+            '    xs[-1] = 9\n'
+            '    xs[0] = 5\n'
+            '    ys = [0, 1, 2, 3]\n'
+            '    ys.append(7)\n'
+            '    ys.insert(0, 1)\n'
+            '    ys[-2] = 8\n'
+            '    return [xs[0], xs[1], xs[2], len(xs), ys[5], ys[4], len(ys)]\n'
+            '\n'
+            'def store(i):\n'
+            '    xs = [1, 2]\n'
+            '    xs[i] = 3\n'
+            '    return xs[0]\n'
+        )
+        for target in ('luajit', '5.4'):
+            self.assertEqual(
+                tuple(run_lua(code, 'local r = M.run() return r[0], r[1], r[2], r[3], r[4], r[5], r[6]', target)),
+                (5, 2, 9, 3, 7, 8, 6)
+            )
+            ok, error, ok_negative, _, first = run_lua(
+                code, 'local a, e = pcall(M.store, 2) local b, f = pcall(M.store, -3) return a, e, b, f, M.store(-2)',
+                target
+            )
+            self.assertFalse(ok)
+            self.assertTrue(error.endswith('list assignment index out of range'))
+            self.assertFalse(ok_negative)
+            self.assertEqual(first, 3)
+
+
+suite = unittest.TestLoader().loadTestsFromTestCase(TestRuntime)
+
+
+if __name__ == '__main__':
+    unittest.TextTestRunner(verbosity=2).run(suite)
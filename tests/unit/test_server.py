@@ -0,0 +1,114 @@
+import io
+import os
+import json
+import socket
+import tempfile
+import threading
+import unittest
+from unittest import mock
+from py3lua.server import handle_request, serve_stream, UnixServer, Watcher
+from py3lua.translator import Translator
+
+
+class TestServer(unittest.TestCase):
+    def setUp(self):
+        self.translator = Translator()
+        self.tmp = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_handle_request(self):
+        res = handle_request(self.translator, json.dumps({'id': 1, 'source': 'x = 1'}))
+        self.assertEqual(res, {'id': 1, 'ok': True, 'lua': self.translator.translate('x = 1')})
+
+    def test_handle_request_path(self):
+        src_file = os.path.join(self.tmp.name, 'a.py')
+        out_file = os.path.join(self.tmp.name, 'a.lua')
+        with open(src_file, 'w') as f:
+            f.write('x = 1')
+        res = handle_request(self.translator, json.dumps({'id': 2, 'path': src_file, 'out_file': out_file}))
+        self.assertEqual(res, {'id': 2, 'ok': True})
+        with open(out_file) as f:
+            self.assertEqual(f.read(), self.translator.translate('x = 1'))
+
+    def test_handle_request_errors(self):
+        res = handle_request(self.translator, json.dumps({'id': 3, 'source': 'def (\n'}))
+        self.assertFalse(res['ok'])
+        self.assertEqual(res['error']['type'], 'SyntaxError')
+        self.assertEqual(res['error']['lineno'], 1)
+        res = handle_request(self.translator, 'not json')
+        self.assertEqual(res['error']['type'], 'ProtocolError')
+        res = handle_request(self.translator, '{"id": 4}')
+        self.assertEqual(res['id'], 4)
+        self.assertEqual(res['error']['type'], 'ValueError')
+
+    def test_serve_stream(self):
+        rfile = io.StringIO('{"id": 1, "source": "x = 1"}\n\n{"id": 2, "source": "y = 2"}\n')
+        wfile = io.StringIO()
+        serve_stream(self.translator, rfile, wfile)
+        responses = [json.loads(line) for line in wfile.getvalue().splitlines()]
+        self.assertEqual([r['id'] for r in responses], [1, 2])
+        self.assertTrue(all(r['ok'] for r in responses))
+
+    @unittest.skipUnless(hasattr(socket, 'AF_UNIX'), "unix sockets are not supported")
+    def test_unix_server(self):
+        path = os.path.join(self.tmp.name, 'py3lua.sock')
+        server = UnixServer(path, self.translator)
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        try:
+            with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+                client.connect(path)
+                client.sendall(b'{"id": 1, "source": "x = 1"}\n')
+                rfile = client.makefile()
+                res = json.loads(rfile.readline())
+                rfile.close()
+            self.assertTrue(res['ok'])
+        finally:
+            server.shutdown()
+            server.server_close()
+        self.assertFalse(os.path.exists(path))
+
+    def test_watcher(self):
+        src_dir = os.path.join(self.tmp.name, 'src')
+        out_dir = os.path.join(self.tmp.name, 'out')
+        os.makedirs(src_dir)
+        src_file = os.path.join(src_dir, 'a.py')
+        with open(src_file, 'w') as f:
+            f.write('x = 1')
+        events = io.StringIO()
+        watcher = Watcher([(src_dir, out_dir)], events=events)
+        watcher.poll()
+        self.assertEqual(events.getvalue(), '')
+        with open(src_file, 'w') as f:
+            f.write('x = 2')
+        os.utime(src_file, ns=(0, 0))
+        watcher.poll()
+        event = json.loads(events.getvalue())
+        self.assertTrue(event['ok'])
+        self.assertEqual(event['out_file'], os.path.join(out_dir, 'a.lua'))
+        with open(event['out_file']) as f:
+            self.assertEqual(f.read(), self.translator.translate('x = 2'))
+
+    def test_watcher_cache(self):
+        src_dir = os.path.join(self.tmp.name, 'src')
+        os.makedirs(src_dir)
+        for name in ('a', 'b'):
+            with open(os.path.join(src_dir, name + '.py'), 'w') as f:
+                f.write(name + ' = 1')
+        watcher = Watcher([(src_dir, os.path.join(self.tmp.name, 'out'))], events=io.StringIO(),
+                          cache_dir=os.path.join(self.tmp.name, 'cache'))
+        watcher._mtimes.clear()
+        # the watcher keeps one cache, which scans its directory on the first store only
+        with mock.patch.object(watcher.cache, 'evict', wraps=watcher.cache.evict) as evict:
+            watcher.poll()
+        self.assertEqual(len(os.listdir(watcher.cache.cache_dir)), 2)
+        self.assertEqual(evict.call_count, 1)
+
+
+suite = unittest.TestLoader().loadTestsFromTestCase(TestServer)
+
+
+if __name__ == '__main__':
+    unittest.TextTestRunner(verbosity=2).run(suite)
@@ -0,0 +1,89 @@
+import ast
+import unittest
+from py3lua.symbols import build_symbols
+
+
+class TestSymbols(unittest.TestCase):
+    def _symbols(self, source):
+        tree = ast.parse(source)
+        return tree, build_symbols(tree)
+
+    def test_module_scope(self):
+        tree, symbols = self._symbols(
+            'import os\ndef f():\n    return y\nx = 1\nif x:\n    z = 2\ny = 3\n@ns("N")\ndef g():\n    pass\n'
+        )
+        table = symbols[tree]
+        self.assertEqual(table.resolve('f'), 'M.f')
+        self.assertEqual(table.resolve('g'), 'N.g')
+        self.assertEqual(table.resolve('print'), 'print')
+        self.assertEqual(table.predeclared, ['y', 'z'])
+        self.assertEqual(table.declared, {tree.body[0].names[0], tree.body[2]})
+        self.assertEqual(table.bound, {'os', 'f', 'g', 'x', 'y', 'z'})
+
+    def test_function_scope(self):
+        tree, symbols = self._symbols(
+            'def f(a):\n'
+            '    b = 1\n'
+            '    for i in a:\n        c = i\n'
+            '    def f():\n        nonlocal b\n        b = 2\n'
+            '    for k, v in a:\n        pass\n'
+            '    return f\n'
+        )
+        outer = tree.body[0]
+        inner = outer.body[2]
+        self.assertEqual(symbols[outer].predeclared, ['c'])
+        self.assertEqual(symbols[outer].declared, {outer.body[0], inner})
+        self.assertEqual(symbols[outer].resolve('f'), 'f')
+        self.assertEqual(symbols[tree].resolve('f'), 'M.f')
+        self.assertEqual(symbols[inner].predeclared, [])
+        self.assertEqual(symbols[inner].declared, set())
+        self.assertIs(symbols[inner].parent, symbols[outer])
+
+    def test_global(self):
+        tree, symbols = self._symbols('def f():\n    global n, h\n    n = 1\n    return h\ndef h():\n    pass\n')
+        func = tree.body[0]
+        self.assertEqual(symbols[tree].predeclared, ['n'])
+        self.assertEqual(symbols[func].predeclared, [])
+        self.assertEqual(symbols[func].resolve('h'), 'M.h')
+
+    def test_nested_function_locals(self):
+        tree, symbols = self._symbols('def f(x):\n    y = x\n    return [z for z in y]\nx = 1\n')
+        self.assertEqual(symbols[tree].predeclared, [])
+        self.assertEqual(symbols[tree].declared, {tree.body[1]})
+        self.assertEqual(symbols[tree.body[0]].declared, {tree.body[0].body[0]})
+
+    def test_generator(self):
+        tree, symbols = self._symbols(
+            'def f():\n    def g():\n        yield 1\n    return g\ndef h(a):\n    x = yield from a\n'
+        )
+        f, h = tree.body
+        self.assertFalse(symbols[f].generator)
+        self.assertTrue(symbols[f.body[0]].generator)
+        self.assertTrue(symbols[h].generator)
+        self.assertFalse(symbols[tree].generator)
+
+    def test_classes(self):
+        tree, symbols = self._symbols(
+            'class A(B):\n    x = y\n    def m(self, a):\n        return a + z\n'
+            'def f():\n    class C:\n        def n(self):\n            return w\n    return C\n'
+            'z = 1\nw = 2\n'
+        )
+        a, f = tree.body[:2]
+        c = f.body[0]
+        table = symbols[tree]
+        self.assertEqual(table.resolve('A'), 'M.A')
+        # methods refer to z and w before their assignments
+        self.assertEqual(table.predeclared, ['z', 'w'])
+        self.assertIs(symbols[a.body[1]].parent, table)
+        self.assertEqual(symbols[a.body[1]].resolve('z'), 'z')
+        self.assertEqual(symbols[f].resolve('C'), 'C')
+        self.assertEqual(symbols[f].declared, {c})
+        self.assertIs(symbols[c.body[0]].parent, symbols[f])
+        self.assertNotIn('m', table.bound)
+
+
+suite = unittest.TestLoader().loadTestsFromTestCase(TestSymbols)
+
+
+if __name__ == '__main__':
+    unittest.TextTestRunner(verbosity=2).run(suite)
@@ -1,6 +1,9 @@
 import ast
+import io
 import unittest
-from py3lua.translator import Translator, STDLIB
+from py3lua.symbols import build_symbols
+from py3lua.translator import Translator, TranslatorException, Context, STDLIB
+from lua_vm import has_lua, run_lua
 
 
 class TestTranslator(unittest.TestCase):
@@ -59,7 +62,7 @@ class TestTranslator(unittest.TestCase):
         res4 = self.translator._translate_BinOp(xor_stmt)
         res5 = self.translator._translate_BinOp(and_stmt)
         self.assertEqual(res1, 'bit.lshift(x,5)')
-        self.assertEqual(res2, 'bit.rshift(x,5)')
+        self.assertEqual(res2, 'bit.arshift(x,5)')
         self.assertEqual(res3, 'bit.bor(x,5)')
         self.assertEqual(res4, 'bit.bxor(x,5)')
         self.assertEqual(res5, 'bit.band(x,5)')
@@ -150,12 +153,12 @@ class TestTranslator(unittest.TestCase):
     def test_translate_List(self):
         ast1 = ast.List(elts=[ast.Num(n=1), ast.Num(n=2)], ctx=ast.Load())
         res1 = self.translator._translate_List(ast1)
-        self.assertEqual(res1, 'list(1,2)')
+        self.assertEqual(res1, '_list_of({[0]=1,2,n=2})')
     
     def test_translate_Dict(self):
         ast1 = ast.Dict(keys=[ast.Str(s='a')], values=[ast.Num(n=1)])
         res1 = self.translator._translate_Dict(ast1)
-        self.assertEqual(res1, '{"a":1}')
+        self.assertEqual(res1, '_dict_of({a=1})')
     
     def test_translate_Subscript(self):
         ast1 = ast.Subscript(
@@ -164,6 +167,300 @@ class TestTranslator(unittest.TestCase):
         res1 = self.translator._translate_Subscript(ast1)
         self.assertEqual(res1, 's[1]')
 
+    def test_translate_to(self):
+        source = 'def f(a):\n    return a\nx = f(1)\n'
+        stream = io.StringIO()
+        self.translator.translate_to(source, stream)
+        self.assertEqual(stream.getvalue(), self.translator.translate(source))
+        self.assertEqual(
+            stream.getvalue(),
+            'local M = {}\n' + STDLIB + 'function M.f(a)\n    return a\nend\n\n\n'
+            'local x=M.f(1)\n\nreturn M\n'
+        )
+
+    def test_context_restored(self):
+        module = ast.parse('def f(a):\n    if a:\n        b = 1\n    return a\n')
+        symbols = build_symbols(module)
+        ctx = Context(scope=symbols[module], symbols=symbols, module_prefix='M')
+        res = self.translator.visit(module.body[0], ctx)
+        self.assertEqual(ctx.indent_level, 0)
+        self.assertIs(ctx.scope, symbols[module])
+        self.assertIs(ctx.symbols, symbols)
+        self.assertTrue(res.startswith('function M.f(a)\n    local b\n'))
+
+    def test_visit_dispatch_cache(self):
+        self.translator.visit(ast.Name(id='x', ctx=ast.Load()))
+        self.assertIn(ast.Name, self.translator._dispatch)
+
+    def _for_header(self, source):
+        return self.translator.translate(source).split('-- generated code\n\n')[1].split('\n')[0]
+
+    def test_translate_For_range(self):
+        self.assertEqual(self._for_header('for i in range(10):\n    f(i)'), 'for i=0,9 do')
+        self.assertEqual(self._for_header('for i in range(a, n):\n    f(i)'), 'for i=a,n-1 do')
+        self.assertEqual(self._for_header('for i in range(10, 0, -2):\n    f(i)'), 'for i=10,1,-2 do')
+        self.assertEqual(self._for_header('for i in range(1, n, 3):\n    f(i)'), 'for i=1,n-1,3 do')
+        self.assertEqual(self._for_header('for i in range(a, b, c):\n    f(i)'), 'for i=a,b-(c>0 and 1 or -1),c do')
+
+    def test_translate_For_range_fallback(self):
+        self.assertEqual(self._for_header('for i in range(a, b, f(c)):\n    f(i)'), 'for i in _iter(range(a,b,f(c))) do')
+        self.assertEqual(self._for_header('for i in lst:\n    f(i)'), 'for i in _iter(lst) do')
+        source = 'def range(n):\n    return n\nfor i in range(3):\n    f(i)\n'
+        self.assertIn('for i in _iter(M.range(3)) do', self.translator.translate(source))
+        source = 'from mod import *\nfor i in range(3):\n    f(i)\n'
+        self.assertIn('for i in _iter(range(3)) do', self.translator.translate(source))
+
+    def test_translate_Subscript_slice(self):
+        ast1 = ast.parse('s[1:]', mode='eval').body
+        ast2 = ast.parse('s[::-1]', mode='eval').body
+        ast3 = ast.parse('s[a:b:2]', mode='eval').body
+        self.assertEqual(self.translator._translate_Subscript(ast1), '_slice(s,1)')
+        self.assertEqual(self.translator._translate_Subscript(ast2), '_slice(s,nil,nil,-1)')
+        self.assertEqual(self.translator._translate_Subscript(ast3), '_slice(s,a,b,2)')
+
+    def test_translate_UnaryOp(self):
+        self.assertEqual(self.translator.visit(ast.parse('-1', mode='eval').body), '-1')
+        self.assertEqual(self.translator.visit(ast.parse('-x', mode='eval').body), '(-x)')
+        self.assertEqual(self.translator.visit(ast.parse('not x', mode='eval').body), '(not x)')
+
+    def test_translate_Call_method(self):
+        source = 'import os\nfrom m import obj\nx.append(1)\nos.path.join(a)\nobj.call(1)\nstring.rep(s, 2)\n"-".join(x)\n'
+        code = self.translator.translate(source).split('-- generated code\n\n')[1]
+        self.assertEqual(
+            code.split('\n')[4:9],
+            ['x:append(1)', 'do local _=((os.path).join)(a) end', 'do local _=(obj.call)(1) end', 'string_rep(s,2)',
+             '_join("-",x)']
+        )
+
+    @unittest.skipUnless(has_lua(), "lupa is not installed")
+    def test_call_statements_execute(self):
+        code = Translator(runtime='used').translate(
+            'from m import obj\nx = obj\nobj.call(1)\ndef f():\n    obj.call(2)\n    return x\n'
+        )
+        preload = 'package.preload.m = function() return {obj={call=function(v) calls = (calls or 0) + v end}} end\n'
+        for target in ('luajit', '5.1', '5.4'):
+            self.assertEqual(run_lua(preload + code, 'M.f() return calls', target), 3)
+
+    def test_translate_BinOp_typed_add(self):
+        source = 'x = 1\ny = x + 2\ns = "a" + "b"\nz = x + w\n'
+        code = self.translator.translate(source).split('-- generated code\n\n')[1]
+        self.assertEqual(code.split('\n')[1:4], ['local y=(x+2)', 'local s=("a".."b")', 'local z=_add_op(x,w)'])
+
+    def test_hoisted_library_functions(self):
+        source = 'def f(x, y):\n    return (x & y) << 2\nz = ~math.floor(1.5)\nw = "ab" * 3\n'
+        code = self.translator.translate(source).split('-- generated code\n\n')[1]
+        self.assertEqual(code.split('\n\n')[0].split('\n'), [
+            'local bit_band = bit.band', 'local bit_bnot = bit.bnot', 'local bit_lshift = bit.lshift',
+            'local math_floor = math.floor', 'local string_rep = string.rep',
+        ])
+        self.assertIn('return bit_lshift(bit_band(x,y),2)', code)
+        self.assertIn('local z=bit_bnot(math_floor(1.5))', code)
+        self.assertIn('local w=string_rep("ab",3)', code)
+
+    def test_hoisted_library_functions_rebound(self):
+        source = 'import bit\nmath_floor = 1\nx = a | b\ny = math.floor(z)\n'
+        code = self.translator.translate(source).split('-- generated code\n\n')[1]
+        self.assertNotIn('local bit_bor', code)
+        self.assertIn('local x=bit.bor(a,b)', code)
+        self.assertIn('local y=(math.floor)(z)', code)
+
+    def test_locals(self):
+        source = (
+            'import os\n'
+            'def f(n):\n    total = 0\n    for i in range(n):\n        if i:\n            last = i\n'
+            '        total = total + last\n    return total\n'
+            'def g():\n    global count\n    count = f\n'
+        )
+        code = self.translator.translate(source).split('-- generated code\n\n')[1]
+        self.assertEqual(code, (
+            'local count\n\n'
+            'local os=require("os")\n'
+            'function M.f(n)\n    local last\n    local total=0\n    for i=0,n-1 do\n'
+            '        if i then\n            last=i\n        end\n        total=(total+last)\n    end\n\n'
+            '    return total\nend\n\n\n'
+            'function M.g()\n    count=M.f\nend\n\n\n\nreturn M\n'
+        ))
+
+    def test_comprehensions(self):
+        source = 'def f(xs):\n    a = [x * 2 for x in xs if x]\n    b = {x: 1 for x in range(3)}\n    g({x for x in xs})\n'
+        code = self.translator.translate(source).split('-- generated code\n\n')[1]
+        self.assertEqual(code.split('\n')[1:30], [
+            '    local a=list()', '    do', '        local _n=0', '        for x in _iter(xs) do',
+            '            if x then', '                rawset(a,_n,(x*2))', '                _n=_n+1', '            end',
+            '        end', '        a.n=_n', '    end',
+            '    local b=_dict_alloc(3)', '    for x=0,2 do', '        b[x]=1', '    end',
+            '    g((function()', '        local _r={}', '        for x in _iter(xs) do', '            _r[x]=true',
+            '        end', '        return _r', '    end)())',
+            'end', '', '', '', 'return M', '',
+        ])
+
+    def test_comprehension_refers_to_target(self):
+        source = 'def f(xs):\n    xs = [x for x in xs]\n'
+        code = self.translator.translate(source)
+        self.assertIn('    xs=(function()\n        local _r=list()\n', code)
+        self.assertIn('        return _r\n    end)()\n', code)
+
+    def test_fused_reductions(self):
+        source = (
+            'def f(xs, n):\n    total = sum(x * x for x in range(n))\n    m = max(x for x in xs)\n'
+            '    s = "-".join(str(x) for x in xs)\n    return any(x for x in xs for y in x)\n'
+        )
+        code = self.translator.translate(source).split('-- generated code\n\n')[1]
+        self.assertNotIn('list()', code)
+        self.assertIn('local table_concat = table.concat', code)
+        self.assertIn('    local total=0\n    for x=0,n-1 do\n        total=total+(x*x)\n    end\n', code)
+        self.assertIn(
+            '    local m\n    for x in _iter(xs) do\n        local _v=x\n        if m==nil or _v>m then\n'
+            '            m=_v\n        end\n    end\n    if m==nil then\n'
+            '        error("max() arg is an empty sequence")\n    end\n', code
+        )
+        self.assertIn('            _parts[_k]=str(x)\n        end\n        s=table_concat(_parts,"-")\n    end\n', code)
+        self.assertIn(
+            '    do\n        local _r=false\n        for x in _iter(xs) do\n            for y in _iter(x) do\n'
+            '                if x then\n                    return true\n', code
+        )
+
+    def test_fused_reductions_rebound(self):
+        source = 'def sum(xs):\n    return 0\nt = sum(x for x in xs)\n'
+        code = self.translator.translate(source)
+        self.assertIn('local t=M.sum((function()\n', code)
+
+    def test_generator_function(self):
+        source = (
+            'def gen(xs):\n    for x in xs:\n        if x:\n            y = x\n        yield y\n'
+            '    total = yield from sub()\n    yield\n'
+        )
+        code = self.translator.translate(source).split('-- generated code\n\n')[1]
+        self.assertEqual(code, (
+            'local coroutine_yield = coroutine.yield\n\n'
+            'function M.gen(xs)\n    return generator(function()\n        local y\n'
+            '        for x in _iter(xs) do\n            if x then\n                y=x\n            end\n'
+            '            coroutine_yield(y)\n        end\n\n        local total=_yield_from(sub())\n'
+            '        coroutine_yield()\n    end)\nend\n\n\n\nreturn M\n'
+        ))
+
+    def test_memoized_functions(self):
+        source = (
+            'from functools import lru_cache, cache as memo, reduce\nimport functools as ft\n'
+            '@lru_cache(maxsize=64)\ndef fib(n):\n    return fib(n - 1)\n'
+            '@memo\ndef f(a, b):\n    return a\n'
+            '@ft.lru_cache\ndef g(x):\n    return x\n'
+            '@lru_cache(None)\ndef h(x):\n    return x\n'
+            '@other\ndef k(x):\n    return x\n'
+            'info = fib.cache_info()\n'
+        )
+        code = self.translator.translate(source).split('-- generated code\n\n')[1]
+        lines = code.split('\n')
+        self.assertEqual(lines[0], 'local reduce=require("functools").reduce')
+        # ft is only used for its memoizers
+        self.assertNotIn('ft=', code)
+        used = self.translator.translate('import functools\n@functools.cache\ndef f(x):\n    return functools.reduce(x)\n')
+        self.assertIn('local functools=require("functools")\n', used)
+        self.assertIn('end\nM.fib=lru_cache(M.fib,64)\n', code)
+        self.assertIn('end\nM.f=lru_cache(M.f)\n', code)
+        self.assertIn('end\nM.g=lru_cache(M.g,128)\n', code)
+        self.assertIn('end\nM.h=lru_cache(M.h)\n', code)
+        self.assertNotIn('M.k=', code)
+        self.assertIn('local info=M.fib:cache_info()', code)
+
+    def test_string_builder(self):
+        source = (
+            'def f(rows):\n    s = ""\n    for row in rows:\n        if row:\n            s = s + str(row) + ","\n'
+            '    return s\n'
+        )
+        code = self.translator.translate(source).split('-- generated code\n\n')[1]
+        self.assertEqual(code.split('\n')[:15], [
+            'local table_concat = table.concat', '',
+            'function M.f(rows)', '    local s=""', '    do', '        local _buf,_nb={s},1',
+            '        for row in _iter(rows) do', '            if row then', '                _buf[_nb+1]=str(row)',
+            '                _buf[_nb+2]=","', '                _nb=_nb+2', '            end', '        end',
+            '        s=table_concat(_buf,"",1,_nb)', '    end',
+        ])
+
+    def test_string_builder_skipped(self):
+        sources = [
+            # the string is read in the loop
+            'def f(rows):\n    s = ""\n    for row in rows:\n        s = s + "a"\n        print(s)\n',
+            # a nested function shares the string
+            'def f(rows):\n    s = ""\n    def g():\n        return s\n    for row in rows:\n        s = s + "a"\n',
+            # the addition is not known to be a string concatenation
+            'def f(rows):\n    s = ""\n    for row in rows:\n        s = s + row\n',
+        ]
+        for source in sources:
+            code = self.translator.translate(source)
+            self.assertNotIn('_buf', code)
+
+    def test_targets(self):
+        source = 'a = x << 2\nb = x >> 3\nc = x >> n\nd = ~(x | y) ^ z\ne = x // y\n'
+        code = Translator(target='5.4').translate(source).split('-- generated code\n\n')[1]
+        self.assertEqual(code.split('\n')[:5], [
+            'local a=(x<<2)', 'local b=(x//8)', 'local c=(x//(1<<n))', 'local d=((~(x|y))~z)', 'local e=(x//y)',
+        ])
+        code = Translator(target='5.1').translate(source).split('-- generated code\n\n')[1]
+        self.assertIn('local c=bit_arshift(x,n)', code)
+        self.assertIn('local e=math_floor(x/y)', code)
+        self.assertRaises(ValueError, Translator, target='5.0')
+
+    def test_preallocated_list(self):
+        source = 'def f(n, a):\n    p = [i for i in range(n)]\n    q = [i for i in range(a, n)]\n' \
+                 '    r = [i for i in range(-2, 5)]\n    s = [i for i in range(n) if i]\n'
+        code = self.translator.translate(source)
+        self.assertIn('local p=_list_alloc(n)', code)
+        self.assertIn('local q=_list_alloc(n-a)', code)
+        self.assertIn('local r=_list_alloc(7)', code)
+        self.assertIn('local s=list()', code)
+        code = Translator(target='5.3').translate(source)
+        self.assertNotIn('_list_alloc(', code.split('-- generated code')[1])
+
+    def test_containers(self):
+        source = (
+            'd = {"a": 1, "end": 2, 3: f(x)}\nxs = [1, f(x)]\ne = []\n'
+            'def g(d, k):\n    if k in d and k not in xs:\n        return d.get(k)\n'
+            '    for key, value in d.items():\n        h(key, value)\n'
+        )
+        code = self.translator.translate(source).split('-- generated code\n\n')[1]
+        self.assertEqual(code.split('\n')[:10], [
+            'local d=_dict_of({a=1,["end"]=2,[3]=f(x)})', 'local xs=_list_of({[0]=1,(f(x)),n=2})',
+            'local e=_list_of({n=0})', 'function M.g(d, k)',
+            '    if ((_contains(d,k)) and ((not _contains(xs,k)))) then', '        return _call(d,"get",k)', '    end',
+            '    for key,value in _iter(_call(d,"items")) do', '        h(key,value)', '    end',
+        ])
+        code = Translator(target='5.4').translate('def f(n):\n    return {i: 0 for i in range(n)}\n')
+        self.assertIn('local _r=dict()', code)
+        self.assertRaises(TranslatorException, self.translator.translate, 'd = {**a}\n')
+
+    def test_classes(self):
+        source = (
+            'class P:\n    """point"""\n    __slots__ = ("x", "y")\n    dims = 2\n'
+            '    def __init__(self, x, y):\n        self.x = x\n        self.y = y\n'
+            '    def __str__(self):\n        return self.x\n'
+            '    @classmethod\n    def origin(cls):\n        return cls(0, 0)\n'
+            'class Q(P):\n    __slots__ = ("z",)\n'
+            '    def __init__(self, x, y, z):\n        super().__init__(x, y)\n        self.z = z\n'
+            '    def norm(self, other):\n        return P.__str__(self) + other.z\n'
+            'def f():\n    q = Q(1, 2, 3)\n    o = P.origin()\n    return q.z\n'
+        )
+        code = self.translator.translate(source).split('-- generated code\n\n')[1]
+        self.assertEqual(code.split('\n\n')[:5], [
+            'M.P=class("P",nil,{"x","y"})\nM.P.dims=2\n'
+            'function M.P.__init__(self, x, y)\n    self[1]=x\n    self[2]=y\nend',
+            'function M.P.__str__(self)\n    return self[1]\nend\nM.P.__tostring=M.P.__str__',
+            'function M.P.origin(cls)\n    return cls(0,0)\nend',
+            '\nM.Q=class("Q",M.P,{"z"})\nfunction M.Q.__init__(self, x, y, z)\n    M.P.__init__(self,x,y)\n'
+            '    self[3]=z\nend',
+            'function M.Q.norm(self, other)\n    return _add_op(M.P.__str__(self),(other.z))\nend',
+        ])
+        self.assertIn('    local q=M.Q(1,2,3)\n    local o=M.P:origin()\n    return q[3]\n', code)
+
+    def test_unsupported_classes(self):
+        sources = [
+            '@dataclass\nclass A:\n    pass\n',
+            'class A(B, C):\n    pass\n',
+            'class A:\n    if x:\n        y = 1\n',
+        ]
+        for source in sources:
+            self.assertRaises(TranslatorException, self.translator.translate, source)
+
 
 suite = unittest.TestLoader().loadTestsFromTestCase(TestTranslator)
 